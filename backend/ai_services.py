@@ -1,12 +1,35 @@
-import base64
-from openai import OpenAI
+import asyncio
+import logging
+import os
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from llm_client import achat_completion, chat_completion, chat_completion_stream
+from json_stream import JSONArrayStream
+from fuzzy import dedupe_books
 from pydantic import BaseModel
 import pandas as pd
 import json
+from cache import TTLCache
+from metrics import instrument_module
+from normalize import normalize_title
+from resilience import UpstreamUnavailable, submit
+
+logger = logging.getLogger(__name__)
+
+# Goodreads inferences memoized on the normalized set of titles, so re-imports cost no model calls
+_inference_cache = TTLCache(
+    max_size=int(os.getenv('GOODREADS_INFERENCE_CACHE_SIZE', 512)),
+    ttl_seconds=int(os.getenv('GOODREADS_INFERENCE_CACHE_TTL_SECONDS', 24 * 60 * 60))
+)
+_inference_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix='goodreads-inference')
+
+GENRES = ["Fantasy", "Sci-Fi", "Mystery", "Romance", "Thriller", "Historical", "Biography", "Self-Help", "Horror",
+          "Literary Fiction", "Young Adult", "Non-Fiction"]
 
 class Book(BaseModel):
     title: str
     author: str
+    genre: str = ""  # best-guess primary genre, cached per book in book_cache
 
 class BookList(BaseModel):
     books: list[Book]
@@ -27,41 +50,69 @@ class AvoidElements(BaseModel):
     elements: str
 
 #look at bookshelf image and extract all titles from the spines of books
-def analyze_bookshelf(image_base64):
-    client = OpenAI()
-     
-    response = client.chat.completions.create(
+def _bookshelf_request(image):
+    image_base64 = image if isinstance(image, str) else image.to_base64()
+    return dict(
         model="gpt-4.1",
         response_format={"type": "json_schema", "json_schema": {"name": "BookList", "schema": BookList.model_json_schema()}},
         messages=[
             {
                 "role": "user",
                 "content": [
-                    {"type": "text", "text": "Please list all the titles and authors of the books you see on this bookshelf."},
+                    {"type": "text", "text": f"Please list all the titles and authors of the books you see on this bookshelf. For each book also give its most likely primary genre from this list: {', '.join(GENRES)}."},
                     {"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{image_base64}"}},
                 ],
             }
         ],
     )
-    #print(response)
+
+def _parse_books(response):
     books_data = json.loads(response.choices[0].message.content)
     books = books_data["books"]
     return books
 
+def analyze_bookshelf(image):
+    '''image: base64 string or uploads.ShelfImage (encoded lazily, only here)'''
+    return _parse_books(chat_completion(**_bookshelf_request(image)))
 
+#same call on the async client, for the ASGI app
+async def aanalyze_bookshelf(image):
+    return _parse_books(await achat_completion(**_bookshelf_request(image)))
 
-#generate recommendations using personal preferences/goodreads data from the list of books extracted
-def generate_recommendations(personal_preferences, list_of_books):
-    '''personal_preferences: json?'''
-    client = OpenAI()
 
-    response = client.chat.completions.create(
-        model="gpt-4.1",
-        response_format={"type": "json_schema", "json_schema": {"name": "RecommendationList", "schema": RecommendationList.model_json_schema()}},
-        messages=[
-            {
-                "role": "system",
-                "content": """You are a literary recommendation expert. Your task is to select books from a provided list that best match the user's specific reading preferences, and provide a brief explanation for each match.
+
+#analyze each tile of a wide shelf concurrently, then merge books seen in overlapping tiles
+#and OCR variants of the same spine
+def analyze_bookshelf_tiles(tiles):
+    if len(tiles) == 1:
+        return dedupe_books(analyze_bookshelf(tiles[0]))
+
+    #tile threads run under the request's context, so its time budget (and request id) applies to them too
+    with ThreadPoolExecutor(max_workers=len(tiles)) as executor:
+        per_tile_books = [future.result() for future in [submit(executor, analyze_bookshelf, tile) for tile in tiles]]
+    return dedupe_books([book for books in per_tile_books for book in books])
+
+async def aanalyze_bookshelf_tiles(tiles):
+    per_tile_books = await asyncio.gather(*(aanalyze_bookshelf(tile) for tile in tiles))
+    return dedupe_books([book for books in per_tile_books for book in books])
+
+
+
+#compact JSON for the recommendation prompt: only the fields the model uses, no whitespace
+def prompt_books(list_of_books):
+    return json.dumps([{k: book[k] for k in ('title', 'author', 'genre') if book.get(k)} for book in list_of_books],
+                      separators=(',', ':'), ensure_ascii=False)
+
+def prompt_preferences(personal_preferences):
+    preferences = {k: personal_preferences.get(k) for k in ('authors', 'genres', 'avoid') if personal_preferences.get(k)}
+    return json.dumps(preferences, separators=(',', ':'), ensure_ascii=False)
+
+#chat messages for the recommendation call, shared by the blocking and streaming variants
+def _recommendation_messages(personal_preferences, list_of_books):
+    return [
+        {
+            "role": "system",
+            "content": """You are a literary recommendation expert. Your task is to select books from a provided list that best match the user's specific reading preferences, and provide a brief explanation for each match.
 
 CRITICAL INSTRUCTIONS:
 1. You MUST ONLY select books from the exact list provided to you
@@ -75,12 +126,12 @@ CRITICAL INSTRUCTIONS:
 9. When a book is similar to something on their "Want to Read" list, mention this specific connection in the match reason
 10. Match reasons should ONLY reference preferences the user explicitly mentioned - no assumptions
 11. Higher scoring books should have more specific, compelling match reasons"""
-            },
-            {
-                "role": "user",
-                "content": f"""Here is my list of books: {list_of_books}
+        },
+        {
+            "role": "user",
+            "content": f"""Here is my list of books: {prompt_books(list_of_books)}
 
-My reading preferences: {personal_preferences}
+My reading preferences: {prompt_preferences(personal_preferences or {})}
 
 From ONLY this list above, recommend the 5 books that would best match my reading preferences while avoiding the elements I specified.
 
@@ -92,51 +143,173 @@ Each recommendation should include:
 - matchReason: A SPECIFIC, CONCISE reason (1-2 sentences) why this book matches my preferences.
 
 Only return the JSON object with no additional text."""
-            }
-        ],
+        }
+    ]
+
+_RECOMMENDATION_FORMAT = {"type": "json_schema", "json_schema": {"name": "RecommendationList", "schema": RecommendationList.model_json_schema()}}
+
+#generate recommendations using personal preferences/goodreads data from the list of books extracted
+def generate_recommendations(personal_preferences, list_of_books):
+    '''personal_preferences: dict with authors/genres/avoid; list_of_books: ranked candidates (see ranking.py)'''
+    response = chat_completion(
+        model="gpt-4.1",
+        response_format=_RECOMMENDATION_FORMAT,
+        messages=_recommendation_messages(personal_preferences, list_of_books),
+    )
+    return _parse_recommendations(response, list_of_books)
+
+async def agenerate_recommendations(personal_preferences, list_of_books):
+    response = await achat_completion(
+        model="gpt-4.1",
+        response_format=_RECOMMENDATION_FORMAT,
+        messages=_recommendation_messages(personal_preferences, list_of_books),
     )
+    return _parse_recommendations(response, list_of_books)
+
+def _parse_recommendations(response, list_of_books):
+    if response.usage:
+        logger.info("🧮 Recommendation prompt: %s tokens for %s books", response.usage.prompt_tokens, len(list_of_books))
     recommendation_data = json.loads(response.choices[0].message.content)
     books = recommendation_data["recommendations"]
     return books
-    
+
+#same call, streamed: yields each recommendation as soon as its JSON object is complete
+def stream_recommendations(personal_preferences, list_of_books):
+    parser = JSONArrayStream("recommendations")
+    for delta in chat_completion_stream(
+        model="gpt-4.1",
+        response_format=_RECOMMENDATION_FORMAT,
+        messages=_recommendation_messages(personal_preferences, list_of_books),
+    ):
+        yield from parser.feed(delta)
+
 def load_goodreads_preferences(csv_path):
       df = pd.read_csv(csv_path)
       return df[['Title', 'Author', 'My Rating', 'Exclusive Shelf', 'Date Read']].to_dict('records')
 
-def extract_goodreads_preferences(csv_file):
-    import io
-
-    # Read CSV from uploaded file
-    csv_content = csv_file.read().decode('utf-8')
-    df = pd.read_csv(io.StringIO(csv_content))
-
-    # Extract favorite authors (from 4-5 star books)
-    high_rated = df[(df['My Rating'] >= 4) & (df['My Rating'] <= 5)]
-    favorite_authors = high_rated['Author'].value_counts().head(10).index.tolist()
-
-    # Extract books to avoid (from 1-2 star books)
-    low_rated = df[(df['My Rating'] >= 1) & (df['My Rating'] <= 2)]
-    avoid_titles = low_rated['Title'].tolist()[:5]  # Get a few examples
+GOODREADS_COLUMNS = ['Title', 'Author', 'My Rating', 'Exclusive Shelf', 'Date Read']
+GOODREADS_DTYPES = {'Title': 'string', 'Author': 'string', 'My Rating': 'Int8', 'Exclusive Shelf': 'string', 'Date Read': 'string'}
+GOODREADS_CSV_CHUNK_ROWS = int(os.getenv('GOODREADS_CSV_CHUNK_ROWS', 5000))
+
+def iter_goodreads_chunks(csv_file, chunk_rows=GOODREADS_CSV_CHUNK_ROWS):
+    '''Stream an export as DataFrame chunks holding only the columns we use (reviews etc. are never materialized)'''
+    stream = getattr(csv_file, 'stream', csv_file)
+    for chunk in pd.read_csv(stream, usecols=GOODREADS_COLUMNS, dtype=GOODREADS_DTYPES, encoding='utf-8', chunksize=chunk_rows):
+        chunk['My Rating'] = chunk['My Rating'].fillna(0)
+        yield chunk
+
+def summarize_goodreads_export(csv_file, on_chunk=None):
+    '''One pass over the export collecting everything the preferences need except the model inferences.
+    on_chunk: optional callback receiving each parsed chunk (e.g. to persist rows)'''
+    author_counts = Counter()
+    rating_counts = Counter()
+    liked_titles = []   # first 20 4-5 star titles
+    avoid_titles = []   # first 5 1-2 star titles, a few examples
+    total_books = 0
+
+    # Peak memory is one chunk, however large the export
+    for chunk in iter_goodreads_chunks(csv_file):
+        total_books += len(chunk)
+        rating_counts.update(chunk['My Rating'].value_counts().to_dict())
+
+        # Favorite authors (from 4-5 star books)
+        high_rated = chunk[(chunk['My Rating'] >= 4) & (chunk['My Rating'] <= 5)]
+        author_counts.update(high_rated['Author'].dropna().tolist())
+        if len(liked_titles) < 20:
+            liked_titles.extend(high_rated['Title'].dropna().tolist()[:20 - len(liked_titles)])
+
+        # Books to avoid (from 1-2 star books)
+        if len(avoid_titles) < 5:
+            low_rated = chunk[(chunk['My Rating'] >= 1) & (chunk['My Rating'] <= 2)]
+            avoid_titles.extend(low_rated['Title'].dropna().tolist()[:5 - len(avoid_titles)])
+
+        if on_chunk:
+            on_chunk(chunk)
 
-    # Use AI to infer genres from highly-rated books
-    genres = infer_genres_from_books(high_rated['Title'].tolist()[:20])
-
-    # Create avoid string from low-rated book analysis
-    avoid_elements = infer_avoid_elements(avoid_titles) if avoid_titles else ""
+    return {
+        'authors': [author for author, _ in author_counts.most_common(10)],
+        'liked_titles': liked_titles,
+        'avoid_titles': avoid_titles,
+        'total_books': total_books,
+        'rating_counts': rating_counts,
+    }
 
+def goodreads_preferences(summary, genres, avoid_elements):
     return {
-        'authors': favorite_authors,
+        'authors': summary['authors'],
         'genres': genres,
-        'avoid': avoid_elements
+        'avoid': avoid_elements,
+        'library_stats': {
+            'books': summary['total_books'],
+            'ratings': {str(int(rating)): count for rating, count in sorted(summary['rating_counts'].items())}
+        }
     }
 
-def infer_genres_from_books(book_titles):
-    if not book_titles:
-        return []
-
-    client = OpenAI()
-
-    response = client.chat.completions.create(
+def extract_goodreads_preferences(csv_file, on_chunk=None):
+    '''on_chunk: optional callback receiving each parsed chunk (e.g. to persist rows)'''
+    summary = summarize_goodreads_export(csv_file, on_chunk)
+
+    # Use AI to infer genres from highly-rated books and elements to avoid from low-rated ones
+    genres, avoid_elements = infer_goodreads_preferences(summary['liked_titles'], summary['avoid_titles'])
+
+    return goodreads_preferences(summary, genres, avoid_elements)
+
+def _inference_key(kind, titles):
+    return kind, frozenset(normalize_title(title) for title in titles)
+
+def infer_goodreads_preferences(genre_titles, avoid_titles):
+    '''Run the (independent) genre and avoid-element inferences in parallel, skipping memoized ones'''
+    inferences = [('genres', genre_titles, infer_genres_from_books), ('avoid', avoid_titles, infer_avoid_elements)]
+    results, pending = {}, {}
+    for kind, titles, infer in inferences:
+        key = _inference_key(kind, titles)
+        cached = _inference_cache.get(key)
+        if cached is not None:
+            results[kind] = cached
+        else:
+            pending[kind] = (key, submit(_inference_executor, infer, titles))
+
+    for kind, (key, future) in pending.items():
+        try:
+            results[kind] = future.result()
+        except UpstreamUnavailable as e:
+            results[kind] = _inference_fallback(kind, e)
+            continue
+        _inference_cache.set(key, results[kind])
+
+    return results['genres'], results['avoid']
+
+#the inferences only refine an import: without the model it still succeeds (authors, stats, library), just uncached
+def _inference_fallback(kind, error):
+    logger.warning("⚠️  Goodreads %s inference skipped: %s", kind, error)
+    return [] if kind == 'genres' else ""
+
+async def ainfer_goodreads_preferences(genre_titles, avoid_titles):
+    '''infer_goodreads_preferences on the async client: both inferences awaited together'''
+    inferences = [('genres', genre_titles, ainfer_genres_from_books), ('avoid', avoid_titles, ainfer_avoid_elements)]
+    results, pending = {}, {}
+    for kind, titles, infer in inferences:
+        key = _inference_key(kind, titles)
+        cached = _inference_cache.get(key)
+        if cached is not None:
+            results[kind] = cached
+        else:
+            pending[kind] = (key, infer(titles))
+
+    values = await asyncio.gather(*(coroutine for _, coroutine in pending.values()), return_exceptions=True)
+    for (kind, (key, _)), value in zip(pending.items(), values):
+        if isinstance(value, UpstreamUnavailable):
+            results[kind] = _inference_fallback(kind, value)
+            continue
+        if isinstance(value, BaseException):
+            raise value
+        results[kind] = value
+        _inference_cache.set(key, value)
+
+    return results['genres'], results['avoid']
+
+def _genres_request(book_titles):
+    return dict(
         model="gpt-4.1",
         response_format={"type": "json_schema", "json_schema": {"name": "GenreList", "schema": GenreList.model_json_schema()}},
         messages=[
@@ -146,24 +319,15 @@ def infer_genres_from_books(book_titles):
 
 Books: {', '.join(book_titles[:15])}
 
-Select only from this list: Fantasy, Sci-Fi, Mystery, Romance, Thriller, Historical, Biography, Self-Help, Horror, Literary Fiction,
-Young Adult, Non-Fiction
+Select only from this list: {', '.join(GENRES)}
 
 Return the top 5 genres as a JSON object with a "genres" array."""
             }
         ],
     )
 
-    genres_data = json.loads(response.choices[0].message.content)
-    return genres_data["genres"][:5]  # Limit to 5 genres
-
-def infer_avoid_elements(avoid_titles):
-    if not avoid_titles:
-        return ""
-
-    client = OpenAI()
-
-    response = client.chat.completions.create(
+def _avoid_request(avoid_titles):
+    return dict(
         model="gpt-4.1",
         response_format={"type": "json_schema", "json_schema": {"name": "AvoidElements", "schema":
     AvoidElements.model_json_schema()}},
@@ -182,9 +346,39 @@ def infer_avoid_elements(avoid_titles):
         ],
     )
 
+def infer_genres_from_books(book_titles):
+    if not book_titles:
+        return []
+
+    response = chat_completion(**_genres_request(book_titles))
+
+    genres_data = json.loads(response.choices[0].message.content)
+    return genres_data["genres"][:5]  # Limit to 5 genres
+
+def infer_avoid_elements(avoid_titles):
+    if not avoid_titles:
+        return ""
+
+    response = chat_completion(**_avoid_request(avoid_titles))
+
     avoid_data = json.loads(response.choices[0].message.content)
     return avoid_data["elements"]
 
+async def ainfer_genres_from_books(book_titles):
+    if not book_titles:
+        return []
+    response = await achat_completion(**_genres_request(book_titles))
+    return json.loads(response.choices[0].message.content)["genres"][:5]
+
+async def ainfer_avoid_elements(avoid_titles):
+    if not avoid_titles:
+        return ""
+    response = await achat_completion(**_avoid_request(avoid_titles))
+    return json.loads(response.choices[0].message.content)["elements"]
+
+#every public function above records its duration in /metrics (call_seconds{function="ai_services.*"})
+instrument_module(globals())
+
 # list_of_books = analyze_bookshelf("C:\\Users\\jonat\\Desktop\\BookScanner\\test.JPG")
 # personal_preferences = load_goodreads_preferences("C:\\Users\\jonat\\Desktop\\BookScanner\\goodreads_library_export.csv")
 # recommendations = generate_recommendations(personal_preferences, list_of_books)
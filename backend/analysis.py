@@ -0,0 +1,195 @@
+import asyncio
+import logging
+
+from ai_services import aanalyze_bookshelf_tiles, agenerate_recommendations, analyze_bookshelf_tiles, generate_recommendations, stream_recommendations, prompt_books, prompt_preferences
+from book_cache import remember_detected_books, enrich_with_metadata
+from database import get_reading_status
+from fuzzy import Reconciler, reconcile
+from image_processing import preprocess_image
+from normalize import book_key
+from ranking import estimate_tokens, rank_books
+from recommendation_cache import get_cached_recommendations, recommendation_key, store_recommendations
+from shelf_cache import fingerprint_image, get_cached_books, store_books
+from singleflight import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+# The /analyze pipeline, shared by the synchronous route and background jobs
+
+# A duplicate of work already in flight (double-tapped Analyze, a client retry) waits for it
+# and shares the result instead of paying for the same model calls twice
+_shelf_flights = SingleFlight('shelf_analysis')             # keyed on the photo's sha256
+_recommendation_flights = SingleFlight('recommendations')   # keyed on the recommendation cache key
+
+
+def detect_books(image, user_id=None):
+    """Books on the shelf in a ShelfImage, plus preprocessing stats (None on a cache hit)"""
+    # Skip the model entirely if this exact photo (or a near-identical one from the same user) was analyzed before
+    fingerprint = fingerprint_image(image)
+    detected_books = get_cached_books(fingerprint, user_id)
+    if detected_books is not None:
+        logger.info("⚡ Shelf cache hit: %s", fingerprint.content_hash[:12])
+        return detected_books, None
+
+    with _shelf_flights.lead(fingerprint.content_hash) as flight:
+        if not flight.leader:
+            logger.info("🤝 Joined in-flight shelf analysis: %s", fingerprint.content_hash[:12])
+            return flight.value, None
+        # Downscale/tile for the model, then analyze the tiles concurrently
+        prepared = preprocess_image(image)
+        logger.info("🖼️ Preprocessed image: %s tile(s), saved %s bytes", prepared.stats['tiles'], prepared.stats['bytes_saved'])
+        detected_books = analyze_bookshelf_tiles(prepared.tiles)
+        store_books(fingerprint, detected_books, user_id)
+        remember_detected_books(detected_books)
+        flight.publish(detected_books)
+    return detected_books, prepared.stats
+
+
+async def adetect_books(image, user_id=None):
+    """detect_books for the ASGI app: hashing/resizing in a thread, cache I/O on the async engine, tiles awaited together"""
+    from database_async import call  # only the ASGI app needs the async drivers
+    fingerprint = await asyncio.to_thread(fingerprint_image, image)
+    detected_books = await call(get_cached_books, fingerprint, user_id)
+    if detected_books is not None:
+        logger.info("⚡ Shelf cache hit: %s", fingerprint.content_hash[:12])
+        return detected_books, None
+
+    async with _shelf_flights.alead(fingerprint.content_hash) as flight:
+        if not flight.leader:
+            logger.info("🤝 Joined in-flight shelf analysis: %s", fingerprint.content_hash[:12])
+            return flight.value, None
+        prepared = await asyncio.to_thread(preprocess_image, image)
+        logger.info("🖼️ Preprocessed image: %s tile(s), saved %s bytes", prepared.stats['tiles'], prepared.stats['bytes_saved'])
+        detected_books = await aanalyze_bookshelf_tiles(prepared.tiles)
+        await call(store_books, fingerprint, detected_books, user_id)
+        await call(remember_detected_books, detected_books)
+        flight.publish(detected_books)
+    return detected_books, prepared.stats
+
+
+def _candidates(preferences, detected_books, user_id):
+    # Per-book metadata comes from the book cache, not the model
+    books = enrich_with_metadata(detected_books)
+    # Only the locally best-ranked, not-yet-read candidates go into the prompt
+    candidates, stats = rank_books(preferences, books, user_id)
+    # The saving against the old repr() payload is measured by benchmarks/bench_ranking.py, not per request
+    payload_tokens = estimate_tokens(prompt_books(candidates) + prompt_preferences(preferences or {}))
+    logger.info("🎯 Ranked %s books: %s candidates, dropped %s read and %s avoided; prompt payload ~%s tokens",
+                stats['detected'], stats['candidates'], stats['dropped_read'], stats['dropped_avoid'], payload_tokens)
+    return candidates
+
+
+def _log_reconciliation(stats):
+    if stats['snapped'] or stats['dropped']:
+        logger.info("🧩 Reconciled recommendations: %s re-spelled, %s not on the shelf or repeated", stats['snapped'], stats['dropped'])
+
+
+def _cached(preferences, candidates):
+    """(cache key, cached recommendations snapped onto this shelf's spelling or None)"""
+    key = recommendation_key(preferences, candidates)
+    cached = get_cached_recommendations(key)
+    if cached is None:
+        return key, None
+    logger.info("⚡ Recommendation cache hit: %s", key[:12])
+    recommendations, _ = reconcile(cached, candidates)
+    return key, recommendations
+
+
+def _joined(key, flight, preferences, candidates):
+    """A finished flight's recommendations, through the cache the leader filled when it can"""
+    logger.info("🤝 Joined in-flight recommendations: %s", key[:12])
+    _, recommendations = _cached(preferences, candidates)
+    if recommendations is None:
+        recommendations, _ = reconcile(flight.value, candidates)
+    return recommendations
+
+
+def recommend_books(preferences, detected_books, user_id=None):
+    candidates = _candidates(preferences, detected_books, user_id)
+    if not candidates:
+        return []
+    key, recommendations = _cached(preferences, candidates)
+    if recommendations is not None:
+        return recommendations
+    with _recommendation_flights.lead(key) as flight:
+        if not flight.leader:
+            return _joined(key, flight, preferences, candidates)
+        # The model only sees `candidates`; anything it returns that isn't one of them is dropped
+        recommendations, stats = reconcile(generate_recommendations(preferences, candidates), candidates)
+        _log_reconciliation(stats)
+        store_recommendations(key, recommendations)
+        flight.publish(recommendations)
+    return recommendations
+
+
+async def arecommend_books(preferences, detected_books, user_id=None):
+    """recommend_books for the ASGI app"""
+    from database_async import call
+    candidates = await call(_candidates, preferences, detected_books, user_id)
+    if not candidates:
+        return []
+    key, recommendations = await call(_cached, preferences, candidates)
+    if recommendations is not None:
+        return recommendations
+    async with _recommendation_flights.alead(key) as flight:
+        if not flight.leader:
+            return await call(_joined, key, flight, preferences, candidates)
+        recommendations, stats = reconcile(await agenerate_recommendations(preferences, candidates), candidates)
+        _log_reconciliation(stats)
+        await call(store_recommendations, key, recommendations)
+        flight.publish(recommendations)
+    return recommendations
+
+
+def stream_recommend_books(preferences, detected_books, user_id=None):
+    """recommend_books, yielding each recommendation as soon as the model finishes it"""
+    candidates = _candidates(preferences, detected_books, user_id)
+    if not candidates:
+        return
+    key, recommendations = _cached(preferences, candidates)
+    if recommendations is not None:
+        yield from recommendations
+        return
+    with _recommendation_flights.lead(key) as flight:
+        if not flight.leader:
+            yield from _joined(key, flight, preferences, candidates)
+            return
+        reconciler = Reconciler(candidates)
+        recommendations = []
+        for recommendation in stream_recommendations(preferences, candidates):
+            recommendation = reconciler.snap(recommendation)
+            if recommendation is not None:
+                recommendations.append(recommendation)
+                yield recommendation
+        _log_reconciliation(reconciler.stats)
+        # Only a stream that ran to the end is cached or shared; a disconnect closes the generator
+        # before this and any request waiting on it runs its own
+        store_recommendations(key, recommendations)
+        flight.publish(recommendations)
+
+
+def _book_keys(books):
+    return [book_key(book.get('title', ''), book.get('author', '')) for book in books]
+
+
+def _status_by_key(user_id, keys):
+    status = get_reading_status(user_id, keys)
+    unseen = {'is_saved': False, 'is_read': False}
+    return {key: status.get(key, unseen) for key in keys}
+
+
+def reading_status(user_id, books) -> dict:
+    """is_saved/is_read for every book in `books`, by book_key, in one query. Fetched for the detected
+    shelf before streaming, it covers every recommendation drawn from that shelf"""
+    return _status_by_key(user_id, _book_keys(books))
+
+
+def with_reading_status(user_id, recommendations, status=None):
+    """Copies of the recommendations flagged is_saved/is_read for this user; one query for whatever
+    a reading_status() `status` doesn't already cover"""
+    keys = _book_keys(recommendations)
+    status = status or {}
+    missing = [key for key in keys if key not in status]
+    if missing:
+        status = {**status, **_status_by_key(user_id, missing)}
+    return [{**rec, **status[key]} for rec, key in zip(recommendations, keys)]
@@ -1,29 +1,59 @@
-from flask import Flask, request, jsonify, make_response
+from flask import Flask, Response, request, jsonify, make_response, stream_with_context
 from flask_cors import CORS
+import logging
 import base64
-import tempfile
 import os
+import re
+import time
 import uuid
+from datetime import datetime
 from dotenv import load_dotenv
 
 # Load environment variables
 load_dotenv()
-from ai_services import analyze_bookshelf, generate_recommendations, load_goodreads_preferences, extract_goodreads_preferences
+from logging_setup import UNSAMPLED, configure_logging, set_request_id
+from metrics import expose as expose_metrics, http_request_seconds, stage_seconds, timed
+from resilience import UpstreamUnavailable, start_budget
+
+configure_logging()
+from ai_services import goodreads_preferences, infer_goodreads_preferences, summarize_goodreads_export
+from analysis import detect_books, reading_status, recommend_books, stream_recommend_books, with_reading_status
+from book_cache import start_sweeper
+from goodreads_library import GoodreadsLibraryImport
+from identity import get_user, start_last_active_flusher
+from jobs import submit_analysis_job, get_job, job_events, sse_event, JobQueueFull
+from uploads import MAX_REQUEST_BYTES, read_analyze_upload, UploadError
+from shelf_cache import cache_stats
+from recommendation_cache import cache_stats as recommendation_cache_stats
 from database import (
-    get_or_create_user,
     save_user_preferences,
     save_analysis_session,
+    unit_of_work,
     get_user_analysis_history,
+    get_analysis_session,
     create_tables,
     save_book,
     unsave_book,
     get_saved_books,
     check_if_book_saved,
     mark_book_as_read,
-    update_book_notes
+    update_book_notes,
+    check_books_saved,
+    save_books,
+    unsave_books,
+    mark_books_as_read,
+    update_books_notes
 )
 
+logger = logging.getLogger(__name__)
+
+REQUEST_ID_PATTERN = re.compile(r'[A-Za-z0-9._-]{1,64}')
+DEVICE_COOKIE = 'deviceId'
+DEVICE_COOKIE_MAX_AGE = 365*24*60*60  # 1 year in seconds
+
 app = Flask(__name__)
+# Bounds request bodies Flask reads, including chunked uploads that carry no Content-Length
+app.config['MAX_CONTENT_LENGTH'] = MAX_REQUEST_BYTES
 
 # Configure CORS for development and production
 allowed_origins = os.getenv('ALLOWED_ORIGINS', 'http://localhost:3000,http://localhost:5173').split(',')
@@ -31,14 +61,16 @@ CORS(app, supports_credentials=True, origins=allowed_origins)
 
 try:
     create_tables()
-    print("✅ Database tables created successfully")
+    logger.info("✅ Database tables created successfully")
+    start_sweeper()
+    start_last_active_flusher()
 except Exception as e:
-    print(f"❌ Database connection failed: {e}")
+    logger.exception("❌ Database connection failed: %s", e)
 
 def ensure_device_id():
     """Ensure every request has a device ID - ShelfScanner approach"""
     # 1. Check cookie first (primary method)
-    device_id = request.cookies.get('deviceId')
+    device_id = request.cookies.get(DEVICE_COOKIE)
     
     # 2. Fallback to X-Device-ID header
     if not device_id:
@@ -47,89 +79,276 @@ def ensure_device_id():
     # 3. Last resort: generate server-side UUID
     if not device_id:
         device_id = str(uuid.uuid4())
-        print(f"⚠️  Generated server-side device ID: {device_id[:8]}...")
+        logger.info("⚠️  Generated server-side device ID: %s...", device_id[:8])
     else:
-        print(f"🆔 Using device ID: {device_id[:8]}...")
+        logger.debug("🆔 Using device ID: %s...", device_id[:8])
     
     # Store in request object for route access
     request.device_id = device_id
     return device_id
 
+def set_device_cookie(response, device_id: str):
+    """Set/refresh the device ID cookie on a response"""
+    response.set_cookie(
+        DEVICE_COOKIE,
+        device_id,
+        max_age=DEVICE_COOKIE_MAX_AGE,
+        path='/',
+        samesite='Strict',
+        httponly=False,  # Allow JavaScript access
+        secure=False  # Set to True in production with HTTPS
+    )
+    return response
+
+def device_response(response_data, device_id: str, status: int = 200):
+    """JSON response that sets/refreshes the device ID cookie"""
+    return set_device_cookie(make_response(jsonify(response_data), status), device_id)
+
 @app.before_request
 def before_request():
-    """Run before every request to ensure device ID"""
-    # Skip device ID for health check
-    if request.endpoint == 'health_check':
+    """Run before every request to tag its log records and ensure device ID"""
+    request.started_at = time.perf_counter()
+    # Honor a proxy/client supplied correlation id if it looks sane, otherwise mint one
+    incoming = request.headers.get('X-Request-ID', '')
+    request.request_id = set_request_id(incoming if REQUEST_ID_PATTERN.fullmatch(incoming) else None)
+    # Model calls made for this request share one time budget (REQUEST_BUDGET_SECONDS)
+    start_budget()
+
+    # Skip device ID for health check and stats
+    if request.endpoint in ('health_check', 'get_cache_stats', 'get_metrics'):
         return
     
     ensure_device_id()
 
+@app.after_request
+def after_request(response):
+    """Echo the correlation id and log one access line (time to headers for streamed responses)"""
+    response.headers['X-Request-ID'] = request.request_id
+    duration_ms = round((time.perf_counter() - request.started_at) * 1000, 1)
+    logger.info("%s %s %s in %s ms", request.method, request.path, response.status_code, duration_ms,
+                extra={'method': request.method, 'path': request.path, 'status': response.status_code,
+                       'duration_ms': duration_ms, **UNSAMPLED})
+    http_request_seconds.observe(duration_ms / 1000, request.method, request.endpoint or 'unmatched', response.status_code)
+    return response
+
 @app.route('/health', methods=['GET'])
 def health_check():
     return jsonify({'status': 'Server is running!'})
 
+@app.route('/cache-stats', methods=['GET'])
+def get_cache_stats():
+    """Hit/miss counters for the shelf analysis and recommendation caches"""
+    return jsonify({'shelf_analysis': cache_stats(), 'recommendations': recommendation_cache_stats()})
+
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    """Stage/function latency histograms (with p50/p95/p99), token usage and DB pool state for Prometheus"""
+    return Response(expose_metrics(), mimetype='text/plain; version=0.0.4')
+
 @app.route('/analyze', methods=['POST'])
 def analyze_image():
+    image = None
     try:
-        data = request.get_json()
-        image_base64 = data["image"]
-        preferences = data["preferences"]
+        # Multipart/raw binary uploads are streamed to a spooled buffer; JSON base64 still works
+        with timed('read_upload'):
+            image, preferences = read_analyze_upload(request)
 
         # Get device ID from middleware (no generation needed!)
         device_id = request.device_id
         
-        # Get or create user in database
-        user = get_or_create_user(device_id)
-        print(f"🔄 Processing request for user: {user['id']}")
+        # Get or create user (cached - only a miss hits the database)
+        with timed('user_lookup'):
+            user = get_user(device_id)
+        logger.info("🔄 Processing request for user: %s", user['id'])
 
         # Save preferences to database
-        saved_prefs = save_user_preferences(user['id'], preferences)
-        print(f"💾 Saved preferences: {len(saved_prefs['favorite_authors'])} authors, {len(saved_prefs['preferred_genres'])} genres")
-        
-        # Analyze image (unchanged)
-        detected_books = analyze_bookshelf(image_base64)
-        print(f"📚 Detected {len(detected_books)} books")
+        with timed('save_preferences'):
+            saved_prefs = save_user_preferences(user['id'], preferences)
+        logger.info("💾 Saved preferences: %s authors, %s genres", len(saved_prefs['favorite_authors']), len(saved_prefs['preferred_genres']))
+        
+        # Analyze image (cached, downscaled/tiled)
+        with timed('detect_books'):
+            detected_books, image_stats = detect_books(image, user['id'])
+        logger.info("📚 Detected %s books", len(detected_books))
 
-        # Generate recommendations (unchanged)
-        recommendations = generate_recommendations(preferences, detected_books)
-        print(f"⭐ Generated {len(recommendations)} recommendations")
-        
-        # Save analysis session to database
-        analysis = save_analysis_session(user['id'], detected_books, recommendations)
-        print(f"💽 Saved analysis session: {analysis['id']}")
+        # Generate recommendations
+        with timed('recommend_books'):
+            recommendations = recommend_books(preferences, detected_books, user['id'])
+        logger.info("⭐ Generated %s recommendations", len(recommendations))
+        
+        # Save the session and flag the recommendations on one connection, in one transaction
+        with unit_of_work():
+            with timed('save_analysis_session'):
+                analysis = save_analysis_session(user['id'], detected_books, recommendations)
+            with timed('reading_status'):
+                flagged = with_reading_status(user['id'], recommendations)
+        logger.info("💽 Saved analysis session: %s", analysis['id'])
 
         # Create response with device ID cookie
         response_data = {
             'detected_books': detected_books,
-            'recommendations': recommendations,
+            'recommendations': flagged,
             'user_id': user['id'],
-            'session_id': analysis['id']
+            'session_id': analysis['id'],
+            'image_stats': image_stats
         }
         
-        response = make_response(jsonify(response_data))
-        
-        # Set/refresh device ID cookie (1 year expiration)
-        response.set_cookie(
-            'deviceId', 
-            device_id,
-            max_age=365*24*60*60,  # 1 year in seconds
-            path='/',
-            samesite='Strict',
-            httponly=False,  # Allow JavaScript access
-            secure=False  # Set to True in production with HTTPS
-        )
-        
-        return response
+        return device_response(response_data, device_id)
+    except UploadError as e:
+        return jsonify({'error': str(e)}), e.status_code
+    except UpstreamUnavailable as e:
+        logger.warning("⚠️  /analyze failed upstream: %s", e)
+        return jsonify({'error': str(e)}), e.status_code, e.headers
+    except Exception as e:
+        logger.exception("❌ Error in /analyze: %s", e)
+        return jsonify({'error': str(e)}), 500
+    finally:
+        if image is not None:
+            image.close()
+
+@app.route('/analyze/stream', methods=['POST'])
+def analyze_image_stream():
+    """/analyze as server-sent events: detected_books, then each recommendation as the model
+    finishes it, then done (session id and time-to-first-recommendation)"""
+    try:
+        with timed('read_upload'):
+            image, preferences = read_analyze_upload(request)
+    except UploadError as e:
+        return jsonify({'error': str(e)}), e.status_code
+
+    device_id = request.device_id
+    try:
+        with timed('user_lookup'):
+            user = get_user(device_id)
+    except Exception as e:
+        image.close()
+        logger.exception("❌ Error in /analyze/stream: %s", e)
+        return jsonify({'error': str(e)}), 500
+    logger.info("🔄 Streaming analysis for user: %s", user['id'])
+
+    def generate():
+        started = time.monotonic()
+        first_recommendation_ms = None
+        try:
+            with timed('save_preferences'):
+                save_user_preferences(user['id'], preferences)
+            with timed('detect_books'):
+                detected_books, image_stats = detect_books(image, user['id'])
+            image.close()
+            logger.info("📚 Detected %s books", len(detected_books))
+            yield sse_event('detected_books', {'detected_books': detected_books, 'image_stats': image_stats})
+
+            # Flags for the whole shelf in one query, so each streamed recommendation needs none
+            with timed('reading_status'):
+                status = reading_status(user['id'], detected_books)
+            recommendations = []
+            for recommendation in stream_recommend_books(preferences, detected_books, user['id']):
+                if first_recommendation_ms is None:
+                    first_recommendation_ms = round((time.monotonic() - started) * 1000)
+                    stage_seconds.observe(first_recommendation_ms / 1000, 'stream_first_recommendation')
+                    logger.info("⏱️ First recommendation after %s ms", first_recommendation_ms)
+                recommendations.append(recommendation)
+                yield sse_event('recommendation', {'recommendation': with_reading_status(user['id'], [recommendation], status)[0]})
+
+            with timed('save_analysis_session'):
+                analysis = save_analysis_session(user['id'], detected_books, recommendations)
+            logger.info("⭐ Streamed %s recommendations, session %s", len(recommendations), analysis['id'])
+            yield sse_event('done', {
+                'user_id': user['id'],
+                'session_id': analysis['id'],
+                'recommendations_count': len(recommendations),
+                'timings': {
+                    'first_recommendation_ms': first_recommendation_ms,
+                    'total_ms': round((time.monotonic() - started) * 1000)
+                }
+            })
+        except Exception as e:
+            logger.exception("❌ Error in /analyze/stream: %s", e)
+            yield sse_event('error', {'error': str(e)})
+        finally:
+            image.close()
+
+    response = Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+    return set_device_cookie(response, device_id)
+
+@app.route('/analyze/jobs', methods=['POST'])
+def create_analyze_job():
+    """Start an analysis in the background and return its job id immediately"""
+    image = None
+    try:
+        image, preferences = read_analyze_upload(request)
+
+        device_id = request.device_id
+        user = get_user(device_id)
+
+        job = submit_analysis_job(user['id'], image, preferences)
+        image = None  # now owned by the job
+        logger.info("🧵 Queued analysis job %s for user: %s", job['job_id'], user['id'])
+
+        return device_response({
+            'job_id': job['job_id'],
+            'session_id': job['job_id'],
+            'status': job['status'],
+            'status_url': f"/analyze/jobs/{job['job_id']}",
+            'events_url': f"/analyze/jobs/{job['job_id']}/events",
+            'user_id': user['id']
+        }, device_id, 202)
+    except UploadError as e:
+        return jsonify({'error': str(e)}), e.status_code
+    except JobQueueFull as e:
+        return jsonify({'error': str(e)}), 503, {'Retry-After': '5'}
+    except Exception as e:
+        logger.exception("❌ Error queuing analysis job: %s", e)
+        return jsonify({'error': str(e)}), 500
+    finally:
+        if image is not None:
+            image.close()
+
+@app.route('/analyze/jobs/<job_id>', methods=['GET'])
+def get_analyze_job(job_id):
+    """Poll an analysis job; detected_books appear before recommendations"""
+    try:
+        uuid.UUID(job_id)
+    except ValueError:
+        return jsonify({'error': 'Job not found'}), 404
+
+    try:
+        user = get_user(request.device_id)
+        job = get_job(job_id, user['id'])
+        if job is None:
+            return jsonify({'error': 'Job not found'}), 404
+        return jsonify({**job, 'session_id': job['job_id']})
+    except Exception as e:
+        logger.exception("❌ Error getting analysis job: %s", e)
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/analyze/jobs/<job_id>/events', methods=['GET'])
+def stream_analyze_job(job_id):
+    """Server-sent events for an analysis job"""
+    try:
+        uuid.UUID(job_id)
+    except ValueError:
+        return jsonify({'error': 'Job not found'}), 404
+
+    try:
+        user = get_user(request.device_id)
     except Exception as e:
-        print(f"❌ Error in /analyze: {str(e)}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("❌ Error streaming analysis job: %s", e)
         return jsonify({'error': str(e)}), 500
+    return Response(
+        job_events(job_id, user['id']),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
 
 @app.route('/process-goodreads', methods=['POST'])
 def process_goodreads():
     try:
-        print("📖 Received Goodreads CSV upload")
+        logger.info("📖 Received Goodreads CSV upload")
 
         if 'goodreads_csv' not in request.files:
             return jsonify({'error': 'No file uploaded'}), 400
@@ -138,18 +357,26 @@ def process_goodreads():
         if file.filename == '':
             return jsonify({'error': 'No file selected'}), 400
 
-        print(f"📁 File received: {file.filename}")
+        logger.info("📁 File received: %s", file.filename)
 
         # Get device ID from middleware
         device_id = request.device_id
         
         # Get or create user
-        user = get_or_create_user(device_id)
-        print(f"👤 Processing Goodreads for user: {user['id']}")
-        
-        # Process CSV (unchanged)
-        preferences = extract_goodreads_preferences(file)
-        print(f"📊 Extracted preferences: {len(preferences.get('authors', []))} authors, {len(preferences.get('genres', []))} genres")
+        user = get_user(device_id)
+        logger.info("👤 Processing Goodreads for user: %s", user['id'])
+        
+        # Process CSV, syncing every row into the user's goodreads_books library as it streams by. One
+        # transaction for the whole sync, so a failure part-way leaves the library as it was
+        with unit_of_work():
+            library_import = GoodreadsLibraryImport(user['id'])
+            summary = summarize_goodreads_export(file, on_chunk=library_import.add_chunk)
+            import_stats = library_import.finish()
+        # Use AI to infer genres from highly-rated books and elements to avoid from low-rated ones
+        genres, avoid_elements = infer_goodreads_preferences(summary['liked_titles'], summary['avoid_titles'])
+        preferences = goodreads_preferences(summary, genres, avoid_elements)
+        logger.info("📊 Extracted preferences: %s authors, %s genres", len(preferences.get('authors', [])), len(preferences.get('genres', [])))
+        logger.info("📚 Library sync: %s", import_stats)
         
         # Save to database with raw Goodreads data
         preferences['goodreads_raw'] = preferences.copy()  # Keep original data
@@ -158,77 +385,93 @@ def process_goodreads():
         # Create response with device ID cookie
         response_data = preferences.copy()
         response_data['user_id'] = user['id']
+        response_data['library_import'] = import_stats
         
-        response = make_response(jsonify(response_data))
-        
-        # Set/refresh device ID cookie
-        response.set_cookie(
-            'deviceId', 
-            device_id,
-            max_age=365*24*60*60,  # 1 year in seconds
-            path='/',
-            samesite='Strict',
-            httponly=False,
-            secure=False  # Set to True in production with HTTPS
-        )
-        
-        return response
+        return device_response(response_data, device_id)
         
     except Exception as e:
-        print(f"❌ Error processing Goodreads: {str(e)}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("❌ Error processing Goodreads: %s", e)
         return jsonify({'error': str(e)}), 500
 
+HISTORY_PAGE_SIZE = int(os.getenv('HISTORY_PAGE_SIZE', 20))
+HISTORY_MAX_PAGE_SIZE = 100
+
+def encode_history_cursor(key):
+    """Opaque /history cursor for a (created_at, session id) keyset position"""
+    created_at, session_id = key
+    return base64.urlsafe_b64encode(f"{created_at.isoformat()}|{session_id}".encode()).decode().rstrip('=')
+
+def decode_history_cursor(cursor: str):
+    raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+    created_at, session_id = raw.split('|', 1)
+    return datetime.fromisoformat(created_at), uuid.UUID(session_id)
+
+def conditional_response(response_data, device_id: str):
+    """JSON response with a content ETag; answers 304 when the client's If-None-Match still matches"""
+    response = device_response(response_data, device_id)
+    response.add_etag()
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response.make_conditional(request)
+
 @app.route('/history', methods=['GET'])
 def get_history():
-    """Get user's analysis history"""
+    """Get one page of the user's analysis history.
+
+    Query args: limit, cursor (next_cursor from the previous page) and
+    view=summary to return only ids, timestamps and counts.
+    """
     try:
         # Get device ID from middleware
         device_id = request.device_id
         
         # Get or create user (finds existing user)
-        user = get_or_create_user(device_id)
-        print(f"📜 Getting history for user: {user['id']}")
-        
-        # Get analysis history
-        sessions = get_user_analysis_history(user['id'], limit=20)
-        
-        # Convert to JSON-serializable format
-        history = []
-        for session in sessions:
-            history.append({
-                'session_id': str(session.id),
-                'created_at': session.created_at.isoformat(),
-                'detected_books_count': len(session.detected_books),
-                'recommendations_count': len(session.recommendations),
-                'detected_books': session.detected_books,
-                'recommendations': session.recommendations
-            })
+        user = get_user(device_id)
+        logger.debug("📜 Getting history for user: %s", user['id'])
+        
+        limit = min(max(request.args.get('limit', HISTORY_PAGE_SIZE, type=int), 1), HISTORY_MAX_PAGE_SIZE)
+        summary = request.args.get('view') == 'summary'
+        before = None
+        if request.args.get('cursor'):
+            try:
+                before = decode_history_cursor(request.args['cursor'])
+            except ValueError:
+                return jsonify({'error': 'Invalid cursor'}), 400
+        
+        history, next_key = get_user_analysis_history(user['id'], limit=limit, before=before, summary=summary)
         
         response_data = {
             'user_id': user['id'],
             'history': history,
-            'total_sessions': len(history)
+            'total_sessions': len(history),
+            'next_cursor': encode_history_cursor(next_key) if next_key else None
         }
         
-        response = make_response(jsonify(response_data))
+        return conditional_response(response_data, device_id)
+        
+    except Exception as e:
+        logger.exception("❌ Error getting history: %s", e)
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/history/<session_id>', methods=['GET'])
+def get_history_session(session_id):
+    """Get the detected books and recommendations of one analysis session"""
+    try:
+        device_id = request.device_id
+        user = get_user(device_id)
+        
+        try:
+            uuid.UUID(session_id)
+        except ValueError:
+            return jsonify({'error': 'Session not found'}), 404
         
-        # Set/refresh device ID cookie
-        response.set_cookie(
-            'deviceId', 
-            device_id,
-            max_age=365*24*60*60,
-            path='/',
-            samesite='Strict',
-            httponly=False,
-            secure=False
-        )
+        session = get_analysis_session(user['id'], session_id)
+        if session is None:
+            return jsonify({'error': 'Session not found'}), 404
         
-        return response
+        return conditional_response(session, device_id)
         
     except Exception as e:
-        print(f"❌ Error getting history: {str(e)}")
+        logger.exception("❌ Error getting history session: %s", e)
         return jsonify({'error': str(e)}), 500
 
 @app.route('/saved-books', methods=['GET'])
@@ -239,8 +482,8 @@ def get_user_saved_books():
         device_id = request.device_id
         
         # Get or create user
-        user = get_or_create_user(device_id)
-        print(f"📚 Getting saved books for user: {user['id']}")
+        user = get_user(device_id)
+        logger.debug("📚 Getting saved books for user: %s", user['id'])
         
         # Get saved books
         books = get_saved_books(user['id'])
@@ -251,23 +494,10 @@ def get_user_saved_books():
             'total_books': len(books)
         }
         
-        response = make_response(jsonify(response_data))
-        
-        # Set/refresh device ID cookie
-        response.set_cookie(
-            'deviceId', 
-            device_id,
-            max_age=365*24*60*60,
-            path='/',
-            samesite='Strict',
-            httponly=False,
-            secure=False
-        )
-        
-        return response
+        return device_response(response_data, device_id)
         
     except Exception as e:
-        print(f"❌ Error getting saved books: {str(e)}")
+        logger.exception("❌ Error getting saved books: %s", e)
         return jsonify({'error': str(e)}), 500
 
 @app.route('/saved-books', methods=['POST'])
@@ -288,29 +518,16 @@ def save_user_book():
         device_id = request.device_id
         
         # Get or create user
-        user = get_or_create_user(device_id)
-        print(f"💾 Saving book for user: {user['id']} - '{title}' by {author}")
+        user = get_user(device_id)
+        logger.info("💾 Saving book for user: %s - '%s' by %s", user['id'], title, author)
         
         # Save book
         result = save_book(user['id'], title, author, match_score, match_reason, source_session_id)
         
-        response = make_response(jsonify(result))
-        
-        # Set/refresh device ID cookie
-        response.set_cookie(
-            'deviceId', 
-            device_id,
-            max_age=365*24*60*60,
-            path='/',
-            samesite='Strict',
-            httponly=False,
-            secure=False
-        )
-        
-        return response
+        return device_response(result, device_id)
         
     except Exception as e:
-        print(f"❌ Error saving book: {str(e)}")
+        logger.exception("❌ Error saving book: %s", e)
         return jsonify({'error': str(e)}), 500
 
 @app.route('/saved-books', methods=['DELETE'])
@@ -327,29 +544,16 @@ def unsave_user_book():
         device_id = request.device_id
         
         # Get or create user
-        user = get_or_create_user(device_id)
-        print(f"🗑️ Removing book for user: {user['id']} - '{title}' by {author}")
+        user = get_user(device_id)
+        logger.info("🗑️ Removing book for user: %s - '%s' by %s", user['id'], title, author)
         
         # Remove book
         result = unsave_book(user['id'], title, author)
         
-        response = make_response(jsonify(result))
-        
-        # Set/refresh device ID cookie
-        response.set_cookie(
-            'deviceId', 
-            device_id,
-            max_age=365*24*60*60,
-            path='/',
-            samesite='Strict',
-            httponly=False,
-            secure=False
-        )
-        
-        return response
+        return device_response(result, device_id)
         
     except Exception as e:
-        print(f"❌ Error removing book: {str(e)}")
+        logger.exception("❌ Error removing book: %s", e)
         return jsonify({'error': str(e)}), 500
 
 @app.route('/saved-books/check', methods=['GET'])
@@ -366,7 +570,7 @@ def check_book_saved():
         device_id = request.device_id
         
         # Get or create user
-        user = get_or_create_user(device_id)
+        user = get_user(device_id)
         
         # Check if book is saved
         is_saved = check_if_book_saved(user['id'], title, author)
@@ -377,23 +581,10 @@ def check_book_saved():
             'author': author
         }
         
-        response = make_response(jsonify(response_data))
-        
-        # Set/refresh device ID cookie
-        response.set_cookie(
-            'deviceId', 
-            device_id,
-            max_age=365*24*60*60,
-            path='/',
-            samesite='Strict',
-            httponly=False,
-            secure=False
-        )
-        
-        return response
+        return device_response(response_data, device_id)
         
     except Exception as e:
-        print(f"❌ Error checking book status: {str(e)}")
+        logger.exception("❌ Error checking book status: %s", e)
         return jsonify({'error': str(e)}), 500
 
 @app.route('/saved-books/<int:book_id>/read', methods=['PUT'])
@@ -407,29 +598,16 @@ def update_book_read_status(book_id):
         device_id = request.device_id
         
         # Get or create user
-        user = get_or_create_user(device_id)
-        print(f"📖 Updating read status for user: {user['id']} - book_id: {book_id}")
+        user = get_user(device_id)
+        logger.info("📖 Updating read status for user: %s - book_id: %s", user['id'], book_id)
         
         # Update read status
         result = mark_book_as_read(user['id'], book_id, is_read)
         
-        response = make_response(jsonify(result))
-        
-        # Set/refresh device ID cookie
-        response.set_cookie(
-            'deviceId', 
-            device_id,
-            max_age=365*24*60*60,
-            path='/',
-            samesite='Strict',
-            httponly=False,
-            secure=False
-        )
-        
-        return response
+        return device_response(result, device_id)
         
     except Exception as e:
-        print(f"❌ Error updating read status: {str(e)}")
+        logger.exception("❌ Error updating read status: %s", e)
         return jsonify({'error': str(e)}), 500
 
 @app.route('/saved-books/<int:book_id>/notes', methods=['PUT'])
@@ -443,29 +621,130 @@ def update_book_notes_endpoint(book_id):
         device_id = request.device_id
         
         # Get or create user
-        user = get_or_create_user(device_id)
-        print(f"📝 Updating notes for user: {user['id']} - book_id: {book_id}")
+        user = get_user(device_id)
+        logger.info("📝 Updating notes for user: %s - book_id: %s", user['id'], book_id)
         
         # Update notes
         result = update_book_notes(user['id'], book_id, notes)
         
-        response = make_response(jsonify(result))
+        return device_response(result, device_id)
+        
+    except Exception as e:
+        logger.exception("❌ Error updating book notes: %s", e)
+        return jsonify({'error': str(e)}), 500
+
+SAVED_BOOKS_BATCH_LIMIT = int(os.getenv('SAVED_BOOKS_BATCH_LIMIT', 100))
+
+class BatchError(ValueError):
+    pass
+
+def read_batch(data, field: str):
+    """The non-empty, size-limited list under `field` of a batch request body"""
+    items = (data or {}).get(field)
+    if not isinstance(items, list) or not items:
+        raise BatchError(f"'{field}' must be a non-empty list")
+    if len(items) > SAVED_BOOKS_BATCH_LIMIT:
+        raise BatchError(f"At most {SAVED_BOOKS_BATCH_LIMIT} items per request")
+    return items
+
+def read_batch_books(data):
+    books = read_batch(data, 'books')
+    if not all(isinstance(book, dict) and book.get('title') and book.get('author') for book in books):
+        raise BatchError('Title and author are required for every book')
+    return books
+
+@app.route('/saved-books/check-batch', methods=['POST'])
+def check_books_saved_batch():
+    """Check the saved status of many books at once"""
+    try:
+        books = read_batch_books(request.get_json(silent=True))
+        device_id = request.device_id
+        user = get_user(device_id)
         
-        # Set/refresh device ID cookie
-        response.set_cookie(
-            'deviceId', 
-            device_id,
-            max_age=365*24*60*60,
-            path='/',
-            samesite='Strict',
-            httponly=False,
-            secure=False
-        )
+        results = check_books_saved(user['id'], [(book['title'], book['author']) for book in books])
+        return device_response({'results': results}, device_id)
+        
+    except BatchError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        logger.exception("❌ Error checking book status: %s", e)
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/saved-books/batch', methods=['POST'])
+def save_user_books_batch():
+    """Save many books to the user's reading list in one transaction"""
+    try:
+        books = read_batch_books(request.get_json(silent=True))
+        device_id = request.device_id
+        user = get_user(device_id)
+        logger.info("💾 Saving %s books for user: %s", len(books), user['id'])
+        
+        results = save_books(user['id'], books)
+        return device_response({'results': results, 'saved': sum(1 for r in results if r['success'] and not r['already_saved'])}, device_id)
+        
+    except BatchError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        logger.exception("❌ Error saving books: %s", e)
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/saved-books/batch', methods=['DELETE'])
+def unsave_user_books_batch():
+    """Remove many books from the user's reading list"""
+    try:
+        books = read_batch_books(request.get_json(silent=True))
+        device_id = request.device_id
+        user = get_user(device_id)
+        logger.info("🗑️ Removing %s books for user: %s", len(books), user['id'])
+        
+        results = unsave_books(user['id'], [(book['title'], book['author']) for book in books])
+        return device_response({'results': results, 'removed': sum(1 for r in results if r['success'])}, device_id)
+        
+    except BatchError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        logger.exception("❌ Error removing books: %s", e)
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/saved-books/batch/read', methods=['PUT'])
+def update_books_read_status_batch():
+    """Mark many books as read/unread"""
+    try:
+        data = request.get_json(silent=True)
+        book_ids = read_batch(data, 'book_ids')
+        if not all(isinstance(book_id, int) for book_id in book_ids):
+            raise BatchError('book_ids must be integers')
+        device_id = request.device_id
+        user = get_user(device_id)
+        logger.info("📖 Updating read status for user: %s - %s books", user['id'], len(book_ids))
+        
+        results = mark_books_as_read(user['id'], book_ids, bool(data.get('is_read', True)))
+        return device_response({'results': results}, device_id)
+        
+    except BatchError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        logger.exception("❌ Error updating read status: %s", e)
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/saved-books/batch/notes', methods=['PUT'])
+def update_books_notes_batch():
+    """Update notes on many books; body is {"notes": [{"book_id": 1, "notes": "..."}]}"""
+    try:
+        items = read_batch(request.get_json(silent=True), 'notes')
+        if not all(isinstance(item, dict) and isinstance(item.get('book_id'), int) for item in items):
+            raise BatchError('Every item needs an integer book_id')
+        device_id = request.device_id
+        user = get_user(device_id)
+        logger.info("📝 Updating notes for user: %s - %s books", user['id'], len(items))
         
-        return response
+        results = update_books_notes(user['id'], {item['book_id']: item.get('notes', '') for item in items})
+        return device_response({'results': results}, device_id)
         
+    except BatchError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
-        print(f"❌ Error updating book notes: {str(e)}")
+        logger.exception("❌ Error updating book notes: %s", e)
         return jsonify({'error': str(e)}), 500
 
 if __name__ == "__main__":
@@ -0,0 +1,204 @@
+import asyncio
+import contextlib
+import functools
+import logging
+import os
+import time
+import uuid
+
+from a2wsgi import WSGIMiddleware
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.responses import Response
+from starlette.routing import Route
+
+# Importing the Flask app loads .env, configures logging and creates the tables
+from app import DEVICE_COOKIE, DEVICE_COOKIE_MAX_AGE, REQUEST_ID_PATTERN, allowed_origins, app as flask_app
+from ai_services import ainfer_goodreads_preferences, goodreads_preferences, summarize_goodreads_export
+from analysis import adetect_books, arecommend_books, with_reading_status
+from database import save_analysis_session, save_user_preferences, unit_of_work
+from database_async import AsyncUnitOfWork, call, dispose
+from goodreads_library import GoodreadsLibraryImport
+from identity import aget_user
+from logging_setup import UNSAMPLED, set_request_id
+from metrics import http_request_seconds, timed
+from resilience import UpstreamUnavailable, start_budget
+from uploads import UploadError, aread_analyze_upload
+
+logger = logging.getLogger(__name__)
+
+# ASGI entry point: the two model-bound routes run as coroutines, so one worker holds many
+# in-flight requests while they wait on OpenAI and the database; every other route is the
+# unchanged Flask app on a small thread pool. Same URLs, JSON, cookies and error contract.
+#
+#     uvicorn asgi:app --workers 2
+#     gunicorn asgi:app -k uvicorn.workers.UvicornWorker
+ASGI_WSGI_THREADS = int(os.getenv('ASGI_WSGI_THREADS', 10))
+ASYNC_ROUTES = ('/analyze', '/process-goodreads')
+
+
+def _json(data, status: int = 200) -> Response:
+    # Flask's provider with jsonify()'s compact separators: byte-for-byte the Flask route's body
+    return Response(flask_app.json.dumps(data, separators=(',', ':')) + '\n', status_code=status, media_type='application/json')
+
+
+def _device_json(data, device_id: str, status: int = 200) -> Response:
+    """app.device_response for Starlette: the same cookie, set through Starlette's API"""
+    response = _json(data, status)
+    response.set_cookie(DEVICE_COOKIE, device_id, max_age=DEVICE_COOKIE_MAX_AGE, expires=DEVICE_COOKIE_MAX_AGE,
+                        path='/', samesite='strict', httponly=False, secure=False)
+    return response
+
+
+def _device_id(request) -> str:
+    """Cookie, then X-Device-ID header, then a server-side UUID - as app.ensure_device_id"""
+    device_id = request.cookies.get(DEVICE_COOKIE) or request.headers.get('X-Device-ID')
+    if not device_id:
+        device_id = str(uuid.uuid4())
+        logger.info("⚠️  Generated server-side device ID: %s...", device_id[:8])
+    else:
+        logger.debug("🆔 Using device ID: %s...", device_id[:8])
+    return device_id
+
+
+def _endpoint(handler):
+    """Request id, device id, access line and http_request_seconds, as Flask's before/after_request hooks"""
+    @functools.wraps(handler)
+    async def endpoint(request):
+        started = time.perf_counter()
+        incoming = request.headers.get('X-Request-ID', '')
+        request_id = set_request_id(incoming if REQUEST_ID_PATTERN.fullmatch(incoming) else None)
+        start_budget()
+        response = await handler(request, _device_id(request))
+        response.headers['X-Request-ID'] = request_id
+        duration_ms = round((time.perf_counter() - started) * 1000, 1)
+        logger.info("%s %s %s in %s ms", request.method, request.url.path, response.status_code, duration_ms,
+                    extra={'method': request.method, 'path': request.url.path, 'status': response.status_code,
+                           'duration_ms': duration_ms, **UNSAMPLED})
+        http_request_seconds.observe(duration_ms / 1000, request.method, handler.__name__, response.status_code)
+        return response
+    return endpoint
+
+
+async def analyze_image(request, device_id):
+    image = None
+    try:
+        with timed('read_upload'):
+            image, preferences = await aread_analyze_upload(request)
+
+        with timed('user_lookup'):
+            user = await aget_user(device_id)
+        logger.info("🔄 Processing request for user: %s", user['id'])
+
+        with timed('save_preferences'):
+            saved_prefs = await call(save_user_preferences, user['id'], preferences)
+        logger.info("💾 Saved preferences: %s authors, %s genres", len(saved_prefs['favorite_authors']), len(saved_prefs['preferred_genres']))
+
+        with timed('detect_books'):
+            detected_books, image_stats = await adetect_books(image, user['id'])
+        logger.info("📚 Detected %s books", len(detected_books))
+
+        with timed('recommend_books'):
+            recommendations = await arecommend_books(preferences, detected_books, user['id'])
+        logger.info("⭐ Generated %s recommendations", len(recommendations))
+
+        # Save the session and flag the recommendations on one connection, in one transaction
+        async with AsyncUnitOfWork() as unit:
+            with timed('save_analysis_session'):
+                analysis = await unit.call(save_analysis_session, user['id'], detected_books, recommendations)
+            with timed('reading_status'):
+                flagged = await unit.call(with_reading_status, user['id'], recommendations)
+        logger.info("💽 Saved analysis session: %s", analysis['id'])
+
+        return _device_json({
+            'detected_books': detected_books,
+            'recommendations': flagged,
+            'user_id': user['id'],
+            'session_id': analysis['id'],
+            'image_stats': image_stats
+        }, device_id)
+    except UploadError as e:
+        return _json({'error': str(e)}, e.status_code)
+    except UpstreamUnavailable as e:
+        logger.warning("⚠️  /analyze failed upstream: %s", e)
+        response = _json({'error': str(e)}, e.status_code)
+        response.headers.update(e.headers)
+        return response
+    except Exception as e:
+        logger.exception("❌ Error in /analyze: %s", e)
+        return _json({'error': str(e)}, 500)
+    finally:
+        if image is not None:
+            image.close()
+
+
+def _summarize_goodreads(csv_file, user_id):
+    """Parse the export and sync the library in one transaction (pandas + sync engine, run in a worker thread)"""
+    with unit_of_work():
+        library_import = GoodreadsLibraryImport(user_id)
+        summary = summarize_goodreads_export(csv_file, on_chunk=library_import.add_chunk)
+        return summary, library_import.finish()
+
+
+async def process_goodreads(request, device_id):
+    try:
+        logger.info("📖 Received Goodreads CSV upload")
+        form = await request.form()
+        try:
+            file = form.get('goodreads_csv')
+            if file is None or isinstance(file, str):
+                return _json({'error': 'No file uploaded'}, 400)
+            if not file.filename:
+                return _json({'error': 'No file selected'}, 400)
+            logger.info("📁 File received: %s", file.filename)
+
+            user = await aget_user(device_id)
+            logger.info("👤 Processing Goodreads for user: %s", user['id'])
+
+            summary, import_stats = await asyncio.to_thread(_summarize_goodreads, file.file, user['id'])
+        finally:
+            await form.close()
+
+        genres, avoid_elements = await ainfer_goodreads_preferences(summary['liked_titles'], summary['avoid_titles'])
+        preferences = goodreads_preferences(summary, genres, avoid_elements)
+        logger.info("📊 Extracted preferences: %s authors, %s genres", len(preferences.get('authors', [])), len(preferences.get('genres', [])))
+        logger.info("📚 Library sync: %s", import_stats)
+
+        preferences['goodreads_raw'] = preferences.copy()  # Keep original data
+        await call(save_user_preferences, user['id'], preferences)
+
+        response_data = preferences.copy()
+        response_data['user_id'] = user['id']
+        response_data['library_import'] = import_stats
+        return _device_json(response_data, device_id)
+    except Exception as e:
+        logger.exception("❌ Error processing Goodreads: %s", e)
+        return _json({'error': str(e)}, 500)
+
+
+@contextlib.asynccontextmanager
+async def _lifespan(app):
+    yield
+    await dispose()
+
+
+async_app = Starlette(
+    routes=[
+        Route('/analyze', _endpoint(analyze_image), methods=['POST']),
+        Route('/process-goodreads', _endpoint(process_goodreads), methods=['POST']),
+    ],
+    middleware=[Middleware(CORSMiddleware, allow_origins=allowed_origins, allow_credentials=True,
+                           allow_methods=['*'], allow_headers=['*'])],
+    lifespan=_lifespan,
+)
+wsgi_app = WSGIMiddleware(flask_app, workers=ASGI_WSGI_THREADS)
+
+
+async def app(scope, receive, send):
+    # Preflights and other methods stay on Flask (flask-cors, Flask's 405s)
+    if scope['type'] == 'lifespan' or (
+            scope['type'] == 'http' and scope['method'] == 'POST' and scope['path'] in ASYNC_ROUTES):
+        await async_app(scope, receive, send)
+    else:
+        await wsgi_app(scope, receive, send)
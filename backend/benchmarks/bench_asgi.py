@@ -0,0 +1,72 @@
+"""Load test: /analyze on one sync gunicorn worker (app:app) vs one uvicorn worker (asgi:app).
+
+Both servers run as real subprocesses against the stub LLM (--latency seconds per model call)
+and a throwaway SQLite database. Every request uploads a different shelf photo with different
+preferences, so the shelf and recommendation caches miss and each request makes its model calls.
+The sync worker is capped by its thread count; the ASGI worker by nothing but the event loop.
+
+    python -m benchmarks.bench_asgi --requests 200 --concurrency 50 --threads 8 --latency 0.5
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--concurrency', type=int, default=50, help='in-flight client requests')
+    parser.add_argument('--threads', type=int, default=8, help='gunicorn gthread threads for the sync worker')
+    parser.add_argument('--latency', type=float, default=0.5, help='stub seconds per model call')
+    parser.add_argument('--books', type=int, default=25)
+    parser.add_argument('--server-log', default=os.devnull, help='file for both servers\' output')
+    args = parser.parse_args()
+
+    sys.path.insert(0, BACKEND_DIR)
+    from benchmarks.fixtures import shelf_photo
+    from benchmarks.harness import Server, run_load
+    from benchmarks.stub_llm import StubConfig, start_stub_server
+
+    stub, base_url = start_stub_server(config=StubConfig(args.latency, books=args.books))
+    workdir = tempfile.mkdtemp()
+    env = dict(os.environ, OPENAI_BASE_URL=base_url, OPENAI_API_KEY='stub', LOG_LEVEL='WARNING',
+               DATABASE_URL=f"sqlite:///{os.path.join(workdir, 'bench.db')}",
+               # Let both servers put every request's model calls in flight; only the serving model differs
+               OPENAI_CONCURRENCY=str(args.requests), OPENAI_MAX_CONNECTIONS=str(args.requests),
+               DB_POOL_SIZE='10', DB_MAX_OVERFLOW='40')
+    photos = [shelf_photo(i) for i in range(args.requests * 2)]
+
+    servers = [
+        (f"gunicorn app:app, 1 worker x {args.threads} threads", 'wsgi', 8771),
+        ("uvicorn asgi:app, 1 worker", 'asgi', 8772),
+    ]
+    results = []
+    log = open(args.server_log, 'ab')
+    for index, (label, kind, port) in enumerate(servers):
+        offset = index * args.requests
+
+        def make_request(i):
+            preferences = json.dumps({'genres': [f"Genre {i}"], 'authors': [f"Author {i % 17}"]})
+            return 'POST', '/analyze', {'files': {'image': ('shelf.jpg', photos[offset + i], 'image/jpeg')},
+                                        'data': {'preferences': preferences},
+                                        'headers': {'X-Device-ID': f"bench-{kind}-{i % 40}"}}
+
+        with Server(kind, port, env, args.threads, log) as server:
+            results.append((label, run_load(server.base_url, args.requests, args.concurrency, make_request)))
+
+    print(f"📊 {args.requests} x POST /analyze, {args.concurrency} in flight, stub {args.latency}s per model call "
+          f"(2 calls per request)")
+    for label, load in results:
+        print(f"   {label:<40} {load.requests / load.wall:>6.1f} req/s   p50 {statistics.median(load.latencies) * 1000:>6.0f} ms   "
+              f"p99 {load.percentile(0.99) * 1000:>6.0f} ms   statuses {load.statuses}")
+    log.close()
+    stub.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+"""Micro-benchmark of fuzzy.py on large shelves.
+
+Generates --shelf synthetic titles plus OCR-style variants of some of them, then times
+dedupe_books and reconcile against a naive all-pairs Python loop over the same trigram sets.
+
+    python -m benchmarks.bench_fuzzy --shelf 500
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+
+_COMMON = "the of and a in to last first lost night house king city".split()
+_SYLLABLES = "ka lo mi ra ven tor sha dow win ter gar den sil ver iron gol bro ken mar ish el an or un est ing".split()
+
+
+def _words(rng: random.Random, count: int):
+    """Pseudo-words, so the trigram vocabulary is as varied as real titles"""
+    words = set()
+    while len(words) < count:
+        words.add(''.join(rng.choice(_SYLLABLES) for _ in range(rng.randint(2, 3))))
+    return sorted(words)
+
+
+def _ocr_variant(title: str, rng: random.Random) -> str:
+    """One misread character inside a word, as a vision model might return it"""
+    chars = list(title)
+    positions = [i for i in range(1, len(chars) - 1) if chars[i].isalpha() and chars[i - 1].isalpha()]
+    i = rng.choice(positions)
+    if rng.random() < 0.5:
+        del chars[i]
+    else:
+        chars[i] = rng.choice('aeilnorst'.replace(chars[i].lower(), ''))
+    return ''.join(chars)
+
+
+def _median_ms(fn, runs):
+    samples = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        result = fn()
+        samples.append((time.perf_counter() - started) * 1000)
+    return statistics.median(samples), result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--shelf', type=int, default=500)
+    parser.add_argument('--variant-fraction', type=float, default=0.1)
+    parser.add_argument('--runs', type=int, default=20)
+    parser.add_argument('--seed', type=int, default=7)
+    args = parser.parse_args()
+
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    from fuzzy import FUZZY_DEDUPE_THRESHOLD, dedupe_books, reconcile, similarity, trigrams
+    from normalize import normalize_title
+
+    rng = random.Random(args.seed)
+    vocabulary = _words(rng, args.shelf) + _COMMON * 20
+    titles = set()
+    while len(titles) < args.shelf:
+        titles.add(' '.join(rng.choice(vocabulary) for _ in range(rng.randint(2, 5))).title())
+    books = [{'title': title, 'author': f"Author {i % 60}"} for i, title in enumerate(sorted(titles))]
+    variants = [{**book, 'title': _ocr_variant(book['title'], rng)} for book in rng.sample(books, int(args.shelf * args.variant_fraction))]
+    shelf = books + variants
+    rng.shuffle(shelf)
+
+    def naive_pairs():
+        grams = [trigrams(normalize_title(book['title'])) for book in shelf]
+        return sum(1 for i in range(len(grams)) for j in range(i + 1, len(grams))
+                   if similarity(grams[i], grams[j]) >= FUZZY_DEDUPE_THRESHOLD)
+
+    dedupe_ms, deduped = _median_ms(lambda: dedupe_books(shelf), args.runs)
+    naive_ms, naive_matches = _median_ms(naive_pairs, max(1, args.runs // 5))
+
+    recommendations = [{'title': _ocr_variant(book['title'], rng), 'author': book['author']} for book in rng.sample(books, 4)]
+    recommendations.append({'title': 'A Book Nobody Wrote', 'author': 'Nobody'})
+    reconcile_ms, (reconciled, stats) = _median_ms(lambda: reconcile(recommendations, deduped), args.runs)
+
+    print(f"📊 {len(shelf)} detected books ({len(variants)} OCR variants), {args.runs} runs")
+    print(f"   dedupe_books: {dedupe_ms:.1f} ms -> {len(deduped)} books, {len(shelf) - len(deduped)} variants merged "
+          f"(naive all-pairs Jaccard: {naive_ms:.0f} ms, {naive_matches} pairs over threshold)")
+    print(f"   reconcile 5 recommendations vs {len(deduped)} books: {reconcile_ms:.2f} ms -> {stats}")
+
+
+if __name__ == '__main__':
+    main()
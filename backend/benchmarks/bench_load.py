@@ -0,0 +1,229 @@
+"""Reproducible load benchmark for the HTTP API, compared against a JSON baseline.
+
+Runs the real server (gunicorn app:app or uvicorn asgi:app, one worker) against the stub LLM
+and a fixture database seeded with users, history, reading lists and Goodreads libraries.
+Each scenario gets a freshly started server and drives its endpoints in turn:
+
+    analyze       POST /analyze (a different shelf photo every request: caches miss)
+    goodreads     POST /process-goodreads (fixture export of --goodreads-size)
+    history       GET /history, GET /history?view=summary
+    saved_books   POST, GET, GET /check, POST /check-batch, DELETE on /saved-books
+
+Per endpoint it reports throughput, p50/p99 latency, SQL statements per request (from the
+server's db_statements_total) and the worker's peak RSS (process_peak_rss_bytes, a high-water
+mark since the scenario's server started). Results go to --baseline on the first run; later
+runs print the change against it and exit 1 when anything regressed beyond --tolerance.
+
+    python -m benchmarks.bench_load --server asgi --concurrency 20 --requests 100
+    python -m benchmarks.bench_load --scenarios history,saved_books --update-baseline
+    python -m benchmarks.bench_load --database-url postgresql://localhost/bookscanner_bench
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_BASELINE = os.path.join(BACKEND_DIR, 'benchmarks', 'baseline.json')
+
+# (field, direction): +1 = higher is better, -1 = lower is better
+COMPARED_FIELDS = [('throughput_rps', 1), ('p50_ms', -1), ('p99_ms', -1), ('db_statements_per_request', -1),
+                   ('peak_rss_mb', -1)]
+# Settings that make two runs comparable at all
+COMPARABLE_SETTINGS = ('server', 'threads', 'requests', 'concurrency', 'latency', 'per_token_latency', 'books',
+                       'recommendations', 'photo_size', 'goodreads_size', 'users', 'database')
+
+
+def _scenarios(args, photo, csv_payload):
+    """{scenario: [(endpoint label, make_request(i))]} - endpoints of a scenario run in order on one server"""
+    from benchmarks.fixtures import fixture_device_id
+
+    def device(i):
+        return {'X-Device-ID': fixture_device_id(i % args.users)}
+
+    def preferences(i):
+        return json.dumps({'genres': [f"Genre {i % 50}"], 'authors': [f"Author {i % 17}"], 'avoid': 'Gore'})
+
+    def book(i):
+        return {'title': f"Load Book {i}", 'author': f"Author {i % 23}"}
+
+    return {
+        'analyze': [
+            ('POST /analyze', lambda i: ('POST', '/analyze', {
+                'files': {'image': ('shelf.jpg', photo(i), 'image/jpeg')},
+                'data': {'preferences': preferences(i)}, 'headers': device(i)})),
+        ],
+        'goodreads': [
+            ('POST /process-goodreads', lambda i: ('POST', '/process-goodreads', {
+                'files': {'goodreads_csv': ('goodreads_library_export.csv', csv_payload, 'text/csv')},
+                'headers': device(i)})),
+        ],
+        'history': [
+            ('GET /history', lambda i: ('GET', '/history', {'params': {'limit': 20}, 'headers': device(i)})),
+            ('GET /history?view=summary', lambda i: ('GET', '/history', {
+                'params': {'limit': 50, 'view': 'summary'}, 'headers': device(i)})),
+        ],
+        'saved_books': [
+            ('POST /saved-books', lambda i: ('POST', '/saved-books', {'json': {**book(i), 'match_score': 80},
+                                                                     'headers': device(i)})),
+            ('GET /saved-books', lambda i: ('GET', '/saved-books', {'headers': device(i)})),
+            ('GET /saved-books/check', lambda i: ('GET', '/saved-books/check', {'params': book(i), 'headers': device(i)})),
+            ('POST /saved-books/check-batch', lambda i: ('POST', '/saved-books/check-batch', {
+                'json': {'books': [book(i + k) for k in range(20)]}, 'headers': device(i)})),
+            ('DELETE /saved-books', lambda i: ('DELETE', '/saved-books', {'params': book(i), 'headers': device(i)})),
+        ],
+    }
+
+
+def _run_scenario(name, endpoints, server_factory, args):
+    from benchmarks.harness import metric_total, run_load
+    results = {}
+    with server_factory() as server:
+        prefix = 'bookscanner_'
+        for label, make_request in endpoints:
+            # Warm-up (connections, caches, lazy imports) on indexes the measured run never uses
+            run_load(server.base_url, args.warmup, args.concurrency, lambda i: make_request(args.requests + i))
+            before = metric_total(server.metrics(), f"{prefix}db_statements_total")
+            load = run_load(server.base_url, args.requests, args.concurrency, make_request)
+            after = server.metrics()
+            statements = metric_total(after, f"{prefix}db_statements_total") - before
+            results[label] = {
+                **load.summary(),
+                'db_statements_per_request': round(statements / load.requests, 2),
+                'peak_rss_mb': round(metric_total(after, f"{prefix}process_peak_rss_bytes") / 2**20, 1),
+            }
+            print(f"   {label:<32} {_format(results[label])}", flush=True)
+    return results
+
+
+def _format(result):
+    text = (f"{result['throughput_rps']:>7.1f} req/s   p50 {result['p50_ms']:>7.1f} ms   p99 {result['p99_ms']:>7.1f} ms   "
+            f"{result['db_statements_per_request']:>5.1f} SQL/req   peak RSS {result['peak_rss_mb']:>6.1f} MB")
+    if result['errors']:
+        text += f"   ❌ {result['errors']} errors {result['statuses']}"
+    return text
+
+
+def compare(results: dict, baseline: dict, tolerance: float, min_delta_ms: float = 5):
+    """Lines describing each endpoint's change against the baseline, and whether anything regressed.
+    Latency changes smaller than min_delta_ms never count, however large in relative terms."""
+    lines, regressed = [], False
+    for label, result in results.items():
+        previous = baseline.get('results', {}).get(label)
+        if previous is None:
+            lines.append(f"   {label:<32} (not in baseline)")
+            continue
+        changes = []
+        for field, direction in COMPARED_FIELDS:
+            old, new = previous.get(field), result.get(field)
+            if not old or new is None:
+                continue
+            change = (new - old) / old
+            worse = change * direction < -tolerance and not (field.endswith('_ms') and abs(new - old) < min_delta_ms)
+            regressed = regressed or worse
+            changes.append(f"{field} {change:+.0%}{' ⚠️' if worse else ''}")
+        if result['errors'] > previous.get('errors', 0):
+            regressed = True
+            changes.append(f"errors {previous.get('errors', 0)} -> {result['errors']} ⚠️")
+        lines.append(f"   {label:<32} " + ', '.join(changes))
+    return lines, regressed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--server', choices=('wsgi', 'asgi'), default='wsgi')
+    parser.add_argument('--threads', type=int, default=8, help='gunicorn threads for --server wsgi')
+    parser.add_argument('--scenarios', default='analyze,goodreads,history,saved_books')
+    parser.add_argument('--requests', type=int, default=100, help='requests per endpoint')
+    parser.add_argument('--concurrency', type=int, default=10, help='requests in flight')
+    parser.add_argument('--warmup', type=int, default=20, help='unmeasured requests per endpoint first')
+    parser.add_argument('--latency', type=float, default=0.3, help='stub seconds per model call')
+    parser.add_argument('--per-token-latency', type=float, default=0.0, help='stub seconds per completion token')
+    parser.add_argument('--books', type=int, default=25, help='books the stub "sees" on every shelf')
+    parser.add_argument('--recommendations', type=int, default=5)
+    parser.add_argument('--photo-size', choices=('small', 'medium', 'large'), default='small')
+    parser.add_argument('--goodreads-size', choices=('small', 'medium', 'large'), default='medium')
+    parser.add_argument('--users', type=int, default=20, help='fixture users the requests rotate through')
+    parser.add_argument('--database-url', help='fixture database (default: a fresh SQLite file)')
+    parser.add_argument('--port', type=int, default=8780)
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE)
+    parser.add_argument('--update-baseline', action='store_true', help='overwrite the baseline with this run')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='relative change counted as a regression')
+    parser.add_argument('--min-delta-ms', type=float, default=5, help='latency changes below this are noise')
+    parser.add_argument('--server-log', default=os.devnull)
+    args = parser.parse_args()
+
+    sys.path.insert(0, BACKEND_DIR)
+    workdir = tempfile.mkdtemp(prefix='bench-load-')
+    database_url = args.database_url or f"sqlite:///{os.path.join(workdir, 'fixture.db')}"
+    os.environ.update(DATABASE_URL=database_url, OPENAI_API_KEY='stub', LOG_LEVEL='WARNING')
+
+    from benchmarks.fixtures import GOODREADS_SIZES, goodreads_csv, seed_database, shelf_photo
+    from benchmarks.harness import Server
+    from benchmarks.stub_llm import StubConfig, start_stub_server
+
+    stub, base_url = start_stub_server(config=StubConfig(args.latency, args.per_token_latency, args.books,
+                                                         recommendations=args.recommendations))
+    started = time.perf_counter()
+    seed_database(args.users)
+    print(f"🌱 Fixture database ready in {time.perf_counter() - started:.1f}s: {database_url}")
+
+    env = dict(os.environ, OPENAI_BASE_URL=base_url,
+               # The stub is the only upstream: let the worker put every model call in flight
+               OPENAI_CONCURRENCY=str(max(args.concurrency * 2, 8)), OPENAI_MAX_CONNECTIONS=str(max(args.concurrency * 2, 20)))
+    log = open(args.server_log, 'ab')
+    names = args.scenarios.split(',')
+    # Generated up front so the client loop only sends; a new set every run keeps a reused database's shelf cache cold
+    photo_offset = int(time.time())
+    photos = ([shelf_photo(photo_offset + i, args.photo_size) for i in range(args.requests + args.warmup)]
+              if 'analyze' in names else [])
+    scenarios = _scenarios(args, photos.__getitem__, goodreads_csv(GOODREADS_SIZES[args.goodreads_size]))
+
+    print(f"📊 {args.server}, {args.requests} requests per endpoint, {args.concurrency} in flight, "
+          f"stub {args.latency}s per call")
+    results = {}
+    for name in names:
+        print(f"🏁 {name}")
+        results.update(_run_scenario(name, scenarios[name],
+                                     lambda: Server(args.server, args.port, env, args.threads, log), args))
+    log.close()
+    stub.shutdown()
+
+    run = {
+        'meta': {
+            'created_at': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'database': database_url.split('://', 1)[0],
+            **{key: value for key, value in vars(args).items()
+               if key not in ('baseline', 'update_baseline', 'tolerance', 'min_delta_ms', 'server_log', 'database_url', 'port')},
+        },
+        'results': results,
+    }
+
+    regressed = False
+    if os.path.exists(args.baseline) and not args.update_baseline:
+        with open(args.baseline) as baseline_file:
+            baseline = json.load(baseline_file)
+        print(f"📈 Against baseline of {baseline['meta'].get('created_at')} ({args.baseline}):")
+        differing = [f"{key} {baseline['meta'].get(key)} -> {run['meta'].get(key)}" for key in COMPARABLE_SETTINGS
+                     if baseline['meta'].get(key) != run['meta'].get(key)]
+        if differing:
+            print(f"⚠️  Baseline was recorded with other settings ({', '.join(differing)}); treat the changes as indicative")
+        lines, regressed = compare(results, baseline, args.tolerance, args.min_delta_ms)
+        print('\n'.join(lines))
+        if regressed:
+            print(f"⚠️  Regression beyond ±{args.tolerance:.0%}")
+    else:
+        with open(args.baseline, 'w') as baseline_file:
+            json.dump(run, baseline_file, indent=2)
+        print(f"💾 Baseline written to {args.baseline}")
+    sys.exit(1 if regressed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,138 @@
+"""Request-thread cost of logging: off vs print() vs synchronous logging vs the queued JSON setup.
+
+Each simulated request emits the lines a typical /analyze request logs (a few INFO lines plus
+the access line) from --threads threads at once. Output goes to a file whose writes take
+--write-latency seconds, standing in for a contended stdout pipe under gunicorn.
+
+    python -m benchmarks.bench_logging --requests 2000 --threads 8 --write-latency 0.0001
+"""
+import argparse
+import logging
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+class _SlowFile:
+    """File wrapper whose writes are serialized and take a fixed time, like a busy pipe"""
+
+    def __init__(self, path, write_latency):
+        self._file = open(path, 'w', encoding='utf-8')
+        self._lock = threading.Lock()
+        self.write_latency = write_latency
+
+    def write(self, text):
+        with self._lock:
+            if self.write_latency:
+                time.sleep(self.write_latency)
+            return self._file.write(text)
+
+    def flush(self):
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+
+def _request_with_print(i, out):
+    print(f"🔄 Processing request for user: user-{i % 50}", file=out)
+    print(f"📚 Detected {i % 30} books", file=out)
+    print(f"⭐ Generated 5 recommendations", file=out)
+    print(f"💽 Saved analysis session: session-{i}", file=out)
+    print(f"POST /analyze 200 in {i % 900} ms", file=out)
+
+
+def _request_with_logging(i, logger, set_request_id):
+    set_request_id()
+    logger.info("🔄 Processing request for user: %s", f"user-{i % 50}")
+    logger.info("📚 Detected %s books", i % 30)
+    logger.info("⭐ Generated %s recommendations", 5)
+    logger.info("💽 Saved analysis session: %s", f"session-{i}")
+    logger.info("%s %s %s in %s ms", 'POST', '/analyze', 200, i % 900,
+                extra={'method': 'POST', 'path': '/analyze', 'status': 200, 'duration_ms': i % 900,
+                       '_sampled': False})  # logging_setup.UNSAMPLED, as the app logs it
+
+
+def _run(requests, threads, fn):
+    """(wall seconds, per-request caller-side latencies in microseconds)"""
+    latencies = [0.0] * requests
+
+    def one(i):
+        started = time.perf_counter()
+        fn(i)
+        latencies[i] = (time.perf_counter() - started) * 1e6
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        list(pool.map(one, range(requests)))
+    return time.perf_counter() - started, latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--write-latency', type=float, default=0.0001, help='seconds per write to the log file')
+    parser.add_argument('--rate-limit', type=float, default=20, help='LOG_RATE_LIMIT_PER_SECOND for the sampled run')
+    args = parser.parse_args()
+
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    from logging_setup import JSONFormatter, configure_logging, logging_stats, set_request_id, stop_logging, ContextFilter
+
+    logger = logging.getLogger('bench')
+    path = os.path.join(tempfile.mkdtemp(), 'bench.log')
+    results = []
+    stats = {}
+
+    def measure(label, fn, out=None):
+        wall, latencies = _run(args.requests, args.threads, fn)
+        stats.update(logging_stats())
+        drain_started = time.perf_counter()
+        stop_logging()
+        drain = time.perf_counter() - drain_started
+        if out is not None:
+            out.close()
+        latencies.sort()
+        results.append((label, wall, statistics.median(latencies), latencies[int(len(latencies) * 0.99) - 1], drain))
+
+    root = logging.getLogger()
+
+    configure_logging(level='CRITICAL', stream=_SlowFile(path, args.write_latency))
+    measure('logging off (level CRITICAL)', lambda i: _request_with_logging(i, logger, set_request_id))
+
+    out = _SlowFile(path, args.write_latency)
+    measure('print()', lambda i: _request_with_print(i, out), out)
+
+    # The same JSON records, written on the request thread
+    out = _SlowFile(path, args.write_latency)
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    direct = logging.StreamHandler(out)
+    direct.setFormatter(JSONFormatter())
+    direct.addFilter(ContextFilter())
+    root.addHandler(direct)
+    root.setLevel(logging.INFO)
+    measure('synchronous JSON handler', lambda i: _request_with_logging(i, logger, set_request_id), out)
+    root.removeHandler(direct)
+
+    out = _SlowFile(path, args.write_latency)
+    configure_logging(level='INFO', stream=out, per_second=0)
+    measure('queued JSON (no sampling)', lambda i: _request_with_logging(i, logger, set_request_id), out)
+
+    out = _SlowFile(path, args.write_latency)
+    configure_logging(level='INFO', stream=out, per_second=args.rate_limit)
+    measure(f"queued JSON, {args.rate_limit:g}/s per template", lambda i: _request_with_logging(i, logger, set_request_id), out)
+
+    print(f"📊 {args.requests} requests x 5 lines on {args.threads} threads, {args.write_latency * 1e6:.0f} µs per write")
+    for label, wall, p50, p99, drain in results:
+        print(f"   {label:<38} {args.requests / wall:>8.0f} req/s   p50 {p50:>7.1f} µs   p99 {p99:>8.1f} µs   "
+              f"drain after {drain * 1000:.0f} ms")
+    print(f"   sampled run dropped {stats['dropped_sampled']} records, queue full {stats['dropped_queue_full']}")
+
+
+if __name__ == '__main__':
+    main()
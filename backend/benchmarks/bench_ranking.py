@@ -0,0 +1,90 @@
+"""Prompt size and latency of generate_recommendations with and without local ranking.
+
+Builds a shelf of --shelf books for a user whose Goodreads library already contains
+--read-fraction of them, then sends the recommendation call to the stub LLM three ways:
+the old repr() prompt payload (size only), every book as compact JSON, and the ranked
+top-K as compact JSON.
+
+    python -m benchmarks.bench_ranking --shelf 150 --prompt-token-latency 0.0002
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+import uuid
+
+
+def _timed(fn, runs):
+    samples = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - started) * 1000)
+    return statistics.median(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--shelf', type=int, default=150)
+    parser.add_argument('--read-fraction', type=float, default=0.4)
+    parser.add_argument('--top-k', type=int, default=None)
+    parser.add_argument('--latency', type=float, default=0.05, help='stub fixed latency (s)')
+    parser.add_argument('--prompt-token-latency', type=float, default=0.0002, help='stub prefill cost per prompt token (s)')
+    parser.add_argument('--runs', type=int, default=5)
+    args = parser.parse_args()
+
+    if not os.getenv('DATABASE_URL'):
+        os.environ['DATABASE_URL'] = f"sqlite:///{tempfile.mkdtemp()}/bench.db"
+    os.environ.setdefault('OPENAI_API_KEY', 'stub')
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    from benchmarks.stub_llm import StubConfig, start_stub_server
+
+    server, base_url = start_stub_server(config=StubConfig(args.latency, per_prompt_token_latency=args.prompt_token_latency))
+    os.environ['OPENAI_BASE_URL'] = base_url
+
+    from ai_services import GENRES, generate_recommendations, prompt_books, prompt_preferences
+    from database import apply_goodreads_library_changes, create_tables, get_or_create_user
+    from normalize import book_key
+    from ranking import RANKING_TOP_K, estimate_tokens, rank_books
+
+    create_tables()
+    user = get_or_create_user(f"bench-{uuid.uuid4()}")
+    shelf = [{'title': f"Shelf Book {i}", 'author': f"Author {i % 40}", 'genre': GENRES[i % len(GENRES)]}
+             for i in range(args.shelf)]
+    library = []
+    for i, book in enumerate(shelf[:int(args.shelf * args.read_fraction)]):
+        normalized_title, normalized_author = book_key(book['title'], book['author'])
+        library.append({
+            'user_id': uuid.UUID(user['id']), 'title': book['title'], 'author': book['author'],
+            'normalized_title': normalized_title, 'normalized_author': normalized_author,
+            'rating': 1 + i % 5, 'exclusive_shelf': 'read', 'date_read': None, 'row_hash': uuid.uuid4().hex
+        })
+    apply_goodreads_library_changes(library, [])
+    preferences = {
+        'authors': ['Author 3', 'Author 7'],
+        'genres': ['Fantasy', 'Mystery'],
+        'avoid': 'Horror, graphic violence',
+        'library_stats': {'books': len(library), 'ratings': {'5': 10, '4': 20}}
+    }
+
+    started = time.perf_counter()
+    candidates, stats = rank_books(preferences, shelf, user['id'], args.top_k or RANKING_TOP_K)
+    ranking_ms = (time.perf_counter() - started) * 1000
+
+    legacy_tokens = estimate_tokens(f"{shelf}{preferences}")
+    compact_tokens = estimate_tokens(prompt_books(shelf) + prompt_preferences(preferences))
+    ranked_tokens = estimate_tokens(prompt_books(candidates) + prompt_preferences(preferences))
+    all_ms = _timed(lambda: generate_recommendations(preferences, shelf), args.runs)
+    ranked_ms = _timed(lambda: generate_recommendations(preferences, candidates), args.runs)
+
+    print(f"📊 {args.shelf}-book shelf, {len(library)} already read; ranking took {ranking_ms:.1f} ms "
+          f"({stats['candidates']} candidates, {stats['dropped_read']} read, {stats['dropped_avoid']} avoided)")
+    print(f"   payload tokens: repr {legacy_tokens} -> compact {compact_tokens} -> ranked {ranked_tokens}")
+    print(f"   recommendation call p50: all books {all_ms:.0f} ms -> ranked {ranked_ms:.0f} ms")
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
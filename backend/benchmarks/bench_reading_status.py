@@ -0,0 +1,79 @@
+"""Cost of flagging /analyze recommendations with is_saved/is_read.
+
+Seeds one user with a saved reading list and a Goodreads library, then times
+analysis.with_reading_status over a typical batch of recommendations.
+
+    python -m benchmarks.bench_reading_status --saved 500 --library 5000
+    DATABASE_URL=postgresql://... python -m benchmarks.bench_reading_status
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+import uuid
+
+
+def _percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--saved', type=int, default=500, help='saved books for the user')
+    parser.add_argument('--library', type=int, default=5000, help='Goodreads rows for the user')
+    parser.add_argument('--recommendations', type=int, default=5)
+    parser.add_argument('--iterations', type=int, default=500)
+    args = parser.parse_args()
+
+    if not os.getenv('DATABASE_URL'):
+        os.environ['DATABASE_URL'] = f"sqlite:///{tempfile.mkdtemp()}/bench.db"
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+    from analysis import with_reading_status
+    from database import create_tables, get_or_create_user, save_books, apply_goodreads_library_changes
+    from normalize import book_key
+
+    create_tables()
+    user = get_or_create_user(f"bench-{uuid.uuid4()}")
+    save_books(user['id'], [{'title': f"Saved Book {i}", 'author': f"Author {i % 50}"} for i in range(args.saved)])
+    library = []
+    for i in range(args.library):
+        title, author = f"Library Book {i}", f"Author {i % 300}"
+        normalized_title, normalized_author = book_key(title, author)
+        library.append({
+            'user_id': uuid.UUID(user['id']), 'title': title, 'author': author,
+            'normalized_title': normalized_title, 'normalized_author': normalized_author,
+            'rating': i % 6, 'exclusive_shelf': 'read' if i % 3 else 'to-read', 'date_read': None,
+            'row_hash': uuid.uuid4().hex
+        })
+    apply_goodreads_library_changes(library, [])
+
+    # Mix of saved, already-read and brand-new titles, like a real recommendation list
+    recommendations = []
+    for i in range(args.recommendations):
+        if i % 3 == 0:
+            recommendations.append({'title': f"Saved Book {i}", 'author': f"Author {i % 50}"})
+        elif i % 3 == 1:
+            recommendations.append({'title': f"Library Book {i}", 'author': f"Author {i % 300}"})
+        else:
+            recommendations.append({'title': f"New Book {i}", 'author': 'Someone Else'})
+
+    with_reading_status(user['id'], recommendations)  # warm the pool and statement cache
+    samples = []
+    for _ in range(args.iterations):
+        started = time.perf_counter()
+        flagged = with_reading_status(user['id'], recommendations)
+        samples.append((time.perf_counter() - started) * 1000)
+
+    print(f"📊 with_reading_status: {args.recommendations} recommendations, "
+          f"{args.saved} saved, {args.library} library rows, {args.iterations} runs")
+    print(f"   p50 {statistics.median(samples):.2f} ms  p95 {_percentile(samples, 95):.2f} ms  "
+          f"p99 {_percentile(samples, 99):.2f} ms  max {max(samples):.2f} ms")
+    print(f"   flags: {[(rec['is_saved'], rec['is_read']) for rec in flagged]}")
+
+
+if __name__ == '__main__':
+    main()
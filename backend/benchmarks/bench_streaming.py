@@ -0,0 +1,58 @@
+"""Time to first recommendation: blocking generate_recommendations vs stream_recommendations.
+
+Both calls go to the stub LLM, which paces its reply by --per-token-latency, so the
+numbers model a slow-to-decode completion.
+
+    python -m benchmarks.bench_streaming --per-token-latency 0.02
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--latency', type=float, default=0.3, help='stub time before the first token (s)')
+    parser.add_argument('--per-token-latency', type=float, default=0.02, help='stub decode time per token (s)')
+    parser.add_argument('--books', type=int, default=25)
+    parser.add_argument('--runs', type=int, default=5)
+    args = parser.parse_args()
+
+    os.environ.setdefault('DATABASE_URL', 'sqlite://')
+    os.environ.setdefault('OPENAI_API_KEY', 'stub')
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    from benchmarks.stub_llm import StubConfig, start_stub_server
+
+    server, base_url = start_stub_server(config=StubConfig(args.latency, args.per_token_latency))
+    os.environ['OPENAI_BASE_URL'] = base_url
+
+    from ai_services import generate_recommendations, stream_recommendations
+
+    books = [{'title': f"Shelf Book {i}", 'author': f"Author {i % 9}", 'genre': 'Fantasy'} for i in range(args.books)]
+    preferences = {'genres': ['Fantasy'], 'authors': ['Author 3']}
+
+    blocking, first, streamed_total = [], [], []
+    for _ in range(args.runs):
+        started = time.perf_counter()
+        generate_recommendations(preferences, books)
+        blocking.append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        first_at = None
+        for _ in stream_recommendations(preferences, books):
+            if first_at is None:
+                first_at = time.perf_counter() - started
+        first.append(first_at)
+        streamed_total.append(time.perf_counter() - started)
+
+    ms = lambda samples: f"{statistics.median(samples) * 1000:.0f} ms"
+    print(f"📊 {args.runs} runs, stub latency {args.latency}s + {args.per_token_latency}s/token")
+    print(f"   blocking:  first recommendation {ms(blocking)} (= total)")
+    print(f"   streaming: first recommendation {ms(first)}, total {ms(streamed_total)}")
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
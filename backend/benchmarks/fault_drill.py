@@ -0,0 +1,244 @@
+"""Fault drills for the model call layer (llm_client + resilience.py) against the fault-injecting stub.
+
+Each drill scripts the stub (errors, Retry-After, hangs), makes real calls through llm_client
+(sync, async and streamed) or the /analyze route, and checks what came back, how long it
+took and how many requests reached the upstream. Exits 1 if any drill fails.
+
+    python -m benchmarks.fault_drill
+    python -m benchmarks.fault_drill --only retry_after,circuit_breaker
+"""
+import argparse
+import asyncio
+import io
+import json
+import os
+import sys
+import tempfile
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DRILLS = []
+
+
+def drill(function):
+    DRILLS.append(function)
+    return function
+
+
+class Timer:
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.seconds = time.perf_counter() - self.started
+
+
+def _request():
+    return dict(model='gpt-4.1', messages=[{'role': 'user', 'content': 'Top genres?'}],
+                response_format={'type': 'json_schema', 'json_schema': {'name': 'GenreList', 'schema': {}}})
+
+
+def _expect(condition: bool, message: str):
+    if not condition:
+        raise AssertionError(message)
+
+
+def _raises(call, error_type):
+    try:
+        call()
+    except error_type as e:
+        return e
+    raise AssertionError(f"expected {error_type.__name__}")
+
+
+@drill
+def retry_after(ctx):
+    """Two 429s with Retry-After: 0.3 are waited out and the third attempt answers"""
+    ctx.fault(script=['error', 'error'], error_status=429, retry_after=0.3)
+    with Timer() as timer:
+        ctx.llm.chat_completion(**_request())
+    _expect(ctx.stub.requests == 3, f"{ctx.stub.requests} upstream requests, expected 3")
+    _expect(timer.seconds >= 0.6, f"answered after {timer.seconds:.2f}s, before Retry-After allowed")
+
+
+@drill
+def retries_exhausted(ctx):
+    """A persistent 503 gives up after 1 + OPENAI_MAX_RETRIES attempts with UpstreamUnavailable (503)"""
+    ctx.fault(error_rate=1.0, error_status=503)
+    error = _raises(lambda: ctx.llm.chat_completion(**_request()), ctx.resilience.UpstreamUnavailable)
+    _expect(error.status_code == 503, f"status {error.status_code}")
+    _expect(ctx.stub.requests == ctx.llm.policy.retries + 1, f"{ctx.stub.requests} upstream requests")
+
+
+@drill
+def not_retried(ctx):
+    """A 400 is the caller's fault: raised at once, never retried"""
+    import openai
+    ctx.fault(script=['error'], error_status=400)
+    _raises(lambda: ctx.llm.chat_completion(**_request()), openai.BadRequestError)
+    _expect(ctx.stub.requests == 1, f"{ctx.stub.requests} upstream requests")
+
+
+@drill
+def deadline(ctx):
+    """A hung upstream is abandoned when the request's 1 s budget runs out (DeadlineExceeded, 504)"""
+    ctx.fault(hang_rate=1.0, hang_seconds=3)
+    ctx.resilience.start_budget(1.0)
+    with Timer() as timer:
+        error = _raises(lambda: ctx.llm.chat_completion(**_request()), ctx.resilience.DeadlineExceeded)
+    _expect(error.status_code == 504, f"status {error.status_code}")
+    _expect(timer.seconds < 1.5, f"gave up after {timer.seconds:.2f}s")
+
+
+@drill
+def hedge(ctx):
+    """A stalled first attempt is raced by a duplicate after OPENAI_HEDGE_AFTER_SECONDS, which wins"""
+    ctx.fault(script=['hang'], hang_seconds=2)
+    ctx.llm.policy.hedge_after = 0.2
+    won = ctx.metric('upstream_hedges_total', outcome='won')
+    with Timer() as timer:
+        ctx.llm.chat_completion(**_request())
+    _expect(timer.seconds < 1, f"answered after {timer.seconds:.2f}s")
+    _expect(ctx.metric('upstream_hedges_total', outcome='won') == won + 1, "hedge not counted as won")
+
+
+@drill
+def circuit_breaker(ctx):
+    """Three failed calls open the circuit: the next fails fast without reaching the upstream; after the
+    reset time one probe goes through and, answered, closes it"""
+    breaker = ctx.llm.policy.breaker
+    breaker.failures, breaker.reset_seconds = 3, 0.5
+    ctx.llm.policy.retries = 0
+    ctx.fault(error_rate=1.0, error_status=500)
+    for _ in range(3):
+        _raises(lambda: ctx.llm.chat_completion(**_request()), ctx.resilience.UpstreamUnavailable)
+    _expect(breaker.state == 'open', f"breaker {breaker.state}")
+    _raises(lambda: ctx.llm.chat_completion(**_request()), ctx.resilience.CircuitOpen)
+    _expect(ctx.stub.requests == 3, f"{ctx.stub.requests} upstream requests while open")
+    time.sleep(0.5)
+    ctx.fault()
+    ctx.llm.chat_completion(**_request())
+    _expect(breaker.state == 'closed', f"breaker {breaker.state} after a good probe")
+
+
+@drill
+def stream_retry(ctx):
+    """A streamed call whose opening request fails is retried before anything is yielded"""
+    ctx.fault(script=['error'], error_status=502)
+    content = ''.join(ctx.llm.chat_completion_stream(**_request()))
+    _expect(json.loads(content).get('genres'), f"streamed {content!r}")
+    _expect(ctx.stub.requests == 2, f"{ctx.stub.requests} upstream requests")
+
+
+@drill
+def async_retry_and_deadline(ctx):
+    """The async client retries a 503, and a hang is cut off by the budget (the whole attempt, not per read)"""
+    async def run():
+        ctx.fault(script=['error'], error_status=503)
+        await ctx.llm.achat_completion(**_request())
+        _expect(ctx.stub.requests == 2, f"{ctx.stub.requests} upstream requests")
+        ctx.fault(hang_rate=1.0, hang_seconds=3)
+        ctx.resilience.start_budget(1.0)
+        with Timer() as timer:
+            try:
+                await ctx.llm.achat_completion(**_request())
+                raise AssertionError("expected DeadlineExceeded")
+            except ctx.resilience.DeadlineExceeded:
+                pass
+        _expect(timer.seconds < 1.5, f"gave up after {timer.seconds:.2f}s")
+    asyncio.run(run())
+
+
+@drill
+def async_hedge(ctx):
+    """Async hedging: the duplicate wins and the stalled attempt is cancelled"""
+    async def run():
+        ctx.fault(script=['hang'], hang_seconds=2)
+        ctx.llm.policy.hedge_after = 0.2
+        with Timer() as timer:
+            await ctx.llm.achat_completion(**_request())
+        _expect(timer.seconds < 1, f"answered after {timer.seconds:.2f}s")
+    asyncio.run(run())
+
+
+@drill
+def analyze_route(ctx):
+    """/analyze with the upstream down answers 503 with Retry-After instead of a 500"""
+    from benchmarks.fixtures import shelf_photo
+    ctx.fault(error_rate=1.0, error_status=503, retry_after=2)
+    ctx.llm.policy.retries = 1
+    response = ctx.app.test_client().post('/analyze', content_type='multipart/form-data', headers={'X-Device-ID': 'fault-drill'},
+                                          data={'image': (io.BytesIO(shelf_photo(int(time.time()))), 'shelf.jpg'),
+                                                'preferences': json.dumps({'genres': ['Fantasy']})})
+    _expect(response.status_code == 503, f"status {response.status_code}")
+    _expect(response.headers.get('Retry-After') == '2', f"Retry-After {response.headers.get('Retry-After')}")
+
+
+class Context:
+    def __init__(self, stub, llm, resilience, app):
+        self.stub = stub.config
+        self.llm = llm
+        self.resilience = resilience
+        self.app = app
+        self.defaults = {attr: getattr(llm.policy, attr) for attr in ('retries', 'hedge_after')}
+
+    def fault(self, **settings):
+        """Reset the stub to healthy, then apply `settings` (StubConfig fault attributes)"""
+        from benchmarks.stub_llm import StubConfig
+        healthy = StubConfig()
+        for attr in ('script', 'error_rate', 'error_status', 'retry_after', 'hang_rate', 'hang_seconds'):
+            setattr(self.stub, attr, settings.get(attr, getattr(healthy, attr)))
+        self.stub.requests = 0
+
+    def reset(self):
+        self.fault()
+        for attr, value in self.defaults.items():
+            setattr(self.llm.policy, attr, value)
+        self.llm.policy.breaker.failures = 0
+        self.resilience.start_budget(0)
+
+    def metric(self, name: str, **labels) -> float:
+        from metrics import expose
+        prefix = f"{os.getenv('METRICS_PREFIX', 'bookscanner')}_{name}"
+        wanted = [f'{key}="{value}"' for key, value in labels.items()]
+        return sum(float(line.rpartition(' ')[2]) for line in expose().splitlines()
+                   if line.startswith(prefix + '{') and all(label in line for label in wanted))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--only', help='comma-separated drill names')
+    args = parser.parse_args()
+
+    sys.path.insert(0, BACKEND_DIR)
+    from benchmarks.stub_llm import StubConfig, start_stub_server
+    stub, base_url = start_stub_server(config=StubConfig(latency=0.05))
+    workdir = tempfile.mkdtemp(prefix='fault-drill-')
+    os.environ.update(OPENAI_BASE_URL=base_url, OPENAI_API_KEY='stub', LOG_LEVEL=os.getenv('LOG_LEVEL', 'ERROR'),
+                      DATABASE_URL=os.getenv('DATABASE_URL', f"sqlite:///{os.path.join(workdir, 'drill.db')}"),
+                      OPENAI_RETRY_BASE_SECONDS='0.05', OPENAI_BREAKER_FAILURES='0')
+
+    import llm_client
+    import resilience
+    from app import app
+    ctx = Context(stub, llm_client, resilience, app)
+
+    selected = [d for d in DRILLS if not args.only or d.__name__ in args.only.split(',')]
+    failed = 0
+    for function in selected:
+        ctx.reset()
+        try:
+            with Timer() as timer:
+                function(ctx)
+            print(f"✅ {function.__name__:<26} {timer.seconds:5.2f}s  {function.__doc__.splitlines()[0]}")
+        except Exception as e:
+            failed += 1
+            print(f"❌ {function.__name__:<26} {type(e).__name__}: {e}")
+    stub.shutdown()
+    print(f"{len(selected) - failed}/{len(selected)} drills passed")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
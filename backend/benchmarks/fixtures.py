@@ -0,0 +1,92 @@
+"""Deterministic benchmark inputs: shelf photos, Goodreads exports and a seeded database.
+
+Everything is generated from a seed, so two runs of a benchmark send byte-identical requests.
+"""
+import csv
+import io
+import random
+
+# Shelf photo sizes: a resized web upload vs a straight-from-the-phone 12 MP shot
+PHOTO_SIZES = {'small': (640, 480), 'medium': (1600, 1200), 'large': (4032, 3024)}
+# Goodreads export sizes (rows): a casual reader, a heavy one, and the long tail
+GOODREADS_SIZES = {'small': 100, 'medium': 2000, 'large': 20000}
+GOODREADS_HEADER = [
+    'Book Id', 'Title', 'Author', 'Author l-f', 'Additional Authors', 'ISBN', 'ISBN13', 'My Rating',
+    'Average Rating', 'Publisher', 'Binding', 'Number of Pages', 'Year Published', 'Original Publication Year',
+    'Date Read', 'Date Added', 'Bookshelves', 'Bookshelves with positions', 'Exclusive Shelf', 'My Review',
+    'Spoiler', 'Private Notes', 'Read Count', 'Owned Copies',
+]
+FIXTURE_DEVICE_PREFIX = 'bench-fixture-'
+
+
+def shelf_photo(seed: int, size: str = 'small') -> bytes:
+    """A JPEG of randomly coloured 'spines' plus noise; every seed has its own content and perceptual hash"""
+    import numpy as np
+    from PIL import Image
+    width, height = PHOTO_SIZES[size]
+    rng = np.random.default_rng(seed)
+    spines = rng.integers(20, 235, (1, width // 16 + 1, 3), dtype=np.uint8).repeat(16, axis=1)[:, :width]
+    pixels = spines.repeat(height, axis=0).astype(np.int16)
+    pixels += rng.integers(-40, 40, (height, width, 3), dtype=np.int16)
+    # Coarse random blocks make the 9x8 dHash differ between seeds, not just the bytes
+    blocks = rng.integers(-60, 60, (8, 9, 1), dtype=np.int16)
+    pixels += np.kron(blocks, np.ones((height // 8 + 1, width // 9 + 1, 1), dtype=np.int16))[:height, :width]
+    buffer = io.BytesIO()
+    Image.fromarray(pixels.clip(0, 255).astype(np.uint8)).save(buffer, 'JPEG', quality=85)
+    return buffer.getvalue()
+
+
+def goodreads_csv(rows: int, seed: int = 0) -> bytes:
+    """A Goodreads library export with every column the real one has (reviews included)"""
+    rng = random.Random(seed)
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(GOODREADS_HEADER)
+    for i in range(rows):
+        shelf = rng.choices(['read', 'to-read', 'currently-reading'], weights=[70, 25, 5])[0]
+        rating = rng.choice([0, 1, 2, 3, 4, 4, 5, 5]) if shelf == 'read' else 0
+        author = f"Author {rng.randrange(max(rows // 8, 1))}"
+        year = rng.randrange(1950, 2024)
+        writer.writerow([
+            100000 + i, f"Fixture Book {seed}-{i}", author, ', '.join(reversed(author.split(' ', 1))), '',
+            f'="{rng.randrange(10**9, 10**10)}"', f'="978{rng.randrange(10**9, 10**10)}"', rating,
+            f"{rng.uniform(3, 4.8):.2f}", 'Fixture House', 'Paperback', rng.randrange(90, 900), year, year,
+            f"{rng.randrange(2015, 2025)}/{rng.randrange(1, 13):02d}/{rng.randrange(1, 29):02d}" if shelf == 'read' else '',
+            f"{rng.randrange(2012, 2025)}/{rng.randrange(1, 13):02d}/{rng.randrange(1, 29):02d}",
+            '', f"{shelf} (#{i})", shelf, ' '.join(['Lorem ipsum dolor sit amet.'] * rng.randrange(0, 40)),
+            '', '', int(shelf == 'read'), 0,
+        ])
+    return buffer.getvalue().encode('utf-8')
+
+
+def fixture_device_id(index: int) -> str:
+    return f"{FIXTURE_DEVICE_PREFIX}{index}"
+
+
+def seed_database(users: int, sessions_per_user: int = 30, saved_per_user: int = 40, library_rows: int = 200):
+    """Fixture users with analysis history, a reading list and a synced Goodreads library.
+
+    Uses the app's own helpers against whatever DATABASE_URL points at (SQLite file or Postgres),
+    so it must run after that is set. Idempotent: users that already have history are skipped.
+    """
+    from database import create_tables, get_or_create_user, get_user_analysis_history, save_analysis_session, save_books, unit_of_work
+    from goodreads_library import GoodreadsLibraryImport
+    from ai_services import iter_goodreads_chunks
+
+    create_tables()
+    for index in range(users):
+        user = get_or_create_user(fixture_device_id(index))
+        if get_user_analysis_history(user['id'], limit=1, summary=True)[0]:
+            continue
+        detected = [{'title': f"Stub Book {i}", 'author': f"Author {i % 17}", 'genre': 'Fantasy'} for i in range(25)]
+        recommendations = [{'title': f"Stub Book {i}", 'author': f"Author {i % 17}", 'matchScore': 90 - i,
+                            'matchReason': 'Fixture.'} for i in range(5)]
+        for _ in range(sessions_per_user):
+            save_analysis_session(user['id'], detected, recommendations)
+        save_books(user['id'], [{'title': f"Saved Book {i}", 'author': f"Author {i % 23}", 'match_score': 80}
+                                for i in range(saved_per_user)])
+        with unit_of_work():
+            library = GoodreadsLibraryImport(user['id'])
+            for chunk in iter_goodreads_chunks(io.BytesIO(goodreads_csv(library_rows, seed=index))):
+                library.add_chunk(chunk)
+            library.finish()
@@ -0,0 +1,122 @@
+"""Shared plumbing for the HTTP load benchmarks: server subprocesses, a load loop and /metrics scraping."""
+import asyncio
+import os
+import statistics
+import subprocess
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SERVERS = {
+    # One worker each: the numbers are per worker process, which is what scales with --workers
+    'wsgi': lambda port, threads: ['gunicorn', 'app:app', '-w', '1', '-k', 'gthread', '--threads', str(threads),
+                                   '-b', f"127.0.0.1:{port}", '--timeout', '300'],
+    'asgi': lambda port, threads: ['uvicorn', 'asgi:app', '--workers', '1', '--port', str(port), '--log-level', 'warning'],
+}
+
+
+class Server:
+    """A server under test, started from the backend directory with its own environment"""
+
+    def __init__(self, kind: str, port: int, env: dict, threads: int = 8, log=None):
+        self.kind = kind
+        self.port = port
+        self.base_url = f"http://127.0.0.1:{port}"
+        self._command = SERVERS[kind](port, threads)
+        self._env = env
+        self._log = log if log is not None else subprocess.DEVNULL
+        self.process = None
+
+    def __enter__(self):
+        import httpx
+        self.process = subprocess.Popen(self._command, cwd=BACKEND_DIR, env=self._env, stdout=self._log,
+                                        stderr=subprocess.STDOUT)
+        deadline = time.time() + 60
+        while time.time() < deadline:
+            if self.process.poll() is not None:
+                raise RuntimeError(f"{self._command[0]} exited with {self.process.returncode}; see the server log")
+            try:
+                if httpx.get(f"{self.base_url}/health", timeout=1).status_code == 200:
+                    return self
+            except httpx.HTTPError:
+                time.sleep(0.2)
+        self.process.kill()
+        raise RuntimeError(f"{self._command[0]} did not come up on port {self.port}")
+
+    def __exit__(self, *exc):
+        self.process.terminate()
+        try:
+            self.process.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+
+    def metrics(self) -> dict:
+        """{sample name with labels: value} from the server's /metrics"""
+        import httpx
+        samples = {}
+        for line in httpx.get(f"{self.base_url}/metrics", timeout=10).text.splitlines():
+            if line and not line.startswith('#'):
+                name, _, value = line.rpartition(' ')
+                samples[name] = float(value)
+        return samples
+
+
+def metric_total(samples: dict, name: str) -> float:
+    """Sum of every labelled series of one metric"""
+    return sum(value for key, value in samples.items() if key == name or key.startswith(name + '{'))
+
+
+class LoadResult:
+    def __init__(self, wall: float, latencies: list, statuses: dict):
+        self.wall = wall
+        self.latencies = sorted(latencies)
+        self.statuses = statuses
+
+    @property
+    def requests(self) -> int:
+        return len(self.latencies)
+
+    @property
+    def errors(self) -> int:
+        return sum(count for status, count in self.statuses.items() if status >= 500 or status == 0)
+
+    def percentile(self, q: float) -> float:
+        return self.latencies[min(len(self.latencies) - 1, int(len(self.latencies) * q))]
+
+    def summary(self) -> dict:
+        return {
+            'requests': self.requests,
+            'errors': self.errors,
+            'statuses': {str(status): count for status, count in sorted(self.statuses.items())},
+            'throughput_rps': round(self.requests / self.wall, 2),
+            'p50_ms': round(statistics.median(self.latencies) * 1000, 1),
+            'p99_ms': round(self.percentile(0.99) * 1000, 1),
+        }
+
+
+async def _load(base_url: str, requests: int, concurrency: int, make_request) -> LoadResult:
+    """make_request(i) -> (method, path, httpx request kwargs); `concurrency` clients loop until `requests` are sent"""
+    import httpx
+    latencies, statuses = [], {}
+    indexes = iter(range(requests))
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=300) as client:
+        async def worker():
+            for i in indexes:
+                method, path, kwargs = make_request(i)
+                started = time.perf_counter()
+                try:
+                    status = (await client.request(method, path, **kwargs)).status_code
+                except httpx.HTTPError:
+                    status = 0
+                latencies.append(time.perf_counter() - started)
+                statuses[status] = statuses.get(status, 0) + 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        return LoadResult(time.perf_counter() - started, latencies, statuses)
+
+
+def run_load(base_url: str, requests: int, concurrency: int, make_request) -> LoadResult:
+    return asyncio.run(_load(base_url, requests, concurrency, make_request))
@@ -0,0 +1,222 @@
+"""Local stand-in for the OpenAI chat-completions API.
+
+Answers the structured-output calls ai_services makes (BookList, RecommendationList,
+GenreList, AvoidElements) with plausible canned data after a configurable delay, as one
+JSON body or, for stream=True requests, as chat.completion.chunk server-sent events.
+
+Faults can be injected: a script for the next requests in order ('error', 'hang', 'ok'),
+then a share of errors (API-shaped JSON with --error-status and an optional Retry-After)
+and of hangs (no answer for --hang-seconds), drawn from a seeded RNG so runs repeat.
+
+    python -m benchmarks.stub_llm --port 8765 --latency 0.5
+    python -m benchmarks.stub_llm --error-rate 0.2 --error-status 429 --retry-after 1 --hang-rate 0.05
+    OPENAI_BASE_URL=http://127.0.0.1:8765/v1 OPENAI_API_KEY=stub gunicorn app:app
+"""
+import argparse
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+_STREAM_DELTA_CHARS = 16  # ~4 tokens per streamed delta
+_TITLE_PATTERN = re.compile(r"""['"]title['"]:\s*['"](.+?)['"],\s*['"]author['"]:\s*['"](.+?)['"]""")
+
+
+class StubConfig:
+    def __init__(self, latency: float = 0.0, per_token_latency: float = 0.0, books: int = 40,
+                 per_prompt_token_latency: float = 0.0, recommendations: int = 5, script=(), error_rate: float = 0.0,
+                 error_status: int = 503, retry_after: float = None, hang_rate: float = 0.0, hang_seconds: float = 30.0,
+                 seed: int = 0):
+        self.latency = latency                      # fixed seconds before answering
+        self.per_token_latency = per_token_latency  # extra seconds per completion token
+        self.per_prompt_token_latency = per_prompt_token_latency  # extra seconds per prompt token (prefill)
+        self.books = books                          # books "seen" on every shelf
+        self.recommendations = recommendations      # recommendations per answer (at most the candidates sent)
+        self.script = list(script)                  # faults for the next requests, in order: 'error', 'hang' or 'ok'
+        self.error_rate = error_rate                # then: share of requests answered with an error
+        self.error_status = error_status
+        self.retry_after = retry_after              # Retry-After seconds sent with injected errors (None = no header)
+        self.hang_rate = hang_rate                  # and share of requests that stall for hang_seconds
+        self.hang_seconds = hang_seconds
+        self.requests = 0
+        self.faults = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def next_fault(self):
+        """Count a request and pick its fault: 'error', 'hang' or None"""
+        with self._lock:
+            self.requests += 1
+            if self.script:
+                fault = self.script.pop(0)
+            elif self._random.random() < self.error_rate:
+                fault = 'error'
+            elif self._random.random() < self.hang_rate:
+                fault = 'hang'
+            else:
+                fault = None
+            fault = None if fault == 'ok' else fault
+            self.faults += fault is not None
+            return fault
+
+
+def _books(count: int):
+    return [{'title': f"Stub Book {i}", 'author': f"Author {i % 17}", 'genre': 'Fantasy'} for i in range(count)]
+
+
+def _answer(schema_name: str, body: dict, config: StubConfig):
+    prompt = json.dumps(body.get('messages', []))
+    if schema_name == 'BookList':
+        return {'books': _books(config.books)}
+    if schema_name == 'RecommendationList':
+        candidates = _TITLE_PATTERN.findall(prompt.replace('\\"', '"')) or [(b['title'], b['author']) for b in _books(config.recommendations)]
+        return {'recommendations': [
+            {'title': title, 'author': author, 'matchScore': max(10, 90 - i * 5), 'matchReason': f"Stub reason {i}."}
+            for i, (title, author) in enumerate(candidates[:config.recommendations])
+        ]}
+    if schema_name == 'GenreList':
+        return {'genres': ['Fantasy', 'Sci-Fi', 'Mystery', 'Historical', 'Literary Fiction']}
+    if schema_name == 'AvoidElements':
+        return {'elements': 'Violence, Sad endings'}
+    return {}
+
+
+def _make_handler(config: StubConfig):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'  # keep-alive, like the real API
+
+        def log_message(self, *args):
+            pass
+
+        def do_POST(self):
+            if not self.path.rstrip('/').endswith('/chat/completions'):
+                self.send_error(404)
+                return
+            raw = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+            body = json.loads(raw or b'{}')
+            schema_name = (body.get('response_format') or {}).get('json_schema', {}).get('name', '')
+            content = json.dumps(_answer(schema_name, body, config))
+            completion_tokens = max(1, len(content) // 4)
+            prompt_tokens = len(raw) // 4
+            fault = config.next_fault()
+            if fault == 'error':
+                self._send_error()
+                return
+            if fault == 'hang':
+                time.sleep(config.hang_seconds)  # the client has usually timed out and gone by now
+            try:
+                self._respond(body, content, completion_tokens, prompt_tokens)
+            except (BrokenPipeError, ConnectionResetError):
+                pass
+
+        def _send_error(self):
+            """An OpenAI-shaped error body, as the real API sends for 429/5xx"""
+            data = json.dumps({'error': {'message': f"Injected fault ({config.error_status})", 'type': 'stub_fault',
+                                         'param': None, 'code': None}}).encode()
+            self.send_response(config.error_status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(data)))
+            if config.retry_after is not None:
+                self.send_header('Retry-After', f"{config.retry_after:g}")
+            self.end_headers()
+            self.wfile.write(data)
+
+        def _respond(self, body: dict, content: str, completion_tokens: int, prompt_tokens: int):
+            if body.get('stream'):
+                self._stream(body, content, prompt_tokens)
+                return
+            time.sleep(config.latency + config.per_token_latency * completion_tokens
+                       + config.per_prompt_token_latency * prompt_tokens)
+
+            self._send_json({
+                'id': f"chatcmpl-{uuid.uuid4().hex}",
+                'object': 'chat.completion',
+                'created': int(time.time()),
+                'model': body.get('model', 'stub'),
+                'choices': [{'index': 0, 'finish_reason': 'stop', 'message': {'role': 'assistant', 'content': content}}],
+                'usage': {
+                    'prompt_tokens': prompt_tokens,
+                    'completion_tokens': completion_tokens,
+                    'total_tokens': prompt_tokens + completion_tokens
+                }
+            })
+
+        def _stream(self, body: dict, content: str, prompt_tokens: int):
+            """chat.completion.chunk events, one ~4-token delta at a time, paced like the blocking reply"""
+            completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/event-stream')
+            self.send_header('Transfer-Encoding', 'chunked')
+            self.end_headers()
+            time.sleep(config.latency + config.per_prompt_token_latency * prompt_tokens)
+
+            def chunk(delta: dict, finish_reason=None):
+                return {'id': completion_id, 'object': 'chat.completion.chunk', 'created': int(time.time()),
+                        'model': body.get('model', 'stub'),
+                        'choices': [{'index': 0, 'delta': delta, 'finish_reason': finish_reason}]}
+
+            events = [chunk({'role': 'assistant', 'content': ''})]
+            events += [chunk({'content': content[i:i + _STREAM_DELTA_CHARS]}) for i in range(0, len(content), _STREAM_DELTA_CHARS)]
+            events.append(chunk({}, 'stop'))
+            for event in events:
+                time.sleep(config.per_token_latency * _STREAM_DELTA_CHARS / 4)
+                self._write_chunk(f"data: {json.dumps(event)}\n\n".encode())
+            self._write_chunk(b"data: [DONE]\n\n")
+            self._write_chunk(b"")
+
+        def _write_chunk(self, data: bytes):
+            self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+            self.wfile.flush()
+
+        def _send_json(self, payload, status=200):
+            data = json.dumps(payload).encode()
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+    return Handler
+
+
+def start_stub_server(host: str = '127.0.0.1', port: int = 0, config: StubConfig = None):
+    """Serve in a daemon thread; returns (server, base_url). Use port=0 for a free port."""
+    config = config or StubConfig()
+    server = ThreadingHTTPServer((host, port), _make_handler(config))
+    server.daemon_threads = True
+    server.config = config
+    threading.Thread(target=server.serve_forever, name='stub-llm', daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}/v1"
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--latency', type=float, default=0.5)
+    parser.add_argument('--per-token-latency', type=float, default=0.0)
+    parser.add_argument('--per-prompt-token-latency', type=float, default=0.0)
+    parser.add_argument('--books', type=int, default=40)
+    parser.add_argument('--recommendations', type=int, default=5)
+    parser.add_argument('--fault-script', default='', help="faults for the first requests, e.g. error,error,hang,ok")
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--error-status', type=int, default=503)
+    parser.add_argument('--retry-after', type=float, help='Retry-After seconds on injected errors')
+    parser.add_argument('--hang-rate', type=float, default=0.0)
+    parser.add_argument('--hang-seconds', type=float, default=30.0)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    server, base_url = start_stub_server(args.host, args.port, StubConfig(
+        args.latency, args.per_token_latency, args.books, args.per_prompt_token_latency, args.recommendations,
+        script=[fault for fault in args.fault_script.split(',') if fault], error_rate=args.error_rate,
+        error_status=args.error_status, retry_after=args.retry_after, hang_rate=args.hang_rate,
+        hang_seconds=args.hang_seconds, seed=args.seed))
+    print(f"🤖 Stub LLM listening on {base_url}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
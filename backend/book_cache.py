@@ -0,0 +1,69 @@
+import logging
+import os
+import threading
+
+from database import upsert_book_cache, get_book_cache_metadata, purge_expired_book_cache
+from normalize import book_key
+
+logger = logging.getLogger(__name__)
+
+# Per-book metadata store backed by the book_cache table
+BOOK_CACHE_TTL_SECONDS = int(os.getenv('BOOK_CACHE_TTL_SECONDS', 30 * 24 * 60 * 60))
+BOOK_CACHE_SWEEP_INTERVAL_SECONDS = int(os.getenv('BOOK_CACHE_SWEEP_INTERVAL_SECONDS', 15 * 60))
+BOOK_CACHE_SWEEP_BATCH_SIZE = int(os.getenv('BOOK_CACHE_SWEEP_BATCH_SIZE', 500))
+
+_sweeper = None
+_sweeper_lock = threading.Lock()
+
+
+def remember_detected_books(books: list):
+    """Bulk upsert every detected book; failures are logged, never raised"""
+    try:
+        return upsert_book_cache(books, BOOK_CACHE_TTL_SECONDS)
+    except Exception as e:
+        logger.warning("⚠️  Book cache upsert failed: %s", e)
+        return 0
+
+
+def enrich_with_metadata(books: list):
+    """Return copies of books with cached metadata (e.g. genre) filled in, using one batched query"""
+    try:
+        metadata = get_book_cache_metadata(books)
+    except Exception as e:
+        logger.warning("⚠️  Book cache lookup failed: %s", e)
+        metadata = {}
+
+    enriched = []
+    for book in books:
+        cached = metadata.get(book_key(book.get('title', ''), book.get('author', '')), {})
+        # Keep the spelling the model just returned; only fill in what it left out
+        enriched.append({**cached, **{k: v for k, v in book.items() if v not in (None, '')}})
+    return enriched
+
+
+def _sweep_forever(interval_seconds: int, batch_size: int, stop_event: threading.Event):
+    while not stop_event.wait(interval_seconds):
+        try:
+            deleted = purge_expired_book_cache(batch_size)
+            if deleted:
+                logger.info("🧹 Purged %s expired book cache rows", deleted)
+        except Exception as e:
+            logger.warning("⚠️  Book cache sweep failed: %s", e)
+
+
+def start_sweeper(interval_seconds: int = BOOK_CACHE_SWEEP_INTERVAL_SECONDS, batch_size: int = BOOK_CACHE_SWEEP_BATCH_SIZE):
+    """Start the background thread that deletes expired rows (once per process)"""
+    global _sweeper
+    with _sweeper_lock:
+        if _sweeper is not None:
+            return _sweeper
+        stop_event = threading.Event()
+        thread = threading.Thread(
+            target=_sweep_forever,
+            args=(interval_seconds, batch_size, stop_event),
+            name='book-cache-sweeper',
+            daemon=True
+        )
+        thread.start()
+        _sweeper = stop_event
+        return stop_event
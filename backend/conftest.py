@@ -0,0 +1,47 @@
+"""Shared pytest setup: a throwaway SQLite database and the stub model API (benchmarks/stub_llm.py).
+
+Settings are read at import time, so the environment is filled in here, before any test module
+imports the app.
+"""
+import os
+import tempfile
+
+import pytest
+
+_workdir = tempfile.mkdtemp(prefix='bookscanner-tests-')
+os.environ.setdefault('DATABASE_URL', f"sqlite:///{os.path.join(_workdir, 'test.db')}")
+os.environ.setdefault('OPENAI_API_KEY', 'stub')
+os.environ.setdefault('LOG_LEVEL', 'WARNING')
+os.environ.setdefault('OPENAI_RETRY_BASE_SECONDS', '0.05')
+
+
+@pytest.fixture(scope='session')
+def stub_llm():
+    """The stub model API for the whole session; tests tune `stub_llm.config` (see StubConfig)"""
+    from benchmarks.stub_llm import StubConfig, start_stub_server
+    import llm_client
+    server, base_url = start_stub_server(config=StubConfig())
+    previous = os.environ.get('OPENAI_BASE_URL')
+    os.environ['OPENAI_BASE_URL'] = base_url
+    llm_client.close_clients()
+    yield server
+    server.shutdown()
+    llm_client.close_clients()
+    if previous is None:
+        os.environ.pop('OPENAI_BASE_URL', None)
+    else:
+        os.environ['OPENAI_BASE_URL'] = previous
+
+
+@pytest.fixture
+def stub(stub_llm):
+    """The stub, reset to answer promptly and without faults; no request budget left over afterwards"""
+    import resilience
+    from benchmarks.stub_llm import StubConfig
+    healthy = StubConfig()
+    for attr in ('latency', 'per_token_latency', 'per_prompt_token_latency', 'script', 'error_rate', 'error_status',
+                 'retry_after', 'hang_rate', 'hang_seconds'):
+        setattr(stub_llm.config, attr, getattr(healthy, attr))
+    stub_llm.config.requests = 0
+    yield stub_llm.config
+    resilience.start_budget(0)
@@ -1,23 +1,199 @@
-from sqlalchemy import create_engine, Column, Integer, String, Text, DateTime, JSON
-from sqlalchemy.types import Boolean
+from sqlalchemy import create_engine, event, Column, Integer, String, Text, Date, DateTime, JSON, Index, bindparam, false, func, select, true, tuple_, union_all, insert, update
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import QueuePool
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.types import Boolean, TypeDecorator, Uuid
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
-from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy.orm import Session, sessionmaker
+import logging
+import time
 import uuid
-from datetime import datetime, timezone
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime, timezone, timedelta
 import os
 from dotenv import load_dotenv
+from metrics import counter, histogram, instrument_module, register_collector
+from normalize import book_key
+
+logger = logging.getLogger(__name__)
 
 load_dotenv()
 
 DATABASE_URL = os.getenv("DATABASE_URL")
 
-engine = create_engine(DATABASE_URL)
+# Pool sizing is per gunicorn worker: workers x (DB_POOL_SIZE + DB_MAX_OVERFLOW) must stay
+# below the server's max_connections (small managed Postgres plans allow ~25-100)
+DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', 5))
+DB_MAX_OVERFLOW = int(os.getenv('DB_MAX_OVERFLOW', 5))
+DB_POOL_TIMEOUT_SECONDS = float(os.getenv('DB_POOL_TIMEOUT_SECONDS', 10))
+DB_POOL_RECYCLE_SECONDS = int(os.getenv('DB_POOL_RECYCLE_SECONDS', 1800))  # below typical proxy idle timeouts
+DB_POOL_PRE_PING = os.getenv('DB_POOL_PRE_PING', 'true').lower() in ('1', 'true', 'yes')
+DB_STATEMENT_TIMEOUT_MS = int(os.getenv('DB_STATEMENT_TIMEOUT_MS', 15000))  # Postgres only; 0 disables
+
+pool_checkout_seconds = histogram('db_pool_checkout_seconds', 'Wait for a pooled database connection')
+pool_hold_seconds = histogram('db_pool_hold_seconds', 'Time a database connection stays checked out')
+pool_timeouts = counter('db_pool_timeouts_total', 'Checkouts that gave up after DB_POOL_TIMEOUT_SECONDS')
+db_statements = counter('db_statements_total', 'SQL statements executed, by verb', ('verb',))
+
+
+class TimedQueuePool(QueuePool):
+    """QueuePool that records how long each checkout waited for a free connection"""
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        except PoolTimeoutError:
+            pool_timeouts.inc()
+            raise
+        finally:
+            pool_checkout_seconds.observe(time.perf_counter() - started)
+
+
+def _engine_options(url: str) -> dict:
+    options = {'pool_pre_ping': DB_POOL_PRE_PING, 'pool_recycle': DB_POOL_RECYCLE_SECONDS}
+    parsed = make_url(url)
+    if parsed.get_backend_name() == 'sqlite' and parsed.database in (None, '', ':memory:'):
+        return options  # in-memory SQLite keeps its per-thread pool
+    options.update(poolclass=TimedQueuePool, pool_size=DB_POOL_SIZE, max_overflow=DB_MAX_OVERFLOW,
+                   pool_timeout=DB_POOL_TIMEOUT_SECONDS)
+    if parsed.get_backend_name() == 'postgresql' and DB_STATEMENT_TIMEOUT_MS:
+        options['connect_args'] = {'options': f"-c statement_timeout={DB_STATEMENT_TIMEOUT_MS}"}
+    return options
+
+
+engine = create_engine(DATABASE_URL, **_engine_options(DATABASE_URL))
+
+
+@event.listens_for(engine, 'checkout')
+def _on_checkout(dbapi_connection, connection_record, connection_proxy):
+    connection_record.info['checked_out_at'] = time.perf_counter()
+
+
+@event.listens_for(engine, 'checkin')
+def _on_checkin(dbapi_connection, connection_record):
+    checked_out_at = connection_record.info.pop('checked_out_at', None)
+    if checked_out_at is not None:
+        pool_hold_seconds.observe(time.perf_counter() - checked_out_at)
+
+
+@event.listens_for(engine, 'before_cursor_execute')
+def _on_statement(conn, cursor, statement, parameters, context, executemany):
+    db_statements.inc(1, statement.split(None, 1)[0].lower() if statement.strip() else 'empty')
+
+
+@register_collector
+def _pool_metrics():
+    """Connection pool gauges for /metrics (pools without a fixed size, e.g. SQLite's, report what they have)"""
+    pool = engine.pool
+    samples = []
+    for stat in ('size', 'checkedin', 'checkedout', 'overflow'):
+        if hasattr(pool, stat):
+            samples.append(({'state': stat}, getattr(pool, stat)()))
+    return [('db_pool_connections', 'Database connection pool state', 'gauge', samples)]
+
+
+class _UnitOfWorkSession(Session):
+    """The one session shared by every helper called inside unit_of_work().
+
+    Helpers keep their usual SessionLocal-style code: their commit() only flushes and their
+    close() is a no-op, so the unit commits once on exit. A helper's rollback() rolls back the
+    whole unit, which then refuses to commit.
+    """
+
+    doomed = False
+
+    def commit(self):
+        self.flush()
+
+    def rollback(self):
+        self.doomed = True
+        super().rollback()
+
+    def close(self):
+        pass
+
+    def finish(self, commit: bool):
+        try:
+            if commit:
+                Session.commit(self)
+            else:
+                Session.rollback(self)
+        finally:
+            Session.close(self)
+
+
+class UnitOfWorkRolledBack(Exception):
+    pass
+
+
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+_UnitOfWork = sessionmaker(class_=_UnitOfWorkSession, autocommit=False, autoflush=False, bind=engine)
+_current_unit = ContextVar('db_unit_of_work', default=None)
+
+
+@contextmanager
+def unit_of_work():
+    """Run a request's database helpers on one connection and commit them together, once.
+
+    Nested units join the outer one. Keep model calls outside: the connection (and any row
+    locks) is held from the first statement until the unit exits.
+    """
+    current = _current_unit.get()
+    if current is not None:
+        yield current
+        return
+    db = _UnitOfWork()
+    token = _current_unit.set(db)
+    try:
+        yield db
+    except BaseException:
+        db.finish(commit=False)
+        raise
+    else:
+        if db.doomed:
+            db.finish(commit=False)
+            raise UnitOfWorkRolledBack("A database helper rolled back this unit of work")
+        db.finish(commit=True)
+    finally:
+        _current_unit.reset(token)
+
+
+@contextmanager
+def using_session(db: _UnitOfWorkSession):
+    """Make helpers called in this block run on an existing unit-of-work session (see database_async)"""
+    token = _current_unit.set(db)
+    try:
+        yield db
+    finally:
+        _current_unit.reset(token)
+
+
+def get_session():
+    """The current unit of work's session, or a new session the caller must close"""
+    current = _current_unit.get()
+    return current if current is not None else SessionLocal()
+
+
 Base = declarative_base()
 
+class UUID(TypeDecorator):
+    """Native UUID on Postgres, CHAR(32) on SQLite (local/test stand-in); binds str or uuid.UUID"""
+    impl = Uuid
+    cache_ok = True
+
+    def __init__(self, as_uuid=True):
+        super().__init__(as_uuid=as_uuid)
+
+    def process_bind_param(self, value, dialect):
+        if isinstance(value, str):
+            return uuid.UUID(value)
+        return value
+
 def get_db():
-    db = SessionLocal()
+    db = get_session()
     try:
         yield db
     finally:
@@ -32,6 +208,9 @@ class User(Base):
 
 class UserPreferences(Base):
     __tablename__ = "user_preferences"
+    __table_args__ = (
+        Index('ix_user_preferences_user_id', 'user_id'),
+    )
     id = Column(Integer, primary_key = True, autoincrement = True)
     user_id = Column(UUID(as_uuid=True), nullable = False)
     favorite_authors = Column(JSON)
@@ -42,30 +221,88 @@ class UserPreferences(Base):
 
 class AnalysisSession(Base):
     __tablename__ = "analysis_sessions"
+    __table_args__ = (
+        Index('ix_analysis_sessions_user_created_id', 'user_id', 'created_at', 'id'),  # /history keyset pagination
+    )
     id = Column(UUID(as_uuid=True), primary_key=True, default = uuid.uuid4)
     user_id = Column(UUID(as_uuid=True), nullable = False)
     image_filename = Column(String)
     detected_books = Column(JSON)
     recommendations = Column(JSON)
+    detected_books_count = Column(Integer, nullable = False, default = 0)  # Stored at write time so summaries skip the JSON
+    recommendations_count = Column(Integer, nullable = False, default = 0)
+    created_at = Column(DateTime, default=lambda: datetime.now(timezone.utc))
+
+class AnalysisJob(Base):
+    __tablename__ = "analysis_jobs"
+    id = Column(UUID(as_uuid=True), primary_key=True, default = uuid.uuid4)  # Also the id of the resulting AnalysisSession
+    user_id = Column(UUID(as_uuid=True), nullable = False, index = True)
+    status = Column(String, nullable = False, default = 'queued')  # queued, detecting, recommending, completed, failed
+    detected_books = Column(JSON)
+    recommendations = Column(JSON)
+    error = Column(Text)
     created_at = Column(DateTime, default=lambda: datetime.now(timezone.utc))
+    updated_at = Column(DateTime, default=lambda: datetime.now(timezone.utc))
 
 class BookCache(Base):
     __tablename__ = "book_cache"
+    __table_args__ = (
+        Index('ux_book_cache_title_author', 'title', 'author', unique=True),
+        Index('ix_book_cache_expires_at', 'expires_at'),
+    )
 
     id = Column(Integer, primary_key=True, autoincrement=True)
-    title = Column(String, nullable=False)
-    author = Column(String, nullable=False)
-    book_metadata = Column(JSON)  # Additional book info - renamed from 'metadata'
+    title = Column(String, nullable=False)   # Normalized title (see normalize.py)
+    author = Column(String, nullable=False)  # Normalized author
+    book_metadata = Column(JSON)  # Display title/author, genre, ... - renamed from 'metadata'
     created_at = Column(DateTime, default=lambda: datetime.now(timezone.utc))
     expires_at = Column(DateTime)  # When cache expires
 
+class ShelfAnalysisCache(Base):
+    __tablename__ = "shelf_analysis_cache"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    content_hash = Column(String(64), unique=True, nullable=False)  # sha256 of the decoded image bytes
+    perceptual_hash = Column(String(16), index=True)  # dHash, so re-encoded copies of a photo still match
+    user_id = Column(UUID(as_uuid=True))  # whose photo; perceptual matches never cross users
+    detected_books = Column(JSON, nullable=False)
+    created_at = Column(DateTime, default=lambda: datetime.now(timezone.utc))
+    last_hit_at = Column(DateTime, default=lambda: datetime.now(timezone.utc))
+    expires_at = Column(DateTime, nullable=False)
+
+class GoodreadsBook(Base):
+    __tablename__ = "goodreads_books"
+    __table_args__ = (
+        Index('ux_goodreads_books_user_book', 'user_id', 'normalized_title', 'normalized_author', unique=True),
+        Index('ix_goodreads_books_user_shelf', 'user_id', 'exclusive_shelf'),
+        Index('ix_goodreads_books_user_rating', 'user_id', 'rating'),
+    )
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    user_id = Column(UUID(as_uuid=True), nullable=False)  # Links to User.id
+    title = Column(String, nullable=False)
+    author = Column(String, nullable=False)
+    normalized_title = Column(String, nullable=False)
+    normalized_author = Column(String, nullable=False)
+    rating = Column(Integer, nullable=False, default=0)  # 0 = not rated
+    exclusive_shelf = Column(String)  # read, to-read, currently-reading, ...
+    date_read = Column(Date)
+    row_hash = Column(String(32), nullable=False)  # Detects changed rows on re-import
+    imported_at = Column(DateTime, default=lambda: datetime.now(timezone.utc))
+
 class SavedBooks(Base):
     __tablename__ = "saved_books"
+    __table_args__ = (
+        Index('ux_saved_books_user_book', 'user_id', 'normalized_title', 'normalized_author', unique=True),
+        Index('ix_saved_books_user_saved_at', 'user_id', 'saved_at'),
+    )
 
     id = Column(Integer, primary_key=True, autoincrement=True)
     user_id = Column(UUID(as_uuid=True), nullable=False)  # Links to User.id
     title = Column(String, nullable=False)
     author = Column(String, nullable=False)
+    normalized_title = Column(String)   # Lookup key, see normalize.py (backfilled by migration 3)
+    normalized_author = Column(String)
     match_score = Column(Integer)  # Original match score when recommended
     match_reason = Column(Text)    # Why it was recommended
     source_session_id = Column(UUID(as_uuid=True))  # Which analysis session it came from
@@ -74,35 +311,64 @@ class SavedBooks(Base):
     is_read = Column(Boolean, default=False)  # User can mark as read later
 
 def create_tables():
+    from migrations import run_migrations
+
     Base.metadata.create_all(bind=engine)
+    # create_all skips tables that already exist; columns/indexes added later come from migrations
+    run_migrations(engine)
+
+def _insert_for(db, model):
+    """Dialect-specific INSERT so callers can use ON CONFLICT upserts"""
+    if db.get_bind().dialect.name == 'sqlite':
+        return sqlite.insert(model)
+    return postgresql.insert(model)
+
+def _user_to_dict(user):
+    return {
+        'id': str(user.id),
+        'device_id': user.device_id,
+        'created_at': user.created_at.isoformat() if user.created_at else None,
+        'last_active': user.last_active.isoformat() if user.last_active else None
+    }
 
 def get_or_create_user(device_id: str):
-    db = SessionLocal()
+    """Race-safe single-statement upsert: concurrent first requests for a device get the same row"""
+    db = get_session()
     try:
-        user = db.query(User).filter(User.device_id==device_id).first()
-        if not user:
-            user = User(device_id=device_id)
-            db.add(user)
-            db.commit()
-            db.refresh(user)
-        else:
-            user.last_active = datetime.now(timezone.utc)
-            db.commit()
-            db.refresh(user)
-        
-        # Create a detached copy to return (safe to use outside session)
-        result = {
-            'id': str(user.id),
-            'device_id': user.device_id,
-            'created_at': user.created_at.isoformat() if user.created_at else None,
-            'last_active': user.last_active.isoformat() if user.last_active else None
-        }
-        return result
+        now = datetime.now(timezone.utc)
+        stmt = _insert_for(db, User).values(id=uuid.uuid4(), device_id=device_id, created_at=now, last_active=now)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=['device_id'],
+            set_={'last_active': stmt.excluded.last_active}
+        ).returning(User.id, User.device_id, User.created_at, User.last_active)
+        user = db.execute(stmt).one()
+        db.commit()
+        return _user_to_dict(user)
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+def touch_users(last_active_by_user: dict):
+    """Write coalesced last_active timestamps ({user_id: datetime}) in one executemany UPDATE"""
+    if not last_active_by_user:
+        return
+    db = get_session()
+    try:
+        db.execute(update(User), [
+            {'id': uuid.UUID(user_id), 'last_active': last_active}
+            for user_id, last_active in last_active_by_user.items()
+        ])
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
     finally:
         db.close()
 
 def save_user_preferences(user_id: str, preferences: dict):
-    db = SessionLocal()
+    db = get_session()
     try:
         prefs = db.query(UserPreferences).filter(UserPreferences.user_id == user_id).first()
         if prefs:
@@ -138,13 +404,16 @@ def save_user_preferences(user_id: str, preferences: dict):
     finally:
         db.close()
 
-def save_analysis_session(user_id: str, detected_books: list, recommendations: list):
-    db = SessionLocal()
+def save_analysis_session(user_id: str, detected_books: list, recommendations: list, session_id: str = None):
+    db = get_session()
     try:
         session = AnalysisSession(
+            id = uuid.UUID(session_id) if session_id else None,
             user_id = user_id,
             detected_books = detected_books,
-            recommendations = recommendations
+            recommendations = recommendations,
+            detected_books_count = len(detected_books or []),
+            recommendations_count = len(recommendations or [])
         )
         db.add(session)
         db.commit()
@@ -162,34 +431,145 @@ def save_analysis_session(user_id: str, detected_books: list, recommendations: l
     finally:
         db.close()
 
-def get_user_analysis_history(user_id: str, limit: int = 10):
-    db = SessionLocal()
+def _job_to_dict(job):
+    return {
+        'job_id': str(job.id),
+        'user_id': str(job.user_id),
+        'status': job.status,
+        'detected_books': job.detected_books,
+        'recommendations': job.recommendations,
+        'error': job.error,
+        'created_at': job.created_at.isoformat() if job.created_at else None,
+        'updated_at': job.updated_at.isoformat() if job.updated_at else None
+    }
+
+def create_analysis_job(user_id: str):
+    db = get_session()
     try:
-        sessions = db.query(AnalysisSession)\
-                    .filter(AnalysisSession.user_id == user_id)\
-                    .order_by(AnalysisSession.created_at.desc())\
-                    .limit(limit)\
+        job = AnalysisJob(user_id=user_id, status='queued')
+        db.add(job)
+        db.commit()
+        db.refresh(job)
+        return _job_to_dict(job)
+    finally:
+        db.close()
+
+def update_analysis_job(job_id: str, **fields):
+    db = get_session()
+    try:
+        fields['updated_at'] = datetime.now(timezone.utc)
+        db.query(AnalysisJob).filter(AnalysisJob.id == job_id).update(fields, synchronize_session=False)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+def fail_stale_analysis_job(job_id: str, stale_seconds: float, error: str):
+    """Mark a job failed if it is still unfinished and hasn't been updated for `stale_seconds`
+    (its worker process died); a no-op for a job that finished or moved on meanwhile"""
+    db = get_session()
+    try:
+        now = datetime.now(timezone.utc)
+        db.query(AnalysisJob).filter(
+            AnalysisJob.id == job_id,
+            AnalysisJob.status.notin_(('completed', 'failed')),
+            AnalysisJob.updated_at < now - timedelta(seconds=stale_seconds)
+        ).update({'status': 'failed', 'error': error, 'updated_at': now}, synchronize_session=False)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+def get_analysis_job(job_id: str, user_id: str):
+    db = get_session()
+    try:
+        job = db.query(AnalysisJob).filter(
+            AnalysisJob.id == job_id,
+            AnalysisJob.user_id == user_id
+        ).first()
+        return _job_to_dict(job) if job else None
+    finally:
+        db.close()
+
+def _session_to_dict(row, summary: bool):
+    result = {
+        'session_id': str(row.id),
+        'created_at': row.created_at.isoformat() if row.created_at else None,
+        'detected_books_count': row.detected_books_count,
+        'recommendations_count': row.recommendations_count
+    }
+    if not summary:
+        result['detected_books'] = row.detected_books or []
+        result['recommendations'] = row.recommendations or []
+    return result
+
+def get_user_analysis_history(user_id: str, limit: int = 10, before: tuple = None, summary: bool = False):
+    """One page of a user's sessions, newest first, plus the (created_at, id) key of the next page.
+
+    `before` is the key returned for the previous page. Summary pages select only ids,
+    timestamps and counts - the JSON blobs are never read.
+    """
+    columns = [AnalysisSession.id, AnalysisSession.created_at,
+               AnalysisSession.detected_books_count, AnalysisSession.recommendations_count]
+    if not summary:
+        columns += [AnalysisSession.detected_books, AnalysisSession.recommendations]
+
+    db = get_session()
+    try:
+        query = db.query(*columns)\
+                  .filter(AnalysisSession.user_id == user_id)
+        if before is not None:
+            before_created_at, before_id = before
+            query = query.filter(tuple_(AnalysisSession.created_at, AnalysisSession.id) < tuple_(before_created_at, before_id))
+        rows = query.order_by(AnalysisSession.created_at.desc(), AnalysisSession.id.desc())\
+                    .limit(limit + 1)\
                     .all()
-        return sessions
+
+        next_key = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_key = (rows[-1].created_at, rows[-1].id)
+        return [_session_to_dict(row, summary) for row in rows], next_key
+    finally:
+        db.close()
+
+def get_analysis_session(user_id: str, session_id: str):
+    db = get_session()
+    try:
+        session = db.query(AnalysisSession)\
+                    .filter(AnalysisSession.id == session_id, AnalysisSession.user_id == user_id)\
+                    .first()
+        return _session_to_dict(session, summary=False) if session else None
     finally:
         db.close()
 
+def _saved_book_filter(user_id: str, title: str, author: str):
+    normalized_title, normalized_author = book_key(title, author)
+    return (
+        SavedBooks.user_id == user_id,
+        SavedBooks.normalized_title == normalized_title,
+        SavedBooks.normalized_author == normalized_author
+    )
+
 def save_book(user_id: str, title: str, author: str, match_score: int = None, match_reason: str = None, source_session_id: str = None):
-    db = SessionLocal()
+    db = get_session()
     try:
-        book = db.query(SavedBooks).filter(
-            SavedBooks.user_id == user_id,
-            SavedBooks.title == title,
-            SavedBooks.author == author
-        ).first()
+        book = db.query(SavedBooks).filter(*_saved_book_filter(user_id, title, author)).first()
 
         if book:
             return {"already_saved": True, "message": "Book already in reading list"}
         else:
+            normalized_title, normalized_author = book_key(title, author)
             new_book = SavedBooks(
                 user_id=user_id,
                 title=title,
                 author=author,
+                normalized_title=normalized_title,
+                normalized_author=normalized_author,
                 match_score=match_score,
                 match_reason=match_reason,
                 source_session_id=source_session_id
@@ -206,13 +586,9 @@ def save_book(user_id: str, title: str, author: str, match_score: int = None, ma
 
 
 def unsave_book(user_id: str, title: str, author: str):
-    db = SessionLocal()
+    db = get_session()
     try:
-        book = db.query(SavedBooks).filter(
-            SavedBooks.user_id == user_id,
-            SavedBooks.title == title,
-            SavedBooks.author == author
-        ).first()
+        book = db.query(SavedBooks).filter(*_saved_book_filter(user_id, title, author)).first()
         if book:
             db.delete(book)
             db.commit()
@@ -226,7 +602,7 @@ def unsave_book(user_id: str, title: str, author: str):
         db.close()
 
 def get_saved_books(user_id: str, limit: int = 50):
-    db = SessionLocal()
+    db = get_session()
     try:
         books = db.query(SavedBooks)\
                  .filter(SavedBooks.user_id == user_id)\
@@ -254,19 +630,15 @@ def get_saved_books(user_id: str, limit: int = 50):
         db.close()
 
 def check_if_book_saved(user_id: str, title: str, author: str):
-    db = SessionLocal()
+    db = get_session()
     try:
-        book = db.query(SavedBooks).filter(
-            SavedBooks.user_id == user_id,
-            SavedBooks.title == title,
-            SavedBooks.author == author
-        ).first()
+        book = db.query(SavedBooks).filter(*_saved_book_filter(user_id, title, author)).first()
         return book is not None
     finally:
         db.close()
 
 def mark_book_as_read(user_id: str, book_id: int, is_read: bool = True):
-    db = SessionLocal()
+    db = get_session()
     try:
         book = db.query(SavedBooks).filter(
             SavedBooks.user_id == user_id,
@@ -286,7 +658,7 @@ def mark_book_as_read(user_id: str, book_id: int, is_read: bool = True):
         db.close()
 
 def update_book_notes(user_id: str, book_id: int, notes: str):
-    db = SessionLocal()
+    db = get_session()
     try:
         book = db.query(SavedBooks).filter(
             SavedBooks.user_id == user_id,
@@ -302,4 +674,415 @@ def update_book_notes(user_id: str, book_id: int, notes: str):
         db.rollback()
         return {"success": False, "message": f"Failed to update book notes: {str(e)}"}
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+def _book_key_filter(title_column, author_column, keys):
+    """WHERE clauses matching (normalized_title, normalized_author) keys. The plain title IN lets
+    SQLite seek the (user_id, title, author) index too - it only uses row-value INs as a filter."""
+    keys = list(keys)
+    return (
+        title_column.in_({title for title, _ in keys}),
+        tuple_(title_column, author_column).in_(keys)
+    )
+
+def _saved_books_by_key(db, user_id: str, keys):
+    """(normalized_title, normalized_author) -> SavedBooks row, for the given keys, in one query"""
+    if not keys:
+        return {}
+    rows = db.query(SavedBooks).filter(
+        SavedBooks.user_id == user_id,
+        *_book_key_filter(SavedBooks.normalized_title, SavedBooks.normalized_author, keys)
+    ).all()
+    return {(row.normalized_title, row.normalized_author): row for row in rows}
+
+def check_books_saved(user_id: str, books: list):
+    """Saved status of many (title, author) pairs with one query; results keep input order"""
+    keys = [book_key(title, author) for title, author in books]
+    db = get_session()
+    try:
+        saved = _saved_books_by_key(db, user_id, set(keys))
+        results = []
+        for (title, author), key in zip(books, keys):
+            row = saved.get(key)
+            results.append({
+                'title': title,
+                'author': author,
+                'is_saved': row is not None,
+                'book_id': row.id if row else None,
+                'is_read': row.is_read if row else False
+            })
+        return results
+    finally:
+        db.close()
+
+def save_books(user_id: str, books: list):
+    """Save many books in one transaction with a single multi-row insert.
+
+    `books` are dicts with title, author and optional match_score, match_reason and
+    source_session_id. Returns one result per input book, in order.
+    """
+    keys = [book_key(book['title'], book['author']) for book in books]
+    db = get_session()
+    try:
+        existing = _saved_books_by_key(db, user_id, set(keys))
+        rows = {}
+        for book, key in zip(books, keys):
+            if key not in existing and key not in rows:
+                rows[key] = {
+                    'user_id': user_id,
+                    'title': book['title'],
+                    'author': book['author'],
+                    'normalized_title': key[0],
+                    'normalized_author': key[1],
+                    'match_score': book.get('match_score'),
+                    'match_reason': book.get('match_reason'),
+                    'source_session_id': book.get('source_session_id')
+                }
+
+        inserted = {}
+        if rows:
+            # A concurrent save of the same book loses the race quietly and reports already_saved
+            stmt = _insert_for(db, SavedBooks).values(list(rows.values()))\
+                .on_conflict_do_nothing(index_elements=['user_id', 'normalized_title', 'normalized_author'])\
+                .returning(SavedBooks.id, SavedBooks.normalized_title, SavedBooks.normalized_author)
+            inserted = {(row.normalized_title, row.normalized_author): row.id for row in db.execute(stmt)}
+        db.commit()
+
+        results = []
+        claimed = set()
+        for book, key in zip(books, keys):
+            result = {'title': book['title'], 'author': book['author']}
+            if key in inserted and key not in claimed:
+                claimed.add(key)
+                result.update({'success': True, 'already_saved': False, 'book_id': inserted[key]})
+            else:
+                row = existing.get(key)
+                result.update({'success': True, 'already_saved': True,
+                               'book_id': row.id if row else inserted.get(key)})
+            results.append(result)
+        return results
+    except Exception as e:
+        db.rollback()
+        return [{'title': book['title'], 'author': book['author'], 'success': False,
+                 'message': f"Failed to save book: {str(e)}"} for book in books]
+    finally:
+        db.close()
+
+def unsave_books(user_id: str, books: list):
+    """Remove many (title, author) pairs from the reading list in one DELETE"""
+    keys = [book_key(title, author) for title, author in books]
+    db = get_session()
+    try:
+        removed = set()
+        if keys:
+            stmt = SavedBooks.__table__.delete().where(
+                SavedBooks.user_id == user_id,
+                *_book_key_filter(SavedBooks.normalized_title, SavedBooks.normalized_author, set(keys))
+            ).returning(SavedBooks.normalized_title, SavedBooks.normalized_author)
+            removed = {tuple(row) for row in db.execute(stmt)}
+        db.commit()
+        return [{'title': title, 'author': author, 'success': key in removed}
+                for (title, author), key in zip(books, keys)]
+    except Exception as e:
+        db.rollback()
+        return [{'title': title, 'author': author, 'success': False,
+                 'message': f"Failed to remove book: {str(e)}"} for title, author in books]
+    finally:
+        db.close()
+
+def mark_books_as_read(user_id: str, book_ids: list, is_read: bool = True):
+    """Set is_read on many saved books with one UPDATE; unknown ids come back as not found"""
+    db = get_session()
+    try:
+        updated = set()
+        if book_ids:
+            stmt = update(SavedBooks).where(
+                SavedBooks.user_id == user_id,
+                SavedBooks.id.in_(book_ids)
+            ).values(is_read=is_read).returning(SavedBooks.id)
+            updated = set(db.execute(stmt).scalars())
+        db.commit()
+        return [{'book_id': book_id, 'success': book_id in updated} for book_id in book_ids]
+    except Exception as e:
+        db.rollback()
+        return [{'book_id': book_id, 'success': False,
+                 'message': f"Failed to update book status: {str(e)}"} for book_id in book_ids]
+    finally:
+        db.close()
+
+def update_books_notes(user_id: str, notes_by_id: dict):
+    """Update notes on many saved books in one transaction (one ownership check, one executemany)"""
+    db = get_session()
+    try:
+        owned = set()
+        if notes_by_id:
+            owned = {row.id for row in db.query(SavedBooks.id).filter(
+                SavedBooks.user_id == user_id,
+                SavedBooks.id.in_(list(notes_by_id))
+            )}
+        if owned:
+            table = SavedBooks.__table__
+            db.execute(
+                update(table).where(table.c.id == bindparam('book_id')).values(additional_notes=bindparam('notes')),
+                [{'book_id': book_id, 'notes': notes_by_id[book_id]} for book_id in owned]
+            )
+        db.commit()
+        return [{'book_id': book_id, 'success': book_id in owned} for book_id in notes_by_id]
+    except Exception as e:
+        db.rollback()
+        return [{'book_id': book_id, 'success': False,
+                 'message': f"Failed to update book notes: {str(e)}"} for book_id in notes_by_id]
+    finally:
+        db.close()
+
+def get_cached_shelf_analysis(content_hash: str, user_id: str = None, is_lookalike=None, scan_rows: int = 50):
+    """Books for these exact image bytes (anyone's upload), else for the most recently used of this user's
+    last `scan_rows` photos whose perceptual hash satisfies `is_lookalike`"""
+    db = get_session()
+    try:
+        now = datetime.now(timezone.utc)
+        entry = db.query(ShelfAnalysisCache).filter(
+            ShelfAnalysisCache.content_hash == content_hash,
+            ShelfAnalysisCache.expires_at > now
+        ).first()
+        if not entry and is_lookalike and user_id:
+            recent = db.query(ShelfAnalysisCache).filter(
+                ShelfAnalysisCache.user_id == user_id,
+                ShelfAnalysisCache.perceptual_hash.isnot(None),
+                ShelfAnalysisCache.expires_at > now
+            ).order_by(ShelfAnalysisCache.last_hit_at.desc()).limit(scan_rows)
+            entry = next((row for row in recent if is_lookalike(row.perceptual_hash)), None)
+        if not entry:
+            return None
+
+        entry.last_hit_at = now
+        db.commit()
+        return entry.detected_books
+    finally:
+        db.close()
+
+def save_cached_shelf_analysis(content_hash: str, perceptual_hash: str, detected_books: list, ttl_seconds: int, max_rows: int,
+                               user_id: str = None):
+    db = get_session()
+    try:
+        now = datetime.now(timezone.utc)
+        entry = db.query(ShelfAnalysisCache).filter(ShelfAnalysisCache.content_hash == content_hash).first()
+        if entry:
+            entry.perceptual_hash = perceptual_hash
+            entry.user_id = user_id
+            entry.detected_books = detected_books
+            entry.last_hit_at = now
+            entry.expires_at = now + timedelta(seconds=ttl_seconds)
+        else:
+            db.add(ShelfAnalysisCache(
+                content_hash=content_hash,
+                perceptual_hash=perceptual_hash,
+                user_id=user_id,
+                detected_books=detected_books,
+                expires_at=now + timedelta(seconds=ttl_seconds)
+            ))
+        db.flush()
+
+        # Drop expired rows, then evict the least recently hit ones beyond the row cap
+        db.query(ShelfAnalysisCache).filter(ShelfAnalysisCache.expires_at <= now).delete(synchronize_session=False)
+        stale_ids = db.query(ShelfAnalysisCache.id)\
+                      .order_by(ShelfAnalysisCache.last_hit_at.desc())\
+                      .offset(max_rows)\
+                      .all()
+        if stale_ids:
+            db.query(ShelfAnalysisCache)\
+              .filter(ShelfAnalysisCache.id.in_([row.id for row in stale_ids]))\
+              .delete(synchronize_session=False)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+def upsert_book_cache(books: list, ttl_seconds: int):
+    """Insert or refresh cache rows for every detected book in one statement"""
+    now = datetime.now(timezone.utc)
+    rows = {}
+    for book in books:
+        title, author = book_key(book.get('title', ''), book.get('author', ''))
+        if not title:
+            continue
+        # Later duplicates win; Postgres rejects one upsert touching the same key twice
+        rows[(title, author)] = {
+            'title': title,
+            'author': author,
+            'book_metadata': {k: v for k, v in book.items() if v not in (None, '')},
+            'created_at': now,
+            'expires_at': now + timedelta(seconds=ttl_seconds)
+        }
+    if not rows:
+        return 0
+
+    db = get_session()
+    try:
+        stmt = _insert_for(db, BookCache).values(list(rows.values()))
+        stmt = stmt.on_conflict_do_update(
+            index_elements=['title', 'author'],
+            set_={
+                'book_metadata': stmt.excluded.book_metadata,
+                'expires_at': stmt.excluded.expires_at
+            }
+        )
+        db.execute(stmt)
+        db.commit()
+        return len(rows)
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+def get_book_cache_metadata(books: list):
+    """Fetch live cache entries for the given books in one query, keyed by normalized (title, author)"""
+    keys = {book_key(book.get('title', ''), book.get('author', '')) for book in books}
+    keys.discard(('', ''))
+    if not keys:
+        return {}
+
+    db = get_session()
+    try:
+        now = datetime.now(timezone.utc)
+        rows = db.query(BookCache.title, BookCache.author, BookCache.book_metadata).filter(
+            tuple_(BookCache.title, BookCache.author).in_(list(keys)),
+            BookCache.expires_at > now
+        ).all()
+        return {(row.title, row.author): row.book_metadata or {} for row in rows}
+    finally:
+        db.close()
+
+def purge_expired_book_cache(batch_size: int = 500):
+    """Delete expired cache rows in batches so no single statement holds locks for long"""
+    total = 0
+    while True:
+        db = get_session()
+        try:
+            now = datetime.now(timezone.utc)
+            expired_ids = [row.id for row in db.query(BookCache.id)
+                                               .filter(BookCache.expires_at <= now)
+                                               .limit(batch_size)
+                                               .all()]
+            if expired_ids:
+                db.query(BookCache).filter(BookCache.id.in_(expired_ids)).delete(synchronize_session=False)
+                db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+        total += len(expired_ids)
+        if len(expired_ids) < batch_size:
+            return total
+
+def get_goodreads_library_hashes(user_id: str):
+    """{(normalized_title, normalized_author): (id, row_hash)} for a user's imported library"""
+    db = get_session()
+    try:
+        rows = db.query(
+            GoodreadsBook.id,
+            GoodreadsBook.normalized_title,
+            GoodreadsBook.normalized_author,
+            GoodreadsBook.row_hash
+        ).filter(GoodreadsBook.user_id == user_id).all()
+        return {(row.normalized_title, row.normalized_author): (row.id, row.row_hash) for row in rows}
+    finally:
+        db.close()
+
+def apply_goodreads_library_changes(inserts: list, updates: list, delete_ids: list = ()):
+    """Write one batch of library changes in a single transaction using executemany"""
+    db = get_session()
+    try:
+        if inserts:
+            db.execute(insert(GoodreadsBook), inserts)
+        if updates:
+            db.execute(update(GoodreadsBook), updates)  # bulk UPDATE by primary key
+        delete_ids = list(delete_ids)
+        for start in range(0, len(delete_ids), 1000):
+            db.query(GoodreadsBook)\
+              .filter(GoodreadsBook.id.in_(delete_ids[start:start + 1000]))\
+              .delete(synchronize_session=False)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+def get_goodreads_read_keys(user_id: str):
+    """Normalized (title, author) of every book on the user's Goodreads "read" shelf"""
+    db = get_session()
+    try:
+        rows = db.query(GoodreadsBook.normalized_title, GoodreadsBook.normalized_author).filter(
+            GoodreadsBook.user_id == user_id,
+            GoodreadsBook.exclusive_shelf == 'read'
+        ).all()
+        return {(row.normalized_title, row.normalized_author) for row in rows}
+    finally:
+        db.close()
+
+def get_goodreads_ranking_signals(user_id: str):
+    """What ranking.py needs from the user's Goodreads library: read and to-read keys, and the
+    average rating the user gave each author (rated books only)"""
+    db = get_session()
+    try:
+        shelves = {'read': set(), 'to-read': set()}
+        rows = db.query(GoodreadsBook.normalized_title, GoodreadsBook.normalized_author, GoodreadsBook.exclusive_shelf)\
+                 .filter(GoodreadsBook.user_id == user_id, GoodreadsBook.exclusive_shelf.in_(list(shelves)))
+        for row in rows:
+            shelves[row.exclusive_shelf].add((row.normalized_title, row.normalized_author))
+
+        ratings = db.query(GoodreadsBook.normalized_author, func.avg(GoodreadsBook.rating))\
+                    .filter(GoodreadsBook.user_id == user_id, GoodreadsBook.rating > 0)\
+                    .group_by(GoodreadsBook.normalized_author)
+        return {
+            'read': shelves['read'],
+            'to_read': shelves['to-read'],
+            'author_ratings': {author: float(average) for author, average in ratings}
+        }
+    finally:
+        db.close()
+
+def get_reading_status(user_id: str, keys):
+    """Saved/read flags for normalized (title, author) keys, from saved_books and the Goodreads
+    library in one UNION ALL query. Keys the user has never seen are left out."""
+    keys = list(set(keys))
+    if not keys:
+        return {}
+    saved = select(
+        SavedBooks.normalized_title.label('title'),
+        SavedBooks.normalized_author.label('author'),
+        true().label('is_saved'),
+        SavedBooks.is_read.label('is_read')
+    ).where(
+        SavedBooks.user_id == user_id,
+        *_book_key_filter(SavedBooks.normalized_title, SavedBooks.normalized_author, keys)
+    )
+    goodreads = select(
+        GoodreadsBook.normalized_title,
+        GoodreadsBook.normalized_author,
+        false(),
+        GoodreadsBook.exclusive_shelf == 'read'
+    ).where(
+        GoodreadsBook.user_id == user_id,
+        *_book_key_filter(GoodreadsBook.normalized_title, GoodreadsBook.normalized_author, keys)
+    )
+
+    db = get_session()
+    try:
+        status = {}
+        for row in db.execute(union_all(saved, goodreads)):
+            flags = status.setdefault((row.title, row.author), {'is_saved': False, 'is_read': False})
+            flags['is_saved'] = flags['is_saved'] or bool(row.is_saved)
+            flags['is_read'] = flags['is_read'] or bool(row.is_read)
+        return status
+    finally:
+        db.close()
+
+# Every public function above except the session plumbing records its duration in /metrics (call_seconds{function="database.*"})
+instrument_module(globals(), exclude=('get_db', 'get_session', 'unit_of_work', 'using_session'))
@@ -0,0 +1,107 @@
+import os
+
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+from database import (DATABASE_URL, DB_STATEMENT_TIMEOUT_MS, TimedQueuePool, UnitOfWorkRolledBack, _UnitOfWorkSession,
+                      _engine_options, _on_checkin, _on_checkout, _on_statement, using_session)
+from metrics import register_collector
+
+# The async side of the database for asgi.py. The helpers in database.py stay the only place
+# SQL is written: AsyncSession.run_sync runs them on an async driver (asyncpg / aiosqlite), so
+# a request waiting on the database parks its coroutine instead of a worker thread.
+_ASYNC_DRIVERS = {'postgresql': 'asyncpg', 'sqlite': 'aiosqlite'}
+
+
+def _async_url(url: str) -> str:
+    override = os.getenv('DATABASE_ASYNC_URL')
+    if override:
+        return override
+    parsed = make_url(url)
+    driver = _ASYNC_DRIVERS.get(parsed.get_backend_name())
+    if driver is None:
+        raise ValueError(f"No async driver configured for {parsed.get_backend_name()}; set DATABASE_ASYNC_URL")
+    return parsed.set(drivername=f"{parsed.get_backend_name()}+{driver}").render_as_string(hide_password=False)
+
+
+class TimedAsyncQueuePool(TimedQueuePool, AsyncAdaptedQueuePool):
+    """TimedQueuePool on the asyncio-aware queue the async drivers need"""
+
+
+def _async_engine_options(url: str) -> dict:
+    # Same sizing, recycling and timeouts as the sync engine (database.py), per worker process
+    options = _engine_options(url)
+    if options.get('poolclass') is TimedQueuePool:
+        options['poolclass'] = TimedAsyncQueuePool
+        if make_url(url).get_backend_name() == 'sqlite':
+            # One writer at a time either way: many aiosqlite connections only turn waiting into
+            # "database is locked" errors, so units queue for a single connection instead
+            options.update(pool_size=1, max_overflow=0)
+    if 'connect_args' in options:
+        # asyncpg takes server settings rather than libpq's -c options
+        options['connect_args'] = {'server_settings': {'statement_timeout': str(DB_STATEMENT_TIMEOUT_MS)}}
+    return options
+
+
+ASYNC_DATABASE_URL = _async_url(DATABASE_URL)
+async_engine = create_async_engine(ASYNC_DATABASE_URL, **_async_engine_options(ASYNC_DATABASE_URL))
+event.listen(async_engine.sync_engine, 'checkout', _on_checkout)
+event.listen(async_engine.sync_engine, 'checkin', _on_checkin)
+event.listen(async_engine.sync_engine, 'before_cursor_execute', _on_statement)
+
+_AsyncUnitOfWork = async_sessionmaker(async_engine, class_=AsyncSession, sync_session_class=_UnitOfWorkSession,
+                                      autoflush=False, expire_on_commit=False)
+
+
+@register_collector
+def _async_pool_metrics():
+    pool = async_engine.sync_engine.pool
+    samples = []
+    for stat in ('size', 'checkedin', 'checkedout', 'overflow'):
+        if hasattr(pool, stat):
+            samples.append(({'state': stat}, getattr(pool, stat)()))
+    return [('db_async_pool_connections', 'Async (ASGI) database connection pool state', 'gauge', samples)]
+
+
+def _run_helper(db, helper, args, kwargs):
+    with using_session(db):
+        return helper(*args, **kwargs)
+
+
+class AsyncUnitOfWork:
+    """async with AsyncUnitOfWork() as unit: await unit.call(save_analysis_session, ...)
+
+    The async counterpart of database.unit_of_work(): every helper passed to call() runs on
+    one connection and the unit commits once on exit. A helper that rolled back dooms the unit.
+    """
+
+    def __init__(self, raise_if_doomed: bool = True):
+        self.session = _AsyncUnitOfWork()
+        self._raise_if_doomed = raise_if_doomed
+
+    async def call(self, helper, *args, **kwargs):
+        return await self.session.run_sync(_run_helper, helper, args, kwargs)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        # finish() rather than AsyncSession.commit()/close(): the unit-of-work session's own
+        # commit() only flushes and close() does nothing
+        doomed = self.session.sync_session.doomed
+        await self.session.run_sync(_UnitOfWorkSession.finish, exc_type is None and not doomed)
+        if exc_type is None and doomed and self._raise_if_doomed:
+            raise UnitOfWorkRolledBack("A database helper rolled back this unit of work")
+        return False
+
+
+async def call(helper, *args, **kwargs):
+    """Run one database helper on the async engine in its own unit; like calling it directly on the sync path"""
+    async with AsyncUnitOfWork(raise_if_doomed=False) as unit:
+        return await unit.call(helper, *args, **kwargs)
+
+
+async def dispose():
+    await async_engine.dispose()
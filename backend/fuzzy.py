@@ -0,0 +1,232 @@
+import os
+import re
+from collections import defaultdict
+from functools import lru_cache
+
+import numpy as np
+
+from normalize import book_key, normalize_author, normalize_title
+
+# Title similarity (trigram Jaccard) at which two detected books are OCR variants of one spine
+FUZZY_DEDUPE_THRESHOLD = float(os.getenv('FUZZY_DEDUPE_THRESHOLD', 0.75))
+# ...and at which a recommendation is snapped onto a book from the list the model was given
+RECONCILE_THRESHOLD = float(os.getenv('RECONCILE_THRESHOLD', 0.6))
+# Share of the shorter title's trigrams found in the longer one, for dropped/added subtitles
+RECONCILE_CONTAINMENT = float(os.getenv('RECONCILE_CONTAINMENT', 0.9))
+
+_NUMBER = re.compile(r"\d+")
+
+
+def numbers(text: str) -> frozenset:
+    """Numbers in a title; volume numbers and years must agree for two titles to match"""
+    return frozenset(_NUMBER.findall(text))
+
+
+@lru_cache(maxsize=16384)
+def trigrams(text: str) -> frozenset:
+    """Character trigrams of an already-normalized string, padded so short words still match"""
+    padded = f"  {text} "
+    return frozenset(padded[i:i + 3] for i in range(len(padded) - 2))
+
+
+def similarity(a: frozenset, b: frozenset) -> float:
+    """Jaccard similarity of two trigram sets"""
+    if not a or not b:
+        return 0.0
+    shared = len(a & b)
+    return shared / (len(a) + len(b) - shared)
+
+
+def authors_agree(a: str, b: str, threshold: float = 0.5) -> bool:
+    """Normalized authors agree if either is unknown, they share a surname, or they are similar"""
+    if not a or not b or a == b:
+        return True
+    if a.split()[-1] == b.split()[-1]:
+        return True
+    return similarity(trigrams(a), trigrams(b)) >= threshold
+
+
+class TitleIndex:
+    """Fuzzy lookup of (title, author) pairs by title trigrams.
+
+    Built once per request over a user's library; `match` only scores entries that
+    share at least one trigram with the query (inverted index), so lookups stay cheap
+    for libraries of thousands of books.
+    """
+
+    def __init__(self, keys):
+        self.keys = []       # (normalized title, normalized author)
+        self.grams = []      # trigram set of each title
+        self.postings = defaultdict(list)  # trigram -> entry ids
+        for key in dict.fromkeys(keys):
+            entry = len(self.keys)
+            self.keys.append(key)
+            self.grams.append(trigrams(key[0]))
+            for gram in self.grams[entry]:
+                self.postings[gram].append(entry)
+
+    def __len__(self):
+        return len(self.keys)
+
+    def match(self, title: str, author: str = '', threshold: float = 0.8):
+        """Best (key, score) whose title is at least `threshold` similar, or None.
+
+        Authors must agree too (see authors_agree), so "Emma" by Austen does not match
+        "Emma" by someone else. Titles with different numbers never match ("Book 8" vs
+        "Book 88").
+        """
+        query_title, query_author = normalize_title(title), normalize_author(author)
+        query = trigrams(query_title)
+        query_numbers = numbers(query_title)
+        shared = defaultdict(int)
+        for gram in query:
+            for entry in self.postings.get(gram, ()):
+                shared[entry] += 1
+
+        best = None
+        for entry, count in shared.items():
+            # Jaccard from the posting counts; skip entries that can't reach the threshold
+            score = count / (len(query) + len(self.grams[entry]) - count)
+            if score < threshold or (best and score <= best[1]):
+                continue
+            entry_title, entry_author = self.keys[entry]
+            if numbers(entry_title) != query_numbers or not authors_agree(query_author, entry_author):
+                continue
+            best = (self.keys[entry], score)
+        return best
+
+
+class BookMatcher:
+    """Vectorized fuzzy matching against a fixed list of book dicts (e.g. one shelf).
+
+    Title trigrams are interned once into CSR posting lists (gram id -> book ids). Scoring a
+    batch of queries expands every posting list the queries hit with a few array operations
+    and counts shared trigrams with one bincount, so a 500 x 500 comparison takes milliseconds.
+    """
+
+    def __init__(self, books):
+        self.books = list(books)
+        self.keys = [book_key(book.get('title', ''), book.get('author', '')) for book in self.books]
+        self.numbers = [numbers(title) for title, _ in self.keys]
+        self.vocabulary = {}
+        gram_ids = [[self.vocabulary.setdefault(gram, len(self.vocabulary)) for gram in trigrams(title)]
+                    for title, _ in self.keys]
+        self.sizes = np.array([len(ids) for ids in gram_ids], dtype=np.float32)
+        # (book, gram id) pairs of every title; sorted by gram they are the posting lists
+        self._entry_rows = np.repeat(np.arange(len(self.books)), self.sizes.astype(np.int64))
+        self._entry_grams = np.fromiter((i for ids in gram_ids for i in ids), dtype=np.int64, count=len(self._entry_rows))
+        order = np.argsort(self._entry_grams, kind='stable')
+        self._postings = self._entry_rows[order]
+        self._posting_starts = np.searchsorted(self._entry_grams[order], np.arange(len(self.vocabulary) + 1))
+
+    def _shared(self, rows, grams, row_count: int):
+        """Shared-trigram counts for query (row, gram id) pairs against every book"""
+        columns = len(self.books)
+        starts = self._posting_starts[grams]
+        lengths = self._posting_starts[grams + 1] - starts
+        # Positions of every posting-list element the queries hit, without a Python loop
+        offsets = np.repeat(starts - np.cumsum(lengths) + lengths, lengths) + np.arange(lengths.sum())
+        hits = np.repeat(rows, lengths) * columns + self._postings[offsets]
+        return np.bincount(hits, minlength=row_count * columns).reshape(row_count, columns).astype(np.float32)
+
+    def shared_trigrams(self, titles):
+        """(shared counts, query sizes): trigrams each normalized title (rows) shares with each book (columns)"""
+        query_sizes = np.empty(len(titles), dtype=np.float32)
+        rows, grams = [], []
+        for row, title in enumerate(titles):
+            query = trigrams(title)
+            query_sizes[row] = len(query)
+            for gram in query:
+                gram_id = self.vocabulary.get(gram)
+                if gram_id is not None:
+                    rows.append(row)
+                    grams.append(gram_id)
+        shared = self._shared(np.array(rows, dtype=np.int64), np.array(grams, dtype=np.int64), len(titles))
+        return shared, query_sizes
+
+    def self_scores(self):
+        """Title Jaccard of every book against every other (the diagonal is 1)"""
+        shared = self._shared(self._entry_rows, self._entry_grams, len(self.books))
+        return shared / (self.sizes[:, None] + self.sizes[None, :] - shared)
+
+    def best_matches(self, books, threshold: float, containment: float = None):
+        """Index of the best matching book for each query book dict, or None.
+
+        Candidates need a title Jaccard of `threshold` (or, if given, `containment` of the
+        shorter title's trigrams), equal title numbers and agreeing authors.
+        """
+        keys = [book_key(book.get('title', ''), book.get('author', '')) for book in books]
+        shared, query_sizes = self.shared_trigrams([title for title, _ in keys])
+        scores = shared / (query_sizes[:, None] + self.sizes[None, :] - shared)
+        eligible = scores >= threshold
+        if containment is not None:
+            eligible |= shared / np.maximum(np.minimum(query_sizes[:, None], self.sizes[None, :]), 1) >= containment
+
+        matches = []
+        for row, (title, author) in enumerate(keys):
+            candidates = np.flatnonzero(eligible[row])
+            best = None
+            for entry in candidates[np.argsort(-scores[row, candidates], kind='stable')]:
+                if self.numbers[entry] == numbers(title) and authors_agree(author, self.keys[entry][1]):
+                    best = int(entry)
+                    break
+            matches.append(best)
+        return matches
+
+
+def dedupe_books(books, threshold: float = FUZZY_DEDUPE_THRESHOLD):
+    """Collapse OCR variants of the same book (e.g. "Harry Poter" / "Harry Potter"), keeping
+    the first spelling seen and filling in a genre from its variants"""
+    if len(books) < 2:
+        return list(books)
+    matcher = BookMatcher(books)
+    # Only the few similar pairs above the diagonal need a closer look, in shelf order
+    similar = np.argwhere(np.triu(matcher.self_scores() >= threshold, k=1))
+    merged = {}  # variant index -> kept index
+    for i, j in similar.tolist():
+        if i in merged or j in merged:
+            continue
+        if matcher.numbers[i] == matcher.numbers[j] and authors_agree(matcher.keys[i][1], matcher.keys[j][1]):
+            merged[j] = i
+    kept = [i for i in range(len(books)) if i not in merged]
+
+    result = {i: dict(books[i]) for i in kept}
+    for variant, i in merged.items():
+        if not result[i].get('genre') and books[variant].get('genre'):
+            result[i]['genre'] = books[variant]['genre']
+    return [result[i] for i in kept]
+
+
+class Reconciler:
+    """Snaps model recommendations onto the books it was offered.
+
+    Re-spelled titles take the canonical title/author from the list; books that are not
+    on the list, and repeats of one already returned, are dropped (`snap` returns None).
+    """
+
+    def __init__(self, books, threshold: float = RECONCILE_THRESHOLD, containment: float = RECONCILE_CONTAINMENT):
+        self.matcher = BookMatcher(books)
+        self.threshold = threshold
+        self.containment = containment
+        self.used = set()
+        self.stats = {'exact': 0, 'snapped': 0, 'dropped': 0}
+
+    def snap(self, recommendation: dict):
+        entry = self.matcher.best_matches([recommendation], self.threshold, self.containment)[0] if self.matcher.books else None
+        if entry is None or entry in self.used:
+            self.stats['dropped'] += 1
+            return None
+        self.used.add(entry)
+        book = self.matcher.books[entry]
+        if (recommendation.get('title'), recommendation.get('author')) == (book.get('title'), book.get('author')):
+            self.stats['exact'] += 1
+            return recommendation
+        self.stats['snapped'] += 1
+        return {**recommendation, 'title': book.get('title'), 'author': book.get('author')}
+
+
+def reconcile(recommendations, books):
+    """Recommendations snapped onto `books`, minus hallucinated and duplicate entries; plus stats"""
+    reconciler = Reconciler(books)
+    snapped = [reconciler.snap(recommendation) for recommendation in recommendations]
+    return [recommendation for recommendation in snapped if recommendation is not None], reconciler.stats
@@ -0,0 +1,88 @@
+import hashlib
+import uuid
+from datetime import datetime, timezone
+
+import pandas as pd
+
+from database import get_goodreads_library_hashes, apply_goodreads_library_changes
+from normalize import book_key
+
+
+def _value(value):
+    return None if value is None or pd.isna(value) else value
+
+
+def _parse_date(value):
+    value = _value(value)
+    if not value:
+        return None
+    try:
+        return datetime.strptime(value, '%Y/%m/%d').date()
+    except ValueError:
+        return None
+
+
+class GoodreadsLibraryImport:
+    """Incrementally syncs a streamed Goodreads export into goodreads_books.
+
+    Pass `add_chunk` as the on_chunk callback of summarize_goodreads_export, then
+    call `finish()`, all inside one unit_of_work() so an import that fails part-way
+    leaves the library as it was. Only new and changed rows are written; rows that
+    disappeared from the export are deleted.
+    """
+
+    def __init__(self, user_id: str):
+        self.user_id = uuid.UUID(user_id)
+        self.existing = get_goodreads_library_hashes(user_id)
+        self.seen = set()
+        self.stats = {'inserted': 0, 'updated': 0, 'unchanged': 0, 'deleted': 0}
+
+    def add_chunk(self, chunk):
+        now = datetime.now(timezone.utc)
+        inserts, updates = [], []
+        for title, author, rating, shelf, date_read in chunk[['Title', 'Author', 'My Rating', 'Exclusive Shelf', 'Date Read']].itertuples(index=False):
+            title, author = _value(title), _value(author) or ''
+            if not title:
+                continue
+            key = book_key(title, author)
+            if key in self.seen:  # duplicate row in the export - first one wins
+                continue
+            self.seen.add(key)
+
+            rating, shelf, date_read = int(rating), _value(shelf), _parse_date(date_read)
+            row_hash = hashlib.md5(f"{title}|{author}|{rating}|{shelf}|{date_read}".encode()).hexdigest()
+            existing = self.existing.get(key)
+            if existing and existing[1] == row_hash:
+                self.stats['unchanged'] += 1
+                continue
+
+            row = {
+                'title': title,
+                'author': author,
+                'rating': rating,
+                'exclusive_shelf': shelf,
+                'date_read': date_read,
+                'row_hash': row_hash,
+                'imported_at': now
+            }
+            if existing:
+                updates.append({'id': existing[0], **row})
+            else:
+                inserts.append({
+                    'user_id': self.user_id,
+                    'normalized_title': key[0],
+                    'normalized_author': key[1],
+                    **row
+                })
+
+        if inserts or updates:
+            apply_goodreads_library_changes(inserts, updates)
+        self.stats['inserted'] += len(inserts)
+        self.stats['updated'] += len(updates)
+
+    def finish(self):
+        removed = [row_id for key, (row_id, _) in self.existing.items() if key not in self.seen]
+        if removed:
+            apply_goodreads_library_changes([], [], removed)
+        self.stats['deleted'] = len(removed)
+        return self.stats
@@ -0,0 +1,93 @@
+import atexit
+import logging
+import os
+import threading
+from datetime import datetime, timezone
+
+from cache import TTLCache
+from database import get_or_create_user, touch_users
+
+logger = logging.getLogger(__name__)
+
+# device_id -> user lookups served from a cache; only a real miss touches the database
+IDENTITY_CACHE_SIZE = int(os.getenv('IDENTITY_CACHE_SIZE', 10000))
+IDENTITY_CACHE_TTL_SECONDS = int(os.getenv('IDENTITY_CACHE_TTL_SECONDS', 15 * 60))
+LAST_ACTIVE_FLUSH_SECONDS = float(os.getenv('LAST_ACTIVE_FLUSH_SECONDS', 30))
+
+# Any object with get(key) and set(key, value) works here, e.g. a thin Redis wrapper shared by all workers
+_store = TTLCache(max_size=IDENTITY_CACHE_SIZE, ttl_seconds=IDENTITY_CACHE_TTL_SECONDS)
+_pending_last_active = {}  # user_id -> latest activity not yet written
+_pending_lock = threading.Lock()
+_flusher = None
+
+
+def set_identity_store(store):
+    """Swap the in-process cache for a shared store"""
+    global _store
+    _store = store
+
+
+def _touch(user):
+    with _pending_lock:
+        _pending_last_active[user['id']] = datetime.now(timezone.utc)
+
+
+def get_user(device_id: str):
+    """Cached replacement for database.get_or_create_user"""
+    user = _store.get(device_id)
+    if user is None:
+        user = get_or_create_user(device_id)
+        _store.set(device_id, user)
+    else:
+        _touch(user)
+    return user
+
+
+async def aget_user(device_id: str):
+    """get_user for the ASGI app: a cache miss goes through the async engine"""
+    from database_async import call  # only the ASGI app needs the async drivers
+    user = _store.get(device_id)
+    if user is None:
+        user = await call(get_or_create_user, device_id)
+        _store.set(device_id, user)
+    else:
+        _touch(user)
+    return user
+
+
+def flush_last_active():
+    """Write all coalesced last_active updates as one batch"""
+    global _pending_last_active
+    with _pending_lock:
+        batch, _pending_last_active = _pending_last_active, {}
+    if not batch:
+        return 0
+    try:
+        touch_users(batch)
+    except Exception as e:
+        logger.warning("⚠️  last_active flush failed: %s", e)
+        with _pending_lock:
+            for user_id, last_active in batch.items():
+                _pending_last_active.setdefault(user_id, last_active)
+        return 0
+    return len(batch)
+
+
+def _flush_forever(interval_seconds: float, stop_event: threading.Event):
+    while not stop_event.wait(interval_seconds):
+        flush_last_active()
+
+
+def start_last_active_flusher(interval_seconds: float = LAST_ACTIVE_FLUSH_SECONDS):
+    """Start the background flush timer (once per process); pending updates are also flushed at exit"""
+    global _flusher
+    if _flusher is None:
+        _flusher = threading.Event()
+        threading.Thread(
+            target=_flush_forever,
+            args=(interval_seconds, _flusher),
+            name='last-active-flusher',
+            daemon=True
+        ).start()
+        atexit.register(flush_last_active)
+    return _flusher
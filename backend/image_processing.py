@@ -0,0 +1,131 @@
+import base64
+import io
+import logging
+import math
+import os
+import time
+
+from PIL import Image, ImageOps
+
+logger = logging.getLogger(__name__)
+
+# The vision model scales images to fit 2048x2048 and then to a 768px short side,
+# so any pixels beyond that are upload and decode cost with no accuracy benefit
+VISION_MAX_LONG_SIDE = int(os.getenv('VISION_MAX_LONG_SIDE', 2048))
+VISION_MAX_SHORT_SIDE = int(os.getenv('VISION_MAX_SHORT_SIDE', 768))
+VISION_JPEG_QUALITY = int(os.getenv('VISION_JPEG_QUALITY', 85))
+# Shelves wider (or taller) than this aspect ratio are split into overlapping tiles
+TILE_ASPECT_THRESHOLD = float(os.getenv('TILE_ASPECT_THRESHOLD', 2.5))
+TILE_TARGET_ASPECT = float(os.getenv('TILE_TARGET_ASPECT', 1.5))
+TILE_OVERLAP = float(os.getenv('TILE_OVERLAP', 0.15))
+MAX_TILES = int(os.getenv('MAX_TILES', 6))
+
+_EXIF_ORIENTATION = 0x0112
+_TRANSPOSED_ORIENTATIONS = (5, 6, 7, 8)
+
+
+class PreparedShelf:
+    """Model-ready JPEG tiles (base64) for one shelf photo, plus what preprocessing cost and saved"""
+
+    def __init__(self, tiles: list, stats: dict):
+        self.tiles = tiles
+        self.stats = stats
+
+
+def _tile_boxes(width: int, height: int):
+    """Overlapping crop boxes along the long axis, or a single full-image box"""
+    horizontal = width >= height
+    long_side, short_side = (width, height) if horizontal else (height, width)
+    if long_side / short_side <= TILE_ASPECT_THRESHOLD:
+        return [(0, 0, width, height)]
+
+    count = min(MAX_TILES, math.ceil((long_side / short_side - TILE_OVERLAP * TILE_TARGET_ASPECT) /
+                                     (TILE_TARGET_ASPECT * (1 - TILE_OVERLAP))))
+    count = max(count, 2)
+    tile_long = long_side / (count - (count - 1) * TILE_OVERLAP)
+    step = tile_long * (1 - TILE_OVERLAP)
+
+    boxes = []
+    for i in range(count):
+        start = round(i * step)
+        end = long_side if i == count - 1 else round(i * step + tile_long)
+        boxes.append((start, 0, end, height) if horizontal else (0, start, width, end))
+    return boxes
+
+
+def _scale_for(width: int, height: int) -> float:
+    long_side, short_side = max(width, height), min(width, height)
+    return min(1.0, VISION_MAX_LONG_SIDE / long_side, VISION_MAX_SHORT_SIDE / short_side)
+
+
+def _encode_jpeg(image):
+    buffer = io.BytesIO()
+    image.save(buffer, format='JPEG', quality=VISION_JPEG_QUALITY, optimize=True)
+    return base64.b64encode(buffer.getvalue()).decode('ascii'), buffer.tell()
+
+
+def preprocess_image(image) -> PreparedShelf:
+    """Orient, downscale, tile and re-encode a ShelfImage for the vision model.
+
+    Falls back to the original upload untouched if Pillow can't decode it.
+    """
+    started = time.perf_counter()
+    try:
+        source = Image.open(image.open())
+        source_format = source.format
+        width, height = source.size
+        orientation = source.getexif().get(_EXIF_ORIENTATION)
+        if orientation in _TRANSPOSED_ORIENTATIONS:
+            width, height = height, width
+
+        # Let the JPEG decoder skip resolution we are going to throw away anyway
+        boxes = _tile_boxes(width, height)
+        draft_scale = min(_scale_for(right - left, bottom - top) for left, top, right, bottom in boxes)
+        source.draft('RGB', (math.ceil(source.size[0] * draft_scale), math.ceil(source.size[1] * draft_scale)))
+        decoded = ImageOps.exif_transpose(source).convert('RGB')
+    except Exception as e:
+        logger.warning("⚠️  Image preprocessing skipped: %s", e)
+        return PreparedShelf([image.to_base64()], {
+            'skipped': True,
+            'original_bytes': image.size,
+            'output_bytes': image.size,
+            'bytes_saved': 0,
+            'tiles': 1,
+        })
+
+    # Drafting may have shrunk the image; map the tile boxes onto its real size
+    ratio_x, ratio_y = decoded.size[0] / width, decoded.size[1] / height
+    boxes = [(round(l * ratio_x), round(t * ratio_y), round(r * ratio_x), round(b * ratio_y)) for l, t, r, b in boxes]
+
+    decode_ms = (time.perf_counter() - started) * 1000
+    tiles = []
+    output_bytes = 0
+    resize_ms = encode_ms = 0.0
+    for box in boxes:
+        tile = decoded.crop(box) if len(boxes) > 1 else decoded
+        resize_started = time.perf_counter()
+        scale = _scale_for(*tile.size)
+        if scale < 1.0:
+            tile = tile.resize((max(1, round(tile.size[0] * scale)), max(1, round(tile.size[1] * scale))), Image.LANCZOS)
+        encode_started = time.perf_counter()
+        tile_base64, tile_bytes = _encode_jpeg(tile)
+        resize_ms += encode_started - resize_started
+        encode_ms += time.perf_counter() - encode_started
+        tiles.append(tile_base64)
+        output_bytes += tile_bytes
+
+    # An upright JPEG that was already small enough is better sent as-is than re-encoded
+    if len(tiles) == 1 and source_format == 'JPEG' and orientation in (None, 1) and output_bytes >= image.size:
+        tiles = [image.to_base64()]
+        output_bytes = image.size
+
+    return PreparedShelf(tiles, {
+        'decode_ms': round(decode_ms, 1),
+        'resize_ms': round(resize_ms * 1000, 1),
+        'encode_ms': round(encode_ms * 1000, 1),
+        'original_size': [width, height],
+        'tiles': len(tiles),
+        'original_bytes': image.size,
+        'output_bytes': output_bytes,
+        'bytes_saved': image.size - output_bytes,
+    })
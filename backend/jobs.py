@@ -0,0 +1,207 @@
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+
+from analysis import detect_books, reading_status, stream_recommend_books, with_reading_status
+from database import (
+    create_analysis_job,
+    update_analysis_job,
+    get_analysis_job,
+    fail_stale_analysis_job,
+    save_user_preferences,
+    save_analysis_session,
+    unit_of_work
+)
+from metrics import timed
+from resilience import REQUEST_BUDGET_SECONDS, start_budget, submit
+
+logger = logging.getLogger(__name__)
+
+# Background /analyze jobs: a bounded pool per worker process, state persisted in analysis_jobs
+ANALYSIS_JOB_WORKERS = int(os.getenv('ANALYSIS_JOB_WORKERS', 4))
+ANALYSIS_JOB_MAX_PENDING = int(os.getenv('ANALYSIS_JOB_MAX_PENDING', 32))
+JOB_EVENT_POLL_SECONDS = float(os.getenv('JOB_EVENT_POLL_SECONDS', 1.0))
+JOB_EVENT_TIMEOUT_SECONDS = float(os.getenv('JOB_EVENT_TIMEOUT_SECONDS', 180))
+# An unfinished job whose row hasn't changed for this long lost its worker process (deploy, crash,
+# OOM kill) and is reported failed. The default allows for a job queued behind a full backlog,
+# each job ahead of it spending up to the whole request budget.
+JOB_STALE_SECONDS = float(os.getenv('JOB_STALE_SECONDS',
+                                    (ANALYSIS_JOB_MAX_PENDING // ANALYSIS_JOB_WORKERS + 1) * REQUEST_BUDGET_SECONDS + 60))
+_FINISHED = ('completed', 'failed')
+
+_executor = ThreadPoolExecutor(max_workers=ANALYSIS_JOB_WORKERS, thread_name_prefix='analysis-job')
+_pending = threading.BoundedSemaphore(ANALYSIS_JOB_MAX_PENDING)
+_jobs = {}  # job_id -> _LocalJob, for jobs running in this process
+_jobs_lock = threading.Lock()
+
+
+class JobQueueFull(Exception):
+    pass
+
+
+class _LocalJob:
+    """In-memory view of a running job that SSE subscribers can wait on"""
+
+    def __init__(self, record: dict):
+        self.record = record
+        self.version = 0
+        self.changed = threading.Condition()
+
+    def update(self, **fields):
+        with self.changed:
+            self.record = {**self.record, **fields}
+            self.version += 1
+            self.changed.notify_all()
+
+    def wait_for_change(self, seen_version: int, timeout: float):
+        with self.changed:
+            self.changed.wait_for(lambda: self.version != seen_version, timeout)
+            return self.version, self.record
+
+
+def _publish(job: _LocalJob, **fields):
+    """Persist first so other workers polling the table see the same state"""
+    update_analysis_job(job.record['job_id'], **fields)
+    job.update(**fields)
+
+
+def _run_job(job: _LocalJob, image, preferences):
+    job_id = job.record['job_id']
+    user_id = job.record['user_id']
+    # Runs in a copy of the queueing request's context (its request id correlates the log lines),
+    # but with a budget of its own from when it actually starts
+    start_budget()
+    try:
+        with timed('save_preferences'):
+            save_user_preferences(user_id, preferences)
+
+        _publish(job, status='detecting')
+        with timed('detect_books'):
+            detected_books, _ = detect_books(image, user_id)
+        image.close()  # release the upload buffer before the second model call
+        logger.info("📚 Job %s detected %s books", job_id[:8], len(detected_books))
+        # Clients get the shelf contents now, before the recommendation round-trip
+        _publish(job, status='recommending', detected_books=detected_books)
+
+        status = reading_status(user_id, detected_books)  # one query for the shelf, none per recommendation
+        recommendations, flagged = [], []
+        started = time.monotonic()
+        for recommendation in stream_recommend_books(preferences, detected_books, user_id):
+            if not recommendations:
+                logger.info("⏱️ Job %s first recommendation after %.0f ms", job_id[:8], (time.monotonic() - started) * 1000)
+            recommendations.append(recommendation)
+            flagged.extend(with_reading_status(user_id, [recommendation], status))
+            # Subscribers in this process see each recommendation as it completes; the table gets the final list
+            job.update(recommendations=list(flagged))
+        # The session row and the job's final state commit together
+        with timed('save_analysis_session'), unit_of_work():
+            save_analysis_session(user_id, detected_books, recommendations, session_id=job_id)
+            update_analysis_job(job_id, status='completed', recommendations=flagged)
+        job.update(status='completed', recommendations=flagged)
+        logger.info("⭐ Job %s completed with %s recommendations", job_id[:8], len(recommendations))
+    except Exception as e:
+        logger.exception("❌ Job %s failed: %s", job_id[:8], e)
+        try:
+            _publish(job, status='failed', error=str(e))
+        except Exception:
+            job.update(status='failed', error=str(e))
+    finally:
+        image.close()
+        _pending.release()
+        with _jobs_lock:
+            _jobs.pop(job_id, None)
+
+
+def submit_analysis_job(user_id: str, image, preferences: dict):
+    """Persist a new job and queue it; the job takes ownership of `image`"""
+    if not _pending.acquire(blocking=False):
+        raise JobQueueFull("Too many analyses in progress, please retry shortly")
+    try:
+        record = create_analysis_job(user_id)
+    except Exception:
+        _pending.release()
+        raise
+
+    job = _LocalJob(record)
+    with _jobs_lock:
+        _jobs[record['job_id']] = job
+    submit(_executor, _run_job, job, image, preferences)
+    return record
+
+
+def _is_stale(record: dict) -> bool:
+    updated_at = datetime.fromisoformat(record['updated_at'] or record['created_at'])
+    if updated_at.tzinfo is None:
+        updated_at = updated_at.replace(tzinfo=timezone.utc)  # stored as naive UTC
+    return datetime.now(timezone.utc) - updated_at > timedelta(seconds=JOB_STALE_SECONDS)
+
+
+def _stored_job(job_id: str, user_id: str):
+    """A job not running in this process, as persisted; one left unfinished by a dead worker is failed first"""
+    record = get_analysis_job(job_id, user_id)
+    if record and record['status'] not in _FINISHED and _is_stale(record):
+        logger.warning("💀 Job %s stuck in '%s' since %s, marking it failed", job_id[:8], record['status'], record['updated_at'])
+        fail_stale_analysis_job(job_id, JOB_STALE_SECONDS, 'Analysis was interrupted, please try again')
+        record = get_analysis_job(job_id, user_id)
+    return record
+
+
+def get_job(job_id: str, user_id: str):
+    with _jobs_lock:
+        job = _jobs.get(job_id)
+    if job and job.record['user_id'] == user_id:
+        return job.record
+    return _stored_job(job_id, user_id)
+
+
+def sse_event(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+def job_events(job_id: str, user_id: str):
+    """Server-sent events for a job: status changes, detected_books as soon as they exist, each
+    recommendation as the model completes it, then the result"""
+    deadline = time.monotonic() + JOB_EVENT_TIMEOUT_SECONDS
+    sent_status = sent_books = None
+    sent_recommendations = 0
+    version = -1
+    while True:
+        with _jobs_lock:
+            job = _jobs.get(job_id)
+        if job and job.record['user_id'] == user_id:
+            # Running here - block on the condition instead of polling the database
+            version, record = job.wait_for_change(version, JOB_EVENT_POLL_SECONDS)
+        else:
+            record = _stored_job(job_id, user_id)
+            if record is None:
+                yield sse_event('error', {'error': 'Job not found'})
+                return
+
+        emitted = False
+        if record['status'] != sent_status:
+            sent_status = record['status']
+            emitted = True
+            yield sse_event('status', {'status': sent_status})
+        if record['detected_books'] is not None and sent_books is None:
+            sent_books = record['detected_books']
+            yield sse_event('detected_books', {'detected_books': sent_books})
+        recommendations = record.get('recommendations') or []
+        for recommendation in recommendations[sent_recommendations:]:
+            emitted = True
+            yield sse_event('recommendation', {'recommendation': recommendation})
+        sent_recommendations = max(sent_recommendations, len(recommendations))
+        if record['status'] in _FINISHED:
+            yield sse_event('done', record)
+            return
+
+        if time.monotonic() > deadline:
+            yield sse_event('timeout', {'status': record['status']})
+            return
+        if not job:
+            time.sleep(JOB_EVENT_POLL_SECONDS)
+        elif not emitted:
+            yield ": keep-alive\n\n"
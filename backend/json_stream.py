@@ -0,0 +1,68 @@
+import json
+import re
+
+
+class JSONArrayStream:
+    """Incremental parser for a streamed JSON object such as {"recommendations": [{...}, {...}]}.
+
+    Feed it text deltas as they arrive; `feed` returns every element of the array under
+    `key` that became complete, so callers can act on the first item while the model is
+    still writing the rest. Only the unfinished tail of the document is kept in memory.
+    """
+
+    def __init__(self, key: str):
+        self._start = re.compile(r'"%s"\s*:\s*\[' % re.escape(key))
+        self.buffer = ''
+        self.pos = 0           # next character to scan
+        self.in_array = False
+        self.done = False
+        self.depth = 0         # nesting depth inside the current element
+        self.in_string = False
+        self.escaped = False
+        self.item_start = None
+
+    def feed(self, text: str) -> list:
+        if self.done:
+            return []
+        self.buffer += text
+        if not self.in_array:
+            match = self._start.search(self.buffer)
+            if not match:
+                return []
+            self.in_array = True
+            self.buffer = self.buffer[match.end():]
+            self.pos = 0
+
+        items = []
+        buffer = self.buffer
+        for i in range(self.pos, len(buffer)):
+            ch = buffer[i]
+            if self.in_string:
+                if self.escaped:
+                    self.escaped = False
+                elif ch == '\\':
+                    self.escaped = True
+                elif ch == '"':
+                    self.in_string = False
+            elif ch == '"':
+                self.in_string = True
+            elif ch in '{[':
+                if self.depth == 0:
+                    self.item_start = i
+                self.depth += 1
+            elif ch in '}]':
+                if self.depth == 0:  # the array itself closed
+                    self.done = True
+                    break
+                self.depth -= 1
+                if self.depth == 0:
+                    items.append(json.loads(buffer[self.item_start:i + 1]))
+                    self.item_start = None
+
+        # Drop everything already consumed except a partial element
+        keep_from = self.item_start if self.item_start is not None else len(buffer)
+        self.buffer = buffer[keep_from:]
+        self.pos = len(buffer) - keep_from
+        if self.item_start is not None:
+            self.item_start = 0
+        return items
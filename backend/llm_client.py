@@ -0,0 +1,197 @@
+import asyncio
+import os
+import threading
+import time
+import weakref
+from contextlib import ExitStack, contextmanager
+
+import httpx
+from openai import OpenAI, AsyncOpenAI
+
+from metrics import llm_queue_seconds, llm_request_seconds, llm_tokens
+from resilience import CallPolicy, CircuitBreaker, DeadlineExceeded, UpstreamUnavailable, bounded
+
+# One pooled, keep-alive OpenAI client per process (plus one async client per event loop).
+# OPENAI_BASE_URL / OPENAI_API_KEY are read by the SDK, so pointing at a local stub needs no code changes.
+# Every call goes through one CallPolicy (resilience.py) instead of the SDK's own retries: attempts
+# are cut to the request's remaining budget, retried with jitter, optionally hedged, and refused
+# outright while the circuit breaker is open.
+OPENAI_MAX_CONNECTIONS = int(os.getenv('OPENAI_MAX_CONNECTIONS', 20))
+OPENAI_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv('OPENAI_MAX_KEEPALIVE_CONNECTIONS', 10))
+OPENAI_KEEPALIVE_EXPIRY_SECONDS = float(os.getenv('OPENAI_KEEPALIVE_EXPIRY_SECONDS', 60))
+OPENAI_CONCURRENCY = int(os.getenv('OPENAI_CONCURRENCY', 8))
+OPENAI_TIMEOUT_SECONDS = float(os.getenv('OPENAI_TIMEOUT_SECONDS', 90))
+OPENAI_CONNECT_TIMEOUT_SECONDS = float(os.getenv('OPENAI_CONNECT_TIMEOUT_SECONDS', 5))
+OPENAI_MAX_RETRIES = int(os.getenv('OPENAI_MAX_RETRIES', 2))
+OPENAI_RETRY_BASE_SECONDS = float(os.getenv('OPENAI_RETRY_BASE_SECONDS', 0.5))
+OPENAI_RETRY_MAX_SECONDS = float(os.getenv('OPENAI_RETRY_MAX_SECONDS', 8))
+OPENAI_HEDGE_AFTER_SECONDS = float(os.getenv('OPENAI_HEDGE_AFTER_SECONDS', 0))  # 0 = never send a duplicate
+OPENAI_MAX_HEDGES = int(os.getenv('OPENAI_MAX_HEDGES', 2))  # duplicates in flight per process
+OPENAI_BREAKER_FAILURES = int(os.getenv('OPENAI_BREAKER_FAILURES', 5))  # consecutive failures; 0 = no breaker
+OPENAI_BREAKER_RESET_SECONDS = float(os.getenv('OPENAI_BREAKER_RESET_SECONDS', 30))
+
+_client = None
+_client_lock = threading.Lock()
+_semaphore = threading.BoundedSemaphore(OPENAI_CONCURRENCY)
+_async_clients = weakref.WeakKeyDictionary()  # event loop -> (AsyncOpenAI, asyncio.Semaphore)
+
+policy = CallPolicy(
+    'openai',
+    retries=OPENAI_MAX_RETRIES,
+    attempt_timeout=OPENAI_TIMEOUT_SECONDS,
+    backoff_base=OPENAI_RETRY_BASE_SECONDS,
+    backoff_max=OPENAI_RETRY_MAX_SECONDS,
+    hedge_after=OPENAI_HEDGE_AFTER_SECONDS,
+    max_hedges=OPENAI_MAX_HEDGES,
+    breaker=CircuitBreaker('openai', OPENAI_BREAKER_FAILURES, OPENAI_BREAKER_RESET_SECONDS),
+    threads=OPENAI_CONCURRENCY + OPENAI_MAX_HEDGES
+)
+
+
+def _limits():
+    return httpx.Limits(
+        max_connections=OPENAI_MAX_CONNECTIONS,
+        max_keepalive_connections=OPENAI_MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=OPENAI_KEEPALIVE_EXPIRY_SECONDS
+    )
+
+
+def _timeout(seconds: float = OPENAI_TIMEOUT_SECONDS):
+    return httpx.Timeout(seconds, connect=min(OPENAI_CONNECT_TIMEOUT_SECONDS, seconds))
+
+
+def get_client() -> OpenAI:
+    """The process-wide sync client; its connection pool is reused across requests"""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = OpenAI(
+                    http_client=httpx.Client(limits=_limits(), timeout=_timeout()),
+                    timeout=_timeout(),
+                    max_retries=0  # retried by `policy`
+                )
+    return _client
+
+
+@contextmanager
+def _slot(timeout: float = OPENAI_TIMEOUT_SECONDS):
+    """A concurrency slot, recording how long the caller queued for it. The wait is bounded by
+    `timeout` and the request's budget: DeadlineExceeded / UpstreamUnavailable instead of queueing forever"""
+    started = time.perf_counter()
+    acquired = _semaphore.acquire(timeout=bounded(timeout))
+    llm_queue_seconds.observe(time.perf_counter() - started)
+    if not acquired:
+        bounded(timeout)  # DeadlineExceeded if the budget ran out while queueing
+        raise UpstreamUnavailable(f"No free model API slot within {timeout:.0f}s ({OPENAI_CONCURRENCY} calls in flight)")
+    try:
+        yield
+    finally:
+        _semaphore.release()
+
+
+def _record_usage(model, usage):
+    if usage is not None:
+        llm_tokens.inc(usage.prompt_tokens or 0, model, 'prompt')
+        llm_tokens.inc(usage.completion_tokens or 0, model, 'completion')
+
+
+def chat_completion(**kwargs):
+    """chat.completions.create on the shared client under `policy`, at most OPENAI_CONCURRENCY attempts in flight per process"""
+    def attempt(timeout):
+        with _slot(timeout):
+            # Time spent queueing for the slot comes out of the budget too
+            timeout = bounded(timeout)
+            started = time.perf_counter()
+            try:
+                return get_client().chat.completions.create(timeout=_timeout(timeout), **kwargs)
+            finally:
+                llm_request_seconds.observe(time.perf_counter() - started, kwargs.get('model'), 'false')
+
+    response = policy.call(attempt)
+    _record_usage(kwargs.get('model'), getattr(response, 'usage', None))
+    return response
+
+
+def chat_completion_stream(**kwargs):
+    """Streamed chat completion yielding content deltas; holds a concurrency slot until the stream ends or is closed"""
+    model = kwargs.get('model')
+
+    def open_stream(timeout):
+        # Each attempt takes its own slot and gives it back if it fails, so none is held through the retry backoff
+        with ExitStack() as slot:
+            slot.enter_context(_slot(timeout))
+            timeout = bounded(timeout)
+            deadline = time.monotonic() + timeout
+            stream = get_client().chat.completions.create(stream=True, timeout=_timeout(timeout), **kwargs)
+            return slot.pop_all(), stream, deadline
+
+    started = time.perf_counter()
+    chunks = 0
+    # Only opening the stream is retried (never hedged): once deltas have been yielded there is no going back.
+    # The attempt's timeout (already cut to the budget) covers the whole stream: it bounds each socket read,
+    # and is checked between chunks so a response trickling in under the read timeout can't outlast it
+    slot, stream, deadline = policy.call(open_stream, hedge=False)
+    with slot:
+        try:
+            for chunk in stream:
+                if time.monotonic() > deadline:
+                    raise DeadlineExceeded("Model stream abandoned: it ran past its attempt timeout")
+                if chunk.choices and chunk.choices[0].delta.content:
+                    chunks += 1
+                    yield chunk.choices[0].delta.content
+        finally:
+            stream.response.close()
+            llm_request_seconds.observe(time.perf_counter() - started, model, 'true')
+            # Streamed responses carry no usage block; the API sends about one token per content chunk
+            llm_tokens.inc(chunks, model, 'completion')
+
+
+def get_async_client() -> AsyncOpenAI:
+    """Async client for the running event loop (httpx async pools can't be shared across loops)"""
+    return _async_state()[0]
+
+
+def _async_state():
+    loop = asyncio.get_running_loop()
+    state = _async_clients.get(loop)
+    if state is None:
+        client = AsyncOpenAI(
+            http_client=httpx.AsyncClient(limits=_limits(), timeout=_timeout()),
+            timeout=_timeout(),
+            max_retries=0
+        )
+        state = _async_clients[loop] = (client, asyncio.Semaphore(OPENAI_CONCURRENCY))
+    return state
+
+
+async def achat_completion(**kwargs):
+    client, semaphore = _async_state()
+
+    async def attempt(timeout):
+        started = time.perf_counter()
+        async with semaphore:
+            llm_queue_seconds.observe(time.perf_counter() - started)
+            started = time.perf_counter()
+            try:
+                return await client.chat.completions.create(timeout=_timeout(bounded(timeout)), **kwargs)
+            finally:
+                llm_request_seconds.observe(time.perf_counter() - started, kwargs.get('model'), 'false')
+
+    response = await policy.acall(attempt)
+    _record_usage(kwargs.get('model'), getattr(response, 'usage', None))
+    return response
+
+
+async def achat_completion_batch(requests: list):
+    """Issue several chat completions concurrently over the shared async pool; results keep input order"""
+    return await asyncio.gather(*(achat_completion(**kwargs) for kwargs in requests))
+
+
+def close_clients():
+    global _client
+    with _client_lock:
+        if _client is not None:
+            _client.close()
+            _client = None
+    _async_clients.clear()
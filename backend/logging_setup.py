@@ -0,0 +1,197 @@
+import atexit
+import contextvars
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+
+# Structured logging: records are stamped with the request id on the calling thread, queued,
+# and formatted/written by one listener thread, so request threads never block on stdout
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO').upper()
+LOG_FORMAT = os.getenv('LOG_FORMAT', 'json')  # 'json' (one object per line) or 'text'
+# Share of INFO/DEBUG records kept; WARNING and above, and records logged with extra=UNSAMPLED
+# (the per-request access line), are never sampled
+LOG_SAMPLE_RATE = float(os.getenv('LOG_SAMPLE_RATE', 1.0))
+# Max INFO/DEBUG records per second for any one message template (0 = unlimited)
+LOG_RATE_LIMIT_PER_SECOND = float(os.getenv('LOG_RATE_LIMIT_PER_SECOND', 20))
+LOG_QUEUE_SIZE = int(os.getenv('LOG_QUEUE_SIZE', 10000))
+UNSAMPLED = {'_sampled': False}  # `extra` for lines that must never be sampled or rate-limited
+
+_request_id = contextvars.ContextVar('request_id', default=None)
+_listener = None
+_handler = None
+_plain_formatter = logging.Formatter()
+
+# LogRecord attributes that are not user-supplied `extra` fields
+_RESERVED = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime', 'request_id'}
+
+
+def new_request_id() -> str:
+    return uuid.uuid4().hex
+
+
+def set_request_id(request_id: str = None) -> str:
+    """Correlation id for every record logged from this thread/context from now on"""
+    request_id = request_id or new_request_id()
+    _request_id.set(request_id)
+    return request_id
+
+
+def get_request_id():
+    return _request_id.get()
+
+
+class JSONFormatter(logging.Formatter):
+    """One JSON object per line: ts, level, logger, msg, request_id, any `extra` fields, exc"""
+
+    def format(self, record):
+        entry = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage(),
+        }
+        if getattr(record, 'request_id', None):
+            entry['request_id'] = record.request_id
+        for key, value in vars(record).items():
+            if key not in _RESERVED and not key.startswith('_'):
+                entry[key] = value
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry['exc'] = record.exc_text
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class TextFormatter(logging.Formatter):
+    def __init__(self):
+        super().__init__('%(asctime)s %(levelname)s [%(request_id)s] %(name)s: %(message)s')
+
+    def format(self, record):
+        record.request_id = getattr(record, 'request_id', None) or '-'
+        return super().format(record)
+
+
+class ContextFilter(logging.Filter):
+    """Copies the request id onto the record while still on the request thread"""
+
+    def filter(self, record):
+        record.request_id = _request_id.get()
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """Drops a share of INFO/DEBUG records and caps each message template at a per-second rate.
+
+    Records are keyed by their unformatted template (logger.info("Detected %d books", n)), so
+    one chatty line cannot crowd out the others. WARNING and above, and records logged with
+    extra=UNSAMPLED, always pass.
+    """
+
+    def __init__(self, sample_rate: float = LOG_SAMPLE_RATE, per_second: float = LOG_RATE_LIMIT_PER_SECOND):
+        super().__init__()
+        self.sample_rate = sample_rate
+        self.per_second = per_second
+        self._buckets = {}  # (logger, template) -> (tokens, last refill)
+        self._lock = threading.Lock()
+        self.dropped = 0
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING or not getattr(record, '_sampled', True):
+            return True
+        if self.sample_rate < 1 and random.random() >= self.sample_rate:
+            self.dropped += 1
+            return False
+        if self.per_second <= 0:
+            return True
+        key = (record.name, record.msg)
+        now = time.monotonic()
+        with self._lock:
+            tokens, refilled_at = self._buckets.get(key, (self.per_second, now))
+            tokens = min(self.per_second, tokens + (now - refilled_at) * self.per_second)
+            if tokens < 1:
+                self._buckets[key] = (tokens, now)
+                self.dropped += 1
+                return False
+            self._buckets[key] = (tokens - 1, now)
+        return True
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    """Drops (and counts) records instead of blocking when the listener falls behind"""
+
+    dropped = 0
+
+    def prepare(self, record):
+        # Render the message and traceback now (args may be mutated later, tracebacks don't
+        # outlive the frame), but leave JSON encoding to the listener thread. The record is not
+        # copied: this is the root logger's only handler
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = _plain_formatter.formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def configure_logging(level: str = None, fmt: str = None, stream=None, sample_rate: float = None,
+                      per_second: float = None):
+    """Route the root logger through a bounded queue to a background writer.
+
+    Safe to call again (e.g. from a benchmark) - the previous listener is flushed and replaced.
+    """
+    global _listener, _handler
+    stop_logging()
+
+    output = logging.StreamHandler(stream or sys.stdout)
+    output.setFormatter(TextFormatter() if (fmt or LOG_FORMAT) == 'text' else JSONFormatter())
+
+    _handler = _QueueHandler(queue.Queue(LOG_QUEUE_SIZE))
+    _handler.addFilter(SamplingFilter(
+        LOG_SAMPLE_RATE if sample_rate is None else sample_rate,
+        LOG_RATE_LIMIT_PER_SECOND if per_second is None else per_second
+    ))
+    _handler.addFilter(ContextFilter())
+
+    root = logging.getLogger()
+    for existing in list(root.handlers):
+        root.removeHandler(existing)
+    root.addHandler(_handler)
+    root.setLevel(level or LOG_LEVEL)
+
+    _listener = logging.handlers.QueueListener(_handler.queue, output, respect_handler_level=False)
+    _listener.start()
+    return _handler
+
+
+def stop_logging():
+    """Flush queued records and stop the writer thread"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+    if _handler is not None:
+        logging.getLogger().removeHandler(_handler)
+
+
+def logging_stats():
+    if _handler is None:
+        return {}
+    sampled = sum(f.dropped for f in _handler.filters if isinstance(f, SamplingFilter))
+    return {'queued': _handler.queue.qsize(), 'dropped_queue_full': _handler.dropped, 'dropped_sampled': sampled}
+
+
+atexit.register(stop_logging)
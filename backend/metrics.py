@@ -0,0 +1,273 @@
+import functools
+import inspect
+import math
+import os
+import sys
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:  # not POSIX - no peak RSS sample
+    resource = None
+
+# In-process metrics with a Prometheus text exposition (/metrics). Recording is a bisect plus a
+# few integer adds under a per-series lock that is never held across I/O; everything else
+# (quantile estimates, pool gauges) is computed at scrape time.
+METRICS_PREFIX = os.getenv('METRICS_PREFIX', 'bookscanner')
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120)
+QUANTILES = (0.5, 0.95, 0.99)
+
+_registry = {}  # name -> metric, in registration order
+_registry_lock = threading.Lock()
+_collectors = []  # callables returning [(name, help, type, [(labels, value)])] at scrape time
+
+
+def _label_text(names, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    pairs += [f'{name}="{value}"' for name, value in extra]
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _number(value) -> str:
+    if value == math.inf:
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Series:
+    __slots__ = ('lock', 'counts', 'sum', 'count')
+
+    def __init__(self, bucket_count: int):
+        self.lock = threading.Lock()
+        self.counts = [0] * (bucket_count + 1)  # last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._series = {}
+
+    def _get(self, labels):
+        series = self._series.get(labels)
+        if series is None:
+            # setdefault keeps the first series if two threads race to create it
+            series = self._series.setdefault(labels, _Series(len(self.buckets)))
+        return series
+
+    def observe(self, value: float, *labels):
+        index = bisect_left(self.buckets, value)
+        series = self._get(labels)
+        with series.lock:
+            series.counts[index] += 1
+            series.sum += value
+            series.count += 1
+
+    def snapshot(self):
+        """{labels: (cumulative bucket counts, sum, count)}"""
+        result = {}
+        for labels, series in list(self._series.items()):
+            with series.lock:
+                counts, total, count = list(series.counts), series.sum, series.count
+            cumulative, running = [], 0
+            for bucket_count in counts:
+                running += bucket_count
+                cumulative.append(running)
+            result[labels] = (cumulative, total, count)
+        return result
+
+    def quantile(self, q: float, cumulative, count):
+        """Estimate like PromQL histogram_quantile: linear interpolation inside the bucket"""
+        if not count:
+            return math.nan
+        rank = q * count
+        index = bisect_left(cumulative, rank)
+        if index >= len(self.buckets):
+            return self.buckets[-1]
+        lower = self.buckets[index - 1] if index else 0.0
+        below = cumulative[index - 1] if index else 0
+        in_bucket = cumulative[index] - below
+        return lower + (self.buckets[index] - lower) * ((rank - below) / in_bucket if in_bucket else 1)
+
+    def expose(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        quantiles = []
+        for labels, (cumulative, total, count) in self.snapshot().items():
+            for bound, value in zip(self.buckets + (math.inf,), cumulative):
+                lines.append(f"{self.name}_bucket{_label_text(self.labelnames, labels, [('le', _number(bound))])} {value}")
+            lines.append(f"{self.name}_sum{_label_text(self.labelnames, labels)} {_number(total)}")
+            lines.append(f"{self.name}_count{_label_text(self.labelnames, labels)} {count}")
+            for q in QUANTILES:
+                quantiles.append(f"{self.name}_quantile{_label_text(self.labelnames, labels, [('quantile', q)])} "
+                                 f"{_number(self.quantile(q, cumulative, count))}")
+        if quantiles:
+            lines += [f"# HELP {self.name}_quantile {self.help} (p50/p95/p99 estimated from the buckets)",
+                      f"# TYPE {self.name}_quantile gauge"] + quantiles
+        return lines
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, *labels):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def expose(self):
+        with self._lock:
+            values = dict(self._values)
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        lines += [f"{self.name}{_label_text(self.labelnames, labels)} {_number(value)}" for labels, value in values.items()]
+        return lines
+
+
+def _register(metric):
+    with _registry_lock:
+        return _registry.setdefault(metric.name, metric)
+
+
+def histogram(name: str, help: str, labelnames=(), buckets=LATENCY_BUCKETS) -> Histogram:
+    return _register(Histogram(f"{METRICS_PREFIX}_{name}", help, labelnames, buckets))
+
+
+def counter(name: str, help: str, labelnames=()) -> Counter:
+    return _register(Counter(f"{METRICS_PREFIX}_{name}", help, labelnames))
+
+
+def register_collector(collect):
+    """collect() -> [(name, help, 'gauge'|'counter', [(labels dict, value)])], called on every scrape"""
+    _collectors.append(collect)
+    return collect
+
+
+stage_seconds = histogram('stage_seconds', 'Duration of request pipeline stages', ('stage',))
+call_seconds = histogram('call_seconds', 'Duration of instrumented service and database functions', ('function',))
+call_errors = counter('call_errors_total', 'Exceptions raised by instrumented functions and stages', ('function',))
+http_request_seconds = histogram('http_request_seconds', 'Time to response headers per route', ('method', 'endpoint', 'status'))
+llm_tokens = counter('llm_tokens_total', 'Model tokens used, by model and kind (prompt/completion)', ('model', 'kind'))
+llm_request_seconds = histogram('llm_request_seconds', 'Model call duration (full stream for streamed calls)', ('model', 'stream'))
+llm_queue_seconds = histogram('llm_queue_seconds', 'Wait for a model concurrency slot', ())
+
+
+@contextmanager
+def timed(stage: str):
+    """with timed('analyze.detect_books'): ... records the block's duration (and errors) as a stage"""
+    started = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        call_errors.inc(1, stage)
+        raise
+    finally:
+        stage_seconds.observe(time.perf_counter() - started, stage)
+
+
+def instrument(function, name: str = None):
+    """Wrap a function, coroutine function or generator function (timed over its whole iteration) to record call_seconds"""
+    name = name or f"{function.__module__}.{function.__name__}"
+
+    if inspect.iscoroutinefunction(function):
+        @functools.wraps(function)
+        async def coroutine_wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return await function(*args, **kwargs)
+            except Exception:
+                call_errors.inc(1, name)
+                raise
+            finally:
+                call_seconds.observe(time.perf_counter() - started, name)
+        coroutine_wrapper.__wrapped_by_metrics__ = True
+        return coroutine_wrapper
+
+    if inspect.isgeneratorfunction(function):
+        @functools.wraps(function)
+        def generator_wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                yield from function(*args, **kwargs)
+            except Exception:
+                call_errors.inc(1, name)
+                raise
+            finally:
+                call_seconds.observe(time.perf_counter() - started, name)
+        generator_wrapper.__wrapped_by_metrics__ = True
+        return generator_wrapper
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return function(*args, **kwargs)
+        except Exception:
+            call_errors.inc(1, name)
+            raise
+        finally:
+            call_seconds.observe(time.perf_counter() - started, name)
+    wrapper.__wrapped_by_metrics__ = True
+    return wrapper
+
+
+def instrument_module(namespace: dict, exclude=()):
+    """Instrument every public function defined in a module; call at the bottom of the module
+    as instrument_module(globals()) so importers and intra-module calls get the wrapped versions"""
+    module = namespace['__name__']
+    for attr, value in list(namespace.items()):
+        if (inspect.isfunction(value) and value.__module__ == module and not attr.startswith('_')
+                and attr not in exclude and not getattr(value, '__wrapped_by_metrics__', False)):
+            namespace[attr] = instrument(value)
+
+
+@register_collector
+def _process_metrics():
+    """Resident memory of this worker: current, and the high-water mark since it started"""
+    families = []
+    if resource is not None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        if sys.platform.startswith('linux'):
+            peak *= 1024  # KiB on Linux, already bytes on macOS
+        families.append(('process_peak_rss_bytes', 'Peak resident set size of this worker process', 'gauge', [({}, peak)]))
+    try:
+        with open('/proc/self/statm') as statm:
+            current = int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+        families.append(('process_rss_bytes', 'Resident set size of this worker process', 'gauge', [({}, current)]))
+    except (OSError, ValueError):
+        pass  # not Linux
+    return families
+
+
+def expose() -> str:
+    """All metrics in the Prometheus text format"""
+    with _registry_lock:
+        metrics = list(_registry.values())
+    lines = []
+    for metric in metrics:
+        lines += metric.expose()
+    for collect in _collectors:
+        try:
+            families = collect()
+        except Exception as e:
+            lines.append(f"# collector {getattr(collect, '__name__', collect)} failed: {_escape(e)}")
+            continue
+        for name, help, kind, samples in families:
+            full_name = f"{METRICS_PREFIX}_{name}"
+            lines += [f"# HELP {full_name} {help}", f"# TYPE {full_name} {kind}"]
+            for labels, value in samples:
+                lines.append(f"{full_name}{_label_text(labels.keys(), labels.values())} {_number(value)}")
+    return '\n'.join(lines) + '\n'
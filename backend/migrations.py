@@ -0,0 +1,281 @@
+"""Versioned schema migrations and query-plan checks.
+
+create_tables() runs pending migrations at startup. To check a database by hand
+(Postgres, or a SQLite file as a local stand-in):
+
+    DATABASE_URL=sqlite:////tmp/bookscanner.db python migrations.py --check
+"""
+import logging
+import sys
+import uuid
+from collections import Counter
+from datetime import datetime, timezone
+
+from sqlalchemy import (Column, DateTime, Index, Integer, MetaData, String, Table, Uuid, and_, bindparam, delete, func,
+                        inspect, select, text, tuple_, update)
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.expression import ClauseElement, Executable
+
+from database import (
+    AnalysisSession,
+    BookCache,
+    GoodreadsBook,
+    SavedBooks,
+    UserPreferences,
+    _saved_book_filter
+)
+from normalize import book_key
+
+logger = logging.getLogger(__name__)
+
+MIGRATION_LOCK_KEY = 72_401_001  # pg_advisory_lock id, so concurrent workers migrate one at a time
+_BACKFILL_BATCH_SIZE = 1000
+
+schema_migrations = Table(
+    'schema_migrations', MetaData(),
+    Column('version', Integer, primary_key=True),
+    Column('description', String, nullable=False),
+    Column('applied_at', DateTime, nullable=False)
+)
+
+
+class Migration:
+    def __init__(self, version: int, description: str, upgrade):
+        self.version = version
+        self.description = description
+        self.upgrade = upgrade  # callable(connection); runs inside the migration's transaction
+
+
+def _create_indexes(conn, model, names):
+    """The model's indexes called `names`. A migration names the indexes it shipped with, so one added to
+    the model later gets a migration of its own instead of silently joining an old one"""
+    for index in model.__table__.indexes:
+        if index.name in names:
+            index.create(bind=conn, checkfirst=True)
+
+
+def _add_column_if_missing(conn, table: str, column: str, ddl_type: str):
+    if column not in {c['name'] for c in inspect(conn).get_columns(table)}:
+        conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} {ddl_type}"))
+
+
+def _book_cache_indexes(conn):
+    _create_indexes(conn, BookCache, names={'ux_book_cache_title_author', 'ix_book_cache_expires_at'})
+
+
+# analysis_sessions' index as migration 2 created it; the model has since replaced it (migration 4)
+_v2_analysis_sessions = Table(
+    'analysis_sessions', MetaData(),
+    Column('id', Uuid), Column('user_id', Uuid), Column('created_at', DateTime),
+    Index('ix_analysis_sessions_user_created', 'user_id', 'created_at', postgresql_include=['id'])
+)
+
+
+def _lookup_indexes(conn):
+    _create_indexes(conn, UserPreferences, names={'ix_user_preferences_user_id'})
+    for index in _v2_analysis_sessions.indexes:
+        index.create(bind=conn, checkfirst=True)
+
+
+def _saved_books_normalized_keys(conn):
+    _add_column_if_missing(conn, 'saved_books', 'normalized_title', 'VARCHAR')
+    _add_column_if_missing(conn, 'saved_books', 'normalized_author', 'VARCHAR')
+
+    table = SavedBooks.__table__
+    backfill = update(table).where(table.c.id == bindparam('row_id')).values(
+        normalized_title=bindparam('nt'),
+        normalized_author=bindparam('na')
+    )
+    while True:
+        rows = conn.execute(
+            select(table.c.id, table.c.title, table.c.author)
+            .where(table.c.normalized_title.is_(None))
+            .limit(_BACKFILL_BATCH_SIZE)
+        ).all()
+        if not rows:
+            break
+        params = []
+        for row in rows:
+            normalized_title, normalized_author = book_key(row.title, row.author)
+            params.append({'row_id': row.id, 'nt': normalized_title, 'na': normalized_author})
+        conn.execute(backfill, params)
+
+    _merge_duplicate_saves(conn)
+    _create_indexes(conn, SavedBooks, names={'ux_saved_books_user_book', 'ix_saved_books_user_saved_at'})
+
+
+def _merge_duplicate_saves(conn):
+    """Fold repeat saves of a book into its earliest row so the unique index can be built, without losing
+    what any of them recorded: read if any save was read, every distinct note, the first saved_at"""
+    table = SavedBooks.__table__
+    key = (table.c.user_id, table.c.normalized_title, table.c.normalized_author)
+    duplicated = select(*key).group_by(*key).having(func.count() > 1).subquery()
+    rows = conn.execute(
+        select(table.c.id, *key, table.c.is_read, table.c.additional_notes, table.c.saved_at)
+        .select_from(table.join(duplicated, and_(*(column == duplicated.c[column.name] for column in key))))
+        .order_by(*key, table.c.id)
+    ).all()
+
+    groups = {}
+    for row in rows:
+        groups.setdefault((row.user_id, row.normalized_title, row.normalized_author), []).append(row)
+    merged_per_user = Counter()
+    for (user_id, _, _), saves in groups.items():
+        kept, extra = saves[0], saves[1:]
+        notes = []
+        for save in saves:
+            note = (save.additional_notes or '').strip()
+            if note and note not in notes:
+                notes.append(note)
+        saved_at = [save.saved_at for save in saves if save.saved_at is not None]
+        conn.execute(update(table).where(table.c.id == kept.id).values(
+            is_read=any(save.is_read for save in saves),
+            additional_notes='\n\n'.join(notes) or None,
+            saved_at=min(saved_at) if saved_at else None
+        ))
+        conn.execute(delete(table).where(table.c.id.in_([save.id for save in extra])))
+        merged_per_user[user_id] += len(extra)
+
+    for user_id, merged in merged_per_user.items():
+        logger.info("🔀 Merged %s duplicate saved book(s) for user %s", merged, user_id)
+
+
+def _analysis_session_counts(conn):
+    _add_column_if_missing(conn, 'analysis_sessions', 'detected_books_count', 'INTEGER')
+    _add_column_if_missing(conn, 'analysis_sessions', 'recommendations_count', 'INTEGER')
+
+    table = AnalysisSession.__table__
+    backfill = update(table).where(table.c.id == bindparam('row_id')).values(
+        detected_books_count=bindparam('detected'),
+        recommendations_count=bindparam('recommended')
+    )
+    while True:
+        rows = conn.execute(
+            select(table.c.id, table.c.detected_books, table.c.recommendations)
+            .where(table.c.detected_books_count.is_(None))
+            .limit(_BACKFILL_BATCH_SIZE)
+        ).all()
+        if not rows:
+            break
+        conn.execute(backfill, [
+            {'row_id': row.id, 'detected': len(row.detected_books or []), 'recommended': len(row.recommendations or [])}
+            for row in rows
+        ])
+
+    _create_indexes(conn, AnalysisSession, names={'ix_analysis_sessions_user_created_id'})
+    conn.execute(text("DROP INDEX IF EXISTS ix_analysis_sessions_user_created"))
+
+
+MIGRATIONS = [
+    Migration(1, 'book_cache unique (title, author) and expires_at indexes', _book_cache_indexes),
+    Migration(2, 'user_preferences(user_id) and analysis_sessions(user_id, created_at) indexes', _lookup_indexes),
+    Migration(3, 'saved_books normalized keys, unique (user_id, title, author) and (user_id, saved_at) indexes',
+              _saved_books_normalized_keys),
+    Migration(4, 'analysis_sessions count columns and (user_id, created_at, id) keyset index', _analysis_session_counts),
+]
+
+
+def run_migrations(engine):
+    """Apply pending migrations in version order, each in its own transaction"""
+    applied_now = []
+    with engine.connect() as conn:
+        is_postgres = conn.dialect.name == 'postgresql'
+        if is_postgres:
+            conn.execute(text("SELECT pg_advisory_lock(:key)"), {'key': MIGRATION_LOCK_KEY})
+            conn.commit()
+        try:
+            schema_migrations.create(bind=conn, checkfirst=True)
+            conn.commit()
+            applied = set(conn.execute(select(schema_migrations.c.version)).scalars())
+            conn.commit()
+
+            for migration in sorted(MIGRATIONS, key=lambda m: m.version):
+                if migration.version in applied:
+                    continue
+                try:
+                    migration.upgrade(conn)
+                    conn.execute(schema_migrations.insert().values(
+                        version=migration.version,
+                        description=migration.description,
+                        applied_at=datetime.now(timezone.utc)
+                    ))
+                    conn.commit()
+                except Exception:
+                    conn.rollback()
+                    raise
+                applied_now.append(migration.version)
+                logger.info("🗃️ Applied migration %s: %s", migration.version, migration.description)
+        finally:
+            if is_postgres:
+                conn.execute(text("SELECT pg_advisory_unlock(:key)"), {'key': MIGRATION_LOCK_KEY})
+                conn.commit()
+    return applied_now
+
+
+class _Explain(Executable, ClauseElement):
+    inherit_cache = False
+
+    def __init__(self, statement):
+        self.statement = statement
+
+
+@compiles(_Explain)
+def _compile_explain(element, compiler, **kw):
+    prefix = 'EXPLAIN QUERY PLAN ' if compiler.dialect.name == 'sqlite' else 'EXPLAIN '
+    return prefix + compiler.process(element.statement, **kw)
+
+
+def _expected_plans():
+    """(description, index the planner must use, statement) for each hot query in database.py"""
+    user_id = uuid.uuid4()
+    return [
+        ('saved book lookup', 'ux_saved_books_user_book',
+         select(SavedBooks.id).where(*_saved_book_filter(user_id, 'Dune', 'Frank Herbert'))),
+        ('saved books list', 'ix_saved_books_user_saved_at',
+         select(SavedBooks).where(SavedBooks.user_id == user_id).order_by(SavedBooks.saved_at.desc()).limit(50)),
+        ('analysis history page', 'ix_analysis_sessions_user_created_id',
+         select(AnalysisSession.id, AnalysisSession.created_at, AnalysisSession.detected_books_count)
+         .where(AnalysisSession.user_id == user_id,
+                tuple_(AnalysisSession.created_at, AnalysisSession.id) < tuple_(datetime.now(timezone.utc), user_id))
+         .order_by(AnalysisSession.created_at.desc(), AnalysisSession.id.desc()).limit(21)),
+        ('preferences lookup', 'ix_user_preferences_user_id',
+         select(UserPreferences).where(UserPreferences.user_id == user_id).limit(1)),
+        ('book cache lookup', 'ux_book_cache_title_author',
+         select(BookCache).where(BookCache.title == 'dune', BookCache.author == 'frank herbert')),
+        ('goodreads read shelf', 'ix_goodreads_books_user_shelf',
+         select(GoodreadsBook.normalized_title).where(GoodreadsBook.user_id == user_id,
+                                                      GoodreadsBook.exclusive_shelf == 'read')),
+    ]
+
+
+def validate_query_plans(engine):
+    """EXPLAIN each hot query and report whether the planner picks the expected index"""
+    results = []
+    with engine.connect() as conn:
+        if conn.dialect.name == 'postgresql':
+            # Tiny dev tables make sequential scans look cheaper; we want to know the index is usable
+            conn.execute(text("SET LOCAL enable_seqscan = off"))
+        for description, index_name, statement in _expected_plans():
+            # Read the raw cursor: the SELECT's column types don't apply to EXPLAIN output
+            rows = conn.execute(_Explain(statement)).cursor.fetchall()
+            plan = '\n'.join(' '.join(str(col) for col in row) for row in rows)
+            results.append({'query': description, 'index': index_name, 'ok': index_name in plan, 'plan': plan})
+        conn.rollback()
+    return results
+
+
+if __name__ == '__main__':
+    from database import create_tables, engine
+    from logging_setup import configure_logging
+
+    configure_logging(fmt='text')
+    create_tables()
+    print(f"✅ Schema at version {max(m.version for m in MIGRATIONS)}")
+    if '--check' in sys.argv:
+        failures = 0
+        for result in validate_query_plans(engine):
+            print(f"{'✅' if result['ok'] else '❌'} {result['query']} -> {result['index']}")
+            if not result['ok']:
+                failures += 1
+                print(f"   {result['plan']}")
+        sys.exit(1 if failures else 0)
@@ -0,0 +1,30 @@
+import re
+import unicodedata
+from functools import lru_cache
+
+_SERIES_SUFFIX = re.compile(r"\s*\([^)]*\)\s*$")  # Goodreads appends "(Series, #1)"
+_NON_ALNUM = re.compile(r"[^a-z0-9]+")
+_LEADING_ARTICLE = re.compile(r"^(the|a|an) ")
+
+
+def _fold(text: str) -> str:
+    text = unicodedata.normalize('NFKD', text or '')
+    text = ''.join(ch for ch in text if not unicodedata.combining(ch)).lower()
+    return _NON_ALNUM.sub(' ', text).strip()
+
+
+@lru_cache(maxsize=8192)  # the same shelf titles are normalized by several pipeline stages
+def normalize_title(title: str) -> str:
+    """Lowercase, accent- and punctuation-free title without series suffix or leading article"""
+    title = _SERIES_SUFFIX.sub('', title or '')
+    return _LEADING_ARTICLE.sub('', _fold(title))
+
+
+@lru_cache(maxsize=8192)
+def normalize_author(author: str) -> str:
+    return _fold(author)
+
+
+def book_key(title: str, author: str) -> tuple:
+    """(normalized title, normalized author) - the identity used for lookups across tables"""
+    return normalize_title(title), normalize_author(author)
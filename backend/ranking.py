@@ -0,0 +1,94 @@
+import logging
+import os
+import re
+
+from database import get_goodreads_ranking_signals
+from fuzzy import TitleIndex
+from normalize import book_key, normalize_author
+
+logger = logging.getLogger(__name__)
+
+# Cheap local scoring of detected books, so the recommendation prompt only carries the best candidates
+RANKING_TOP_K = int(os.getenv('RANKING_TOP_K', 25))
+# Title similarity at which a detected book counts as one the user already read on Goodreads
+RANKING_READ_MATCH_THRESHOLD = float(os.getenv('RANKING_READ_MATCH_THRESHOLD', 0.8))
+
+_FAVORITE_AUTHOR_WEIGHT = 3.0
+_TO_READ_WEIGHT = 3.0
+_GENRE_WEIGHT = 2.0
+_AUTHOR_RATING_WEIGHT = 1.0  # per star above/below a neutral 3
+_AVOID_SEPARATORS = re.compile(r"[,;/]|\band\b")
+
+_NO_SIGNALS = {'read': set(), 'to_read': set(), 'author_ratings': {}}
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough prompt size: ~4 characters per token for English text and JSON"""
+    return max(1, len(text) // 4)
+
+
+def _avoided_phrases(avoid) -> set:
+    if isinstance(avoid, list):
+        avoid = ','.join(avoid)
+    return {phrase.strip().lower() for phrase in _AVOID_SEPARATORS.split(avoid or '') if phrase.strip()}
+
+
+def _goodreads_signals(user_id):
+    if not user_id:
+        return _NO_SIGNALS
+    try:
+        return get_goodreads_ranking_signals(user_id)
+    except Exception as e:
+        logger.warning("⚠️  Goodreads signals lookup failed: %s", e)
+        return _NO_SIGNALS
+
+
+def rank_books(preferences: dict, books: list, user_id: str = None, top_k: int = RANKING_TOP_K):
+    """Top-K candidate books for generate_recommendations, best first, plus stats.
+
+    Drops books the user already read (exact or fuzzy title match against the Goodreads
+    "read" shelf) and books whose genre is on the avoid list, then scores the rest by
+    favorite author, Goodreads to-read shelf, preferred genre and how the user rated the
+    author before. Ties keep shelf order.
+    """
+    preferences = preferences or {}
+    signals = _goodreads_signals(user_id)
+    favorite_authors = {normalize_author(author) for author in preferences.get('authors') or []}
+    preferred_genres = {genre.lower() for genre in preferences.get('genres') or []}
+    avoided = _avoided_phrases(preferences.get('avoid'))
+    read_index = TitleIndex(signals['read']) if signals['read'] else None
+
+    stats = {'detected': len(books), 'dropped_read': 0, 'dropped_avoid': 0, 'duplicates': 0}
+    seen = set()
+    scored = []
+    for position, book in enumerate(books):
+        title, author = book.get('title', ''), book.get('author', '')
+        key = book_key(title, author)
+        if key in seen:
+            stats['duplicates'] += 1
+            continue
+        seen.add(key)
+
+        if key in signals['read'] or (read_index and read_index.match(title, author, RANKING_READ_MATCH_THRESHOLD)):
+            stats['dropped_read'] += 1
+            continue
+        genre = (book.get('genre') or '').lower()
+        if genre and genre in avoided:
+            stats['dropped_avoid'] += 1
+            continue
+
+        score = 0.0
+        if key[1] in favorite_authors:
+            score += _FAVORITE_AUTHOR_WEIGHT
+        if key in signals['to_read']:
+            score += _TO_READ_WEIGHT
+        if genre and genre in preferred_genres:
+            score += _GENRE_WEIGHT
+        if key[1] in signals['author_ratings']:
+            score += _AUTHOR_RATING_WEIGHT * (signals['author_ratings'][key[1]] - 3)
+        scored.append((-score, position, book))
+
+    scored.sort(key=lambda item: item[:2])
+    candidates = [book for _, _, book in scored[:top_k]]
+    stats['candidates'] = len(candidates)
+    return candidates, stats
@@ -0,0 +1,86 @@
+import hashlib
+import json
+import logging
+import os
+
+from cache import TTLCache
+from normalize import book_key, normalize_author
+
+logger = logging.getLogger(__name__)
+
+# Recommendation results keyed on (preferences fingerprint, candidate-set fingerprint), so
+# re-running /analyze on the same shelf - or a second user with the same tastes - skips the model.
+# Entries are shared between users and never invalidated: changed preferences give a different key
+RECOMMENDATION_CACHE_SIZE = int(os.getenv('RECOMMENDATION_CACHE_SIZE', 2048))
+RECOMMENDATION_CACHE_TTL_SECONDS = int(os.getenv('RECOMMENDATION_CACHE_TTL_SECONDS', 24 * 60 * 60))
+
+# Any object with get(key) and set(key, value) works here, e.g. a thin Redis wrapper
+_store = TTLCache(max_size=RECOMMENDATION_CACHE_SIZE, ttl_seconds=RECOMMENDATION_CACHE_TTL_SECONDS)
+_counters = {
+    'hits': 0,
+    'misses': 0,
+}
+
+
+def set_recommendation_store(store):
+    """Swap the in-process cache for a shared store"""
+    global _store
+    _store = store
+
+
+def _canonical_text(text) -> str:
+    return ' '.join(str(text or '').split()).casefold()
+
+
+def preferences_fingerprint(preferences: dict) -> dict:
+    """The parts of the preferences the recommendation prompt uses, order- and case-insensitive"""
+    preferences = preferences or {}
+    return {
+        'authors': sorted({normalize_author(author) for author in preferences.get('authors') or [] if author}),
+        'genres': sorted({_canonical_text(genre) for genre in preferences.get('genres') or [] if genre}),
+        'avoid': _canonical_text(preferences.get('avoid')),
+    }
+
+
+def books_fingerprint(books: list) -> list:
+    """Sorted normalized (title, author, genre) of the books offered to the model"""
+    return sorted({(*book_key(book.get('title', ''), book.get('author', '')), _canonical_text(book.get('genre')))
+                   for book in books})
+
+
+def recommendation_key(preferences: dict, books: list) -> str:
+    payload = json.dumps([preferences_fingerprint(preferences), books_fingerprint(books)],
+                         separators=(',', ':'), ensure_ascii=False)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def get_cached_recommendations(key: str):
+    """Cached recommendations for this key, or None on a miss"""
+    try:
+        recommendations = _store.get(key)
+    except Exception as e:
+        logger.warning("⚠️  Recommendation cache lookup failed: %s", e)
+        recommendations = None
+    if recommendations is None:
+        _counters['misses'] += 1
+        return None
+    _counters['hits'] += 1
+    return [dict(recommendation) for recommendation in recommendations]
+
+
+def store_recommendations(key: str, recommendations: list):
+    try:
+        _store.set(key, [dict(recommendation) for recommendation in recommendations])
+    except Exception as e:
+        logger.warning("⚠️  Recommendation cache write failed: %s", e)
+
+
+def cache_stats():
+    lookups = _counters['hits'] + _counters['misses']
+    stats = {
+        **_counters,
+        'hit_rate': round(_counters['hits'] / lookups, 4) if lookups else 0.0,
+    }
+    if hasattr(_store, 'stats'):
+        stats['memory_tier'] = _store.stats()
+    return stats
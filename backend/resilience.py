@@ -0,0 +1,367 @@
+import asyncio
+import contextvars
+import email.utils
+import logging
+import math
+import os
+import random
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import openai
+
+from metrics import counter, register_collector
+
+logger = logging.getLogger(__name__)
+
+# Deadlines, retries, hedging and circuit breaking for upstream (model API) calls. Each request
+# gets REQUEST_BUDGET_SECONDS for all of its upstream calls: no attempt is allowed to run past
+# what is left, retries back off with full jitter (or as long as Retry-After asks) and give up
+# as soon as the budget can't cover the wait. A healthy /analyze (tiled detection, then ranking)
+# takes 20-60 s, so the default leaves room for that plus a retry; the server's worker timeout
+# (Procfile) must stay above it, so a stuck upstream ends in a 504 instead of a killed worker.
+REQUEST_BUDGET_SECONDS = float(os.getenv('REQUEST_BUDGET_SECONDS', 120))
+_RETRY_AFTER_MAX_SECONDS = 60  # a longer Retry-After is treated as "not within this request"
+
+_deadline = contextvars.ContextVar('upstream_deadline', default=None)  # time.monotonic() to finish by
+
+upstream_retries = counter('upstream_retries_total', 'Upstream attempts retried, by upstream and reason', ('upstream', 'reason'))
+upstream_hedges = counter('upstream_hedges_total', 'Hedged duplicate attempts: sent, and won (answered first)', ('upstream', 'outcome'))
+upstream_failures = counter('upstream_failures_total', 'Upstream calls given up on: deadline, circuit_open, exhausted',
+                            ('upstream', 'reason'))
+_breakers = []
+
+
+class UpstreamUnavailable(Exception):
+    """The upstream can't answer within this request: retries exhausted or circuit open"""
+    status_code = 503
+    reason = 'exhausted'
+
+    def __init__(self, message: str, retry_after: float = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+    @property
+    def headers(self) -> dict:
+        return {'Retry-After': str(math.ceil(self.retry_after))} if self.retry_after else {}
+
+
+class CircuitOpen(UpstreamUnavailable):
+    reason = 'circuit_open'
+
+
+class DeadlineExceeded(UpstreamUnavailable):
+    status_code = 504
+    reason = 'deadline'
+
+
+def start_budget(seconds: float = REQUEST_BUDGET_SECONDS):
+    """Give this request (thread/context) `seconds` for its upstream calls from now; 0 = no budget"""
+    _deadline.set(time.monotonic() + seconds if seconds > 0 else None)
+
+
+def remaining():
+    """Seconds left in the current budget, or None without one"""
+    deadline = _deadline.get()
+    return None if deadline is None else deadline - time.monotonic()
+
+
+def bounded(timeout: float) -> float:
+    """timeout, cut to what is left of the budget; DeadlineExceeded if nothing is"""
+    left = remaining()
+    if left is None:
+        return timeout
+    if left <= 0:
+        raise DeadlineExceeded("Upstream call abandoned: the request's time budget is spent")
+    return min(timeout, left)
+
+
+def submit(executor, fn, *args):
+    """executor.submit running fn under the caller's context (budget, request id) instead of the pool thread's"""
+    return executor.submit(contextvars.copy_context().run, fn, *args)
+
+
+def _reason(error) -> str:
+    if isinstance(error, (openai.APITimeoutError, TimeoutError)):
+        return 'timeout'
+    if isinstance(error, openai.APIConnectionError):
+        return 'connection'
+    return str(getattr(error, 'status_code', type(error).__name__))
+
+
+def is_retryable(error) -> bool:
+    """Timeouts, dropped connections, 408/409/429 and 5xx - the statuses the OpenAI SDK retries"""
+    if isinstance(error, (openai.APIConnectionError, TimeoutError)):
+        return True
+    if isinstance(error, openai.APIStatusError):
+        should_retry = error.response.headers.get('x-should-retry')
+        if should_retry in ('true', 'false'):
+            return should_retry == 'true'
+        return error.status_code in (408, 409, 429) or error.status_code >= 500
+    return False
+
+
+def _verdict(error):
+    """What a failed attempt says about the upstream's health, for the circuit breaker"""
+    if is_retryable(error):
+        return False
+    return True if isinstance(error, openai.APIStatusError) else None  # it answered (4xx) / no verdict
+
+
+def retry_after(error):
+    """Seconds the upstream asked us to wait (Retry-After / retry-after-ms), or None"""
+    response = getattr(error, 'response', None)
+    if response is None:
+        return None
+    headers = response.headers
+    try:
+        if 'retry-after-ms' in headers:
+            return max(0.0, float(headers['retry-after-ms']) / 1000)
+        value = headers.get('retry-after')
+        if value is None:
+            return None
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class CircuitBreaker:
+    """Opens after `failures` consecutive failed attempts and rejects calls for `reset_seconds`;
+    then lets one probe through (half-open), whose outcome closes or re-opens it"""
+
+    def __init__(self, name: str, failures: int = 5, reset_seconds: float = 30):
+        self.name = name
+        self.failures = failures
+        self.reset_seconds = reset_seconds
+        self._lock = threading.Lock()
+        self._failed = 0
+        self._opened_at = None
+        self._probing = False
+        _breakers.append(self)
+
+    @property
+    def state(self) -> str:
+        if self._opened_at is None:
+            return 'closed'
+        return 'half_open' if time.monotonic() >= self._opened_at + self.reset_seconds else 'open'
+
+    def before_attempt(self) -> bool:
+        """Raise CircuitOpen unless an attempt may go upstream now; True if it is the half-open probe"""
+        if self.failures <= 0:
+            return False
+        with self._lock:
+            if self._opened_at is None:
+                return False
+            wait_seconds = self._opened_at + self.reset_seconds - time.monotonic()
+            if wait_seconds <= 0 and not self._probing:
+                self._probing = True
+                logger.info("🔌 Circuit %s half-open: probing upstream", self.name)
+                return True
+        raise CircuitOpen(f"{self.name} is unavailable (circuit open)", retry_after=max(wait_seconds, 1))
+
+    def record(self, healthy, probe: bool = False):
+        """An attempt's outcome: True (answered), False (failed retryably) or None (no verdict, e.g. cancelled)"""
+        if self.failures <= 0:
+            return
+        with self._lock:
+            if probe:
+                self._probing = False
+            if healthy is None:
+                return
+            if healthy:
+                if self._opened_at is not None:
+                    logger.info("🔌 Circuit %s closed", self.name)
+                self._failed, self._opened_at = 0, None
+                return
+            self._failed += 1
+            if probe or (self._opened_at is None and self._failed >= self.failures):
+                self._opened_at = time.monotonic()
+                logger.warning("🔌 Circuit %s open for %ss after %s consecutive failures", self.name, self.reset_seconds,
+                               self._failed)
+
+
+@register_collector
+def _breaker_metrics():
+    states = ('closed', 'open', 'half_open')
+    samples = [({'upstream': breaker.name, 'state': state}, int(breaker.state == state))
+               for breaker in _breakers for state in states]
+    return [('upstream_circuit_state', 'Circuit breaker state per upstream (1 = current state)', 'gauge', samples)]
+
+
+class CallPolicy:
+    """How calls to one upstream are made: policy.call(attempt) / await policy.acall(attempt), where
+    attempt(timeout) makes one request that must not run longer than `timeout` seconds.
+
+    retries: attempts after the first; attempt_timeout: cap on any one attempt; hedge_after: seconds
+    before a duplicate attempt races a slow one (0 = off), at most max_hedges duplicates in flight.
+    """
+
+    def __init__(self, name: str, retries: int = 2, attempt_timeout: float = 90, backoff_base: float = 0.5,
+                 backoff_max: float = 8, hedge_after: float = 0, max_hedges: int = 2, breaker: CircuitBreaker = None,
+                 threads: int = 16):
+        self.name = name
+        self.retries = retries
+        self.attempt_timeout = attempt_timeout
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.hedge_after = hedge_after
+        self.breaker = breaker or CircuitBreaker(name, failures=0)
+        self._hedges = threading.BoundedSemaphore(max_hedges) if max_hedges > 0 else None
+        self._threads = threads
+        self._executor = None
+        self._executor_lock = threading.Lock()
+
+    def _backoff(self, retry: int, error) -> float:
+        """Seconds to wait before retry number `retry` (0-based), or raise if this request can't wait that long"""
+        requested = retry_after(error)
+        if requested is not None and requested > _RETRY_AFTER_MAX_SECONDS:
+            raise UpstreamUnavailable(f"{self.name} asked to retry after {requested:.0f}s: {error}", retry_after=requested) from error
+        if requested is not None:
+            delay = requested + random.uniform(0, self.backoff_base)  # spread the herd that got the same header
+        else:
+            delay = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** retry))  # full jitter
+        left = remaining()
+        if left is not None and delay >= left:
+            raise DeadlineExceeded(f"{self.name} failed and the request's time budget can't cover a retry: {error}",
+                                   retry_after=requested) from error
+        return delay
+
+    def _retry_delay(self, retry: int, error) -> float:
+        """Backoff before the next attempt; re-raises errors not worth retrying and gives up after the last one"""
+        if not is_retryable(error):
+            raise error
+        if retry == self.retries:
+            raise UpstreamUnavailable(f"{self.name} failed after {self.retries + 1} attempts: {error}",
+                                      retry_after=retry_after(error)) from error
+        delay = self._backoff(retry, error)
+        upstream_retries.inc(1, self.name, _reason(error))
+        logger.warning("🔁 %s attempt failed (%s), retry %s/%s in %.2fs", self.name, _reason(error), retry + 1,
+                       self.retries, delay)
+        return delay
+
+    def _attempt(self, attempt, timeout):
+        probe = self.breaker.before_attempt()
+        try:
+            result = attempt(timeout)
+        except Exception as e:
+            self.breaker.record(_verdict(e), probe)
+            raise
+        except BaseException:
+            self.breaker.record(None, probe)
+            raise
+        self.breaker.record(True, probe)
+        return result
+
+    def call(self, attempt, hedge: bool = True):
+        """attempt(timeout)'s result, retried on transient failures and (if enabled) hedged; streams pass hedge=False"""
+        try:
+            return self._call(attempt, hedge)
+        except UpstreamUnavailable as e:
+            upstream_failures.inc(1, self.name, e.reason)
+            raise
+
+    def _call(self, attempt, hedge):
+        for retry in range(self.retries + 1):
+            try:
+                if hedge and self.hedge_after > 0:
+                    return self._hedged(attempt, bounded(self.attempt_timeout))
+                return self._attempt(attempt, bounded(self.attempt_timeout))
+            except Exception as e:
+                time.sleep(self._retry_delay(retry, e))
+
+    def _pool(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            with self._executor_lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(max_workers=self._threads, thread_name_prefix=f"{self.name}-hedge")
+        return self._executor
+
+    def _hedged(self, attempt, timeout):
+        # Both attempts run on the pool so the caller can take whichever answers first; the loser
+        # can't be interrupted and finishes (bounded by its own timeout) in the background
+        primary = submit(self._pool(), self._attempt, attempt, timeout)
+        if wait([primary], timeout=self.hedge_after).done or self._hedges is None or not self._hedges.acquire(blocking=False):
+            return primary.result()
+        try:
+            try:
+                timeout = bounded(self.attempt_timeout)
+            except DeadlineExceeded:
+                return primary.result()
+            duplicate = submit(self._pool(), self._attempt, attempt, timeout)
+            upstream_hedges.inc(1, self.name, 'sent')
+            pending = {primary, duplicate}
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                winner = next((future for future in done if future.exception() is None), None)
+                if winner is not None:
+                    if winner is duplicate:
+                        upstream_hedges.inc(1, self.name, 'won')
+                    return winner.result()
+            return primary.result()  # both failed: the primary's error
+        finally:
+            self._hedges.release()
+
+    async def acall(self, attempt, hedge: bool = True):
+        """call() for a coroutine function attempt(timeout); a losing hedge is cancelled"""
+        try:
+            return await self._acall(attempt, hedge)
+        except UpstreamUnavailable as e:
+            upstream_failures.inc(1, self.name, e.reason)
+            raise
+
+    async def _acall(self, attempt, hedge):
+        for retry in range(self.retries + 1):
+            try:
+                if hedge and self.hedge_after > 0:
+                    return await self._ahedged(attempt, bounded(self.attempt_timeout))
+                return await self._aattempt(attempt, bounded(self.attempt_timeout))
+            except Exception as e:
+                await asyncio.sleep(self._retry_delay(retry, e))
+
+    async def _aattempt(self, attempt, timeout):
+        probe = self.breaker.before_attempt()
+        try:
+            # The whole attempt is bounded here, not just each socket read as on the sync path
+            result = await asyncio.wait_for(attempt(timeout), timeout)
+        except Exception as e:
+            self.breaker.record(_verdict(e), probe)
+            raise
+        except BaseException:
+            self.breaker.record(None, probe)
+            raise
+        self.breaker.record(True, probe)
+        return result
+
+    async def _ahedged(self, attempt, timeout):
+        primary = asyncio.ensure_future(self._aattempt(attempt, timeout))
+        duplicate = None
+        try:
+            done, _ = await asyncio.wait({primary}, timeout=self.hedge_after)
+            if done or self._hedges is None or not self._hedges.acquire(blocking=False):
+                return await primary
+            try:
+                try:
+                    timeout = bounded(self.attempt_timeout)
+                except DeadlineExceeded:
+                    return await primary
+                duplicate = asyncio.ensure_future(self._aattempt(attempt, timeout))
+                upstream_hedges.inc(1, self.name, 'sent')
+                pending = {primary, duplicate}
+                while pending:
+                    done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                    winner = next((task for task in done if task.exception() is None), None)
+                    if winner is not None:
+                        if winner is duplicate:
+                            upstream_hedges.inc(1, self.name, 'won')
+                        return winner.result()
+                return primary.result()
+            finally:
+                self._hedges.release()
+        finally:
+            for task in (primary, duplicate):
+                if task is not None and not task.done():
+                    task.cancel()
@@ -0,0 +1,144 @@
+import logging
+import os
+
+from cache import TTLCache
+from database import get_cached_shelf_analysis, save_cached_shelf_analysis
+
+try:
+    from PIL import Image
+except ImportError:  # Pillow is optional - without it only exact byte matches hit
+    Image = None
+
+logger = logging.getLogger(__name__)
+
+# Content-addressed cache for analyze_bookshelf results: in-process LRU in front of Postgres
+SHELF_CACHE_TTL_SECONDS = int(os.getenv('SHELF_CACHE_TTL_SECONDS', 7 * 24 * 60 * 60))
+SHELF_CACHE_MEMORY_SIZE = int(os.getenv('SHELF_CACHE_MEMORY_SIZE', 256))
+SHELF_CACHE_DB_MAX_ROWS = int(os.getenv('SHELF_CACHE_DB_MAX_ROWS', 10000))
+# Max differing bits between two dHashes for images to count as the same photo. Near matches only
+# count between one user's own uploads: two people's shelves can hash close, and one user must
+# never be shown another's books. Identical bytes match for anyone.
+SHELF_CACHE_PHASH_DISTANCE = int(os.getenv('SHELF_CACHE_PHASH_DISTANCE', 4))
+# How many of a user's most recently used database entries a look-alike lookup compares against
+SHELF_CACHE_DB_SCAN_ROWS = int(os.getenv('SHELF_CACHE_DB_SCAN_ROWS', 50))
+
+_memory_tier = TTLCache(max_size=SHELF_CACHE_MEMORY_SIZE, ttl_seconds=SHELF_CACHE_TTL_SECONDS)  # content_hash -> (phash, books, user_id)
+_counters = {
+    'memory_hits': 0,
+    'perceptual_hits': 0,
+    'db_hits': 0,
+    'misses': 0,
+    'db_errors': 0,
+}
+
+
+class ShelfFingerprint:
+    def __init__(self, content_hash: str, perceptual_hash: str = None):
+        self.content_hash = content_hash
+        self.perceptual_hash = perceptual_hash
+
+
+def perceptual_hash(stream):
+    """64-bit difference hash (dHash) as hex, or None if Pillow is missing or the image can't be read"""
+    if Image is None:
+        return None
+    try:
+        with Image.open(stream) as image:
+            image.draft('L', (64, 64))  # let JPEG decode at reduced scale
+            pixels = image.convert('L').resize((9, 8)).tobytes()  # one byte per pixel, row by row
+    except Exception:
+        return None
+
+    bits = 0
+    for row in range(8):
+        for col in range(8):
+            left = pixels[row * 9 + col]
+            right = pixels[row * 9 + col + 1]
+            bits = (bits << 1) | (left > right)
+    return f"{bits:016x}"
+
+
+def fingerprint_image(image) -> ShelfFingerprint:
+    """Fingerprint a ShelfImage; its sha256 was already computed while the upload was read"""
+    return ShelfFingerprint(image.sha256, perceptual_hash(image.open()))
+
+
+def _hamming(a: str, b: str) -> int:
+    return bin(int(a, 16) ^ int(b, 16)).count('1')
+
+
+def _is_near(a: str, b: str) -> bool:
+    return _hamming(a, b) <= SHELF_CACHE_PHASH_DISTANCE
+
+
+def _find_near_duplicate(phash: str, user_id: str):
+    for _, (entry_phash, books, entry_user_id) in reversed(_memory_tier.items()):
+        if entry_user_id == user_id and entry_phash and _is_near(entry_phash, phash):
+            return books
+    return None
+
+
+def get_cached_books(fingerprint: ShelfFingerprint, user_id: str = None):
+    """Return the cached detected books for this image, or None on a miss. Without a user_id only
+    identical bytes match"""
+    entry = _memory_tier.get(fingerprint.content_hash)
+    if entry is not None:
+        _counters['memory_hits'] += 1
+        return entry[1]
+
+    if fingerprint.perceptual_hash and user_id:
+        books = _find_near_duplicate(fingerprint.perceptual_hash, user_id)
+        if books is not None:
+            _counters['perceptual_hits'] += 1
+            _memory_tier.set(fingerprint.content_hash, (fingerprint.perceptual_hash, books, user_id))
+            return books
+
+    try:
+        # Same matching rule as the memory tier, over this user's recent rows
+        phash = fingerprint.perceptual_hash
+        books = get_cached_shelf_analysis(
+            fingerprint.content_hash,
+            user_id,
+            is_lookalike=(lambda other: _is_near(other, phash)) if phash else None,
+            scan_rows=SHELF_CACHE_DB_SCAN_ROWS
+        )
+    except Exception as e:
+        # The cache must never take /analyze down with it
+        _counters['db_errors'] += 1
+        logger.warning("⚠️  Shelf cache lookup failed: %s", e)
+        books = None
+
+    if books is None:
+        _counters['misses'] += 1
+        return None
+
+    _counters['db_hits'] += 1
+    _memory_tier.set(fingerprint.content_hash, (fingerprint.perceptual_hash, books, user_id))
+    return books
+
+
+def store_books(fingerprint: ShelfFingerprint, books: list, user_id: str = None):
+    _memory_tier.set(fingerprint.content_hash, (fingerprint.perceptual_hash, books, user_id))
+    try:
+        save_cached_shelf_analysis(
+            fingerprint.content_hash,
+            fingerprint.perceptual_hash,
+            books,
+            ttl_seconds=SHELF_CACHE_TTL_SECONDS,
+            max_rows=SHELF_CACHE_DB_MAX_ROWS,
+            user_id=user_id
+        )
+    except Exception as e:
+        _counters['db_errors'] += 1
+        logger.warning("⚠️  Shelf cache write failed: %s", e)
+
+
+def cache_stats():
+    hits = _counters['memory_hits'] + _counters['perceptual_hits'] + _counters['db_hits']
+    lookups = hits + _counters['misses']
+    return {
+        **_counters,
+        'hits': hits,
+        'hit_rate': round(hits / lookups, 4) if lookups else 0.0,
+        'memory_tier': _memory_tier.stats(),
+    }
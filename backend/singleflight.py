@@ -0,0 +1,266 @@
+import asyncio
+import copy
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+
+from metrics import counter
+from resilience import remaining
+
+try:
+    import fcntl
+except ImportError:  # not POSIX - coalescing stays within each worker
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# Coalesces identical in-flight work (same shelf photo, same recommendation prompt): the first
+# caller runs it, concurrent duplicates wait and share its result or its exception. Within a
+# worker this is an in-memory flight table. With SINGLEFLIGHT_LOCK_DIR set (a local directory all
+# workers on the host can write), workers also coordinate through per-key flock files, and the
+# leader leaves its JSON result behind for SINGLEFLIGHT_RESULT_TTL_SECONDS for the others.
+# A follower waits no longer than its own request budget allows, then runs the work itself.
+SINGLEFLIGHT_LOCK_DIR = os.getenv('SINGLEFLIGHT_LOCK_DIR', '')
+SINGLEFLIGHT_WAIT_SECONDS = float(os.getenv('SINGLEFLIGHT_WAIT_SECONDS', 120))  # then run it anyway
+SINGLEFLIGHT_RESULT_TTL_SECONDS = float(os.getenv('SINGLEFLIGHT_RESULT_TTL_SECONDS', 60))
+_LOCK_POLL_SECONDS = 0.05
+
+flight_calls = counter('singleflight_calls_total', 'Coalesced calls by role: leader ran it, joined shared a '
+                       'leader in this worker, joined_worker shared one from another worker', ('flight', 'role'))
+
+_ABANDONED = object()  # the leader went away (client disconnect) without a result or an error
+_MISSING = object()
+
+
+class SharedCallFailed(Exception):
+    """The leader failed with an exception that could not be copied for a follower; it is the __cause__"""
+
+
+def _follower_error(error: Exception) -> Exception:
+    """A fresh copy of the leader's exception for a follower to raise, so routes still map it by type.
+    Raising the one instance in every follower would race on and pile up its __traceback__"""
+    try:
+        fresh = copy.copy(error)
+    except Exception:
+        fresh = None
+    if type(fresh) is not type(error):
+        fresh = SharedCallFailed(f"Coalesced call failed: {error}")
+    return fresh
+
+
+def _follower_timeout() -> float:
+    """How long a follower may wait on a leader: the request's remaining budget, at most SINGLEFLIGHT_WAIT_SECONDS"""
+    left = remaining()
+    return SINGLEFLIGHT_WAIT_SECONDS if left is None else max(0.0, min(left, SINGLEFLIGHT_WAIT_SECONDS))
+
+
+class _LockTable:
+    """Per-key lock files plus short-lived result files in a directory shared by the host's workers"""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self._writes = 0
+
+    def _path(self, name: str, key: str, suffix: str) -> str:
+        digest = hashlib.sha256(f"{name}\0{key}".encode()).hexdigest()[:32]
+        return os.path.join(self.directory, f"{name}-{digest}{suffix}")
+
+    def acquire(self, name: str, key: str, timeout: float):
+        """Open file holding the key's lock, or None if another worker held it for `timeout`"""
+        handle = open(self._path(name, key, '.lock'), 'a')
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return handle
+            except BlockingIOError:
+                if time.monotonic() >= deadline:
+                    handle.close()
+                    return None
+                time.sleep(_LOCK_POLL_SECONDS)
+
+    def release(self, handle):
+        fcntl.flock(handle, fcntl.LOCK_UN)
+        handle.close()
+
+    def read(self, name: str, key: str):
+        """A result another worker left within the TTL, or _MISSING"""
+        path = self._path(name, key, '.json')
+        try:
+            if time.time() - os.path.getmtime(path) > SINGLEFLIGHT_RESULT_TTL_SECONDS:
+                return _MISSING
+            with open(path) as result_file:
+                return json.load(result_file)
+        except (OSError, ValueError):
+            return _MISSING
+
+    def write(self, name: str, key: str, value):
+        path = self._path(name, key, '.json')
+        try:
+            with open(f"{path}.{os.getpid()}.tmp", 'w') as result_file:
+                json.dump(value, result_file)
+            os.replace(f"{path}.{os.getpid()}.tmp", path)
+        except (OSError, TypeError, ValueError) as e:
+            logger.warning("⚠️  Single-flight result not shared: %s", e)
+        self._writes += 1
+        if self._writes % 100 == 0:
+            self.sweep()
+
+    def sweep(self):
+        """Delete expired results and idle lock files (a lock file deleted under a waiter only costs a duplicate call)"""
+        cutoff = time.time() - SINGLEFLIGHT_RESULT_TTL_SECONDS
+        try:
+            entries = list(os.scandir(self.directory))
+        except OSError:
+            return
+        for entry in entries:
+            try:
+                if entry.stat().st_mtime >= cutoff:
+                    continue
+                if entry.name.endswith('.lock'):
+                    with open(entry.path, 'a') as handle:
+                        fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)  # skip locks a worker holds
+                        os.remove(entry.path)
+                else:
+                    os.remove(entry.path)
+            except OSError:
+                continue
+
+
+class Flight:
+    """One caller's view of a key: leader (must publish()) or follower (value already shared)"""
+
+    def __init__(self, leader: bool, value=None):
+        self.leader = leader
+        self.value = value
+        self.published = False
+
+    def publish(self, value):
+        self.value = value
+        self.published = True
+
+
+class _Call:
+    __slots__ = ('done', 'value', 'error')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = _ABANDONED
+        self.error = None
+
+
+class SingleFlight:
+    """Flight table for one kind of work; keys must identify the result exactly (content hashes)"""
+
+    def __init__(self, name: str, lock_dir: str = SINGLEFLIGHT_LOCK_DIR):
+        self.name = name
+        self._calls = {}
+        self._lock = threading.Lock()
+        self._async_calls = {}  # (event loop, key) -> Future
+        self._locks = _LockTable(lock_dir) if lock_dir and fcntl is not None else None
+
+    @contextmanager
+    def lead(self, key: str):
+        """with flights.lead(key) as flight: if flight.leader, compute and flight.publish(value);
+        otherwise flight.value is the leader's result (a copy of its exception is raised instead)"""
+        registered = True
+        while True:
+            with self._lock:
+                call = self._calls.get(key)
+                leader = call is None
+                if leader:
+                    call = self._calls[key] = _Call()
+            if leader:
+                break
+            if not call.done.wait(_follower_timeout()):
+                # The leader outlasted this request's budget: run it here, outside the flight table
+                call, registered = _Call(), False
+                break
+            if call.error is not None:
+                raise _follower_error(call.error) from call.error
+            if call.value is not _ABANDONED:
+                flight_calls.inc(1, self.name, 'joined')
+                yield Flight(False, call.value)
+                return
+            # The leader was abandoned: race to lead it again
+
+        handle = None
+        try:
+            flight = Flight(True)
+            if self._locks is not None:
+                handle = self._locks.acquire(self.name, key, SINGLEFLIGHT_WAIT_SECONDS)
+                shared = self._locks.read(self.name, key) if handle is not None else _MISSING
+                if shared is not _MISSING:
+                    flight = Flight(False, shared)
+                    flight.published = True
+            flight_calls.inc(1, self.name, 'leader' if flight.leader else 'joined_worker')
+            yield flight
+            if flight.published:
+                call.value = flight.value
+                if flight.leader and handle is not None:
+                    self._locks.write(self.name, key, flight.value)
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            if registered:
+                with self._lock:
+                    del self._calls[key]
+            call.done.set()
+            if handle is not None:
+                self._locks.release(handle)
+
+    @asynccontextmanager
+    async def alead(self, key: str):
+        """lead() for coroutines: followers await the leader's future instead of blocking a thread"""
+        loop = asyncio.get_running_loop()
+        registered = True
+        while True:
+            future = self._async_calls.get((loop, key))
+            if future is None:
+                future = self._async_calls[(loop, key)] = loop.create_future()
+                break
+            # asyncio.wait neither cancels the leader's future on timeout nor when this task is cancelled
+            done, _ = await asyncio.wait([future], timeout=_follower_timeout())
+            if not done:
+                future, registered = loop.create_future(), False
+                break
+            if future.exception() is not None:
+                raise _follower_error(future.exception()) from future.exception()
+            value = future.result()
+            if value is not _ABANDONED:
+                flight_calls.inc(1, self.name, 'joined')
+                yield Flight(False, value)
+                return
+
+        handle = None
+        try:
+            flight = Flight(True)
+            if self._locks is not None:
+                handle = await asyncio.to_thread(self._locks.acquire, self.name, key, SINGLEFLIGHT_WAIT_SECONDS)
+                shared = self._locks.read(self.name, key) if handle is not None else _MISSING
+                if shared is not _MISSING:
+                    flight = Flight(False, shared)
+                    flight.published = True
+            flight_calls.inc(1, self.name, 'leader' if flight.leader else 'joined_worker')
+            yield flight
+            if flight.published and flight.leader and handle is not None:
+                self._locks.write(self.name, key, flight.value)
+            future.set_result(flight.value if flight.published else _ABANDONED)
+        except Exception as e:
+            future.set_exception(e)
+            future.exception()  # retrieved: no "never retrieved" warning when nobody joined
+            raise
+        finally:
+            if not future.done():  # cancelled (client disconnect)
+                future.set_result(_ABANDONED)
+            if registered:
+                del self._async_calls[(loop, key)]
+            if handle is not None:
+                self._locks.release(handle)
+
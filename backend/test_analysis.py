@@ -0,0 +1,46 @@
+import io
+import json
+
+import analysis
+from app import app
+from benchmarks.fixtures import shelf_photo
+from database import get_or_create_user, save_book
+
+
+def _counting(monkeypatch):
+    calls = []
+    get_reading_status = analysis.get_reading_status
+
+    def counted(user_id, keys):
+        calls.append(list(keys))
+        return get_reading_status(user_id, keys)
+    monkeypatch.setattr(analysis, 'get_reading_status', counted)
+    return calls
+
+
+def test_recommendations_from_the_shelf_are_flagged_without_more_queries(monkeypatch):
+    user = get_or_create_user('analysis-test-flags')
+    save_book(user['id'], 'The Hobbit', 'J.R.R. Tolkien')
+    shelf = [{'title': 'The Hobbit', 'author': 'J. R. R. Tolkien'}, {'title': 'Dune', 'author': 'Frank Herbert'}]
+    calls = _counting(monkeypatch)
+
+    status = analysis.reading_status(user['id'], shelf)
+    flagged = [analysis.with_reading_status(user['id'], [rec], status)[0] for rec in reversed(shelf)]
+    assert len(calls) == 1
+    assert [(rec['title'], rec['is_saved']) for rec in flagged] == [('Dune', False), ('The Hobbit', True)]
+
+    # A recommendation the prefetch doesn't cover is still looked up
+    off_shelf = analysis.with_reading_status(user['id'], [{'title': 'Emma', 'author': 'Jane Austen'}], status)
+    assert len(calls) == 2 and off_shelf[0]['is_saved'] is False
+
+
+def test_streamed_analysis_queries_reading_status_once(stub, monkeypatch):
+    calls = _counting(monkeypatch)
+    response = app.test_client().post('/analyze/stream', content_type='multipart/form-data',
+                                      headers={'X-Device-ID': 'analysis-test-stream'},
+                                      data={'image': (io.BytesIO(shelf_photo(11)), 'shelf.jpg'),
+                                            'preferences': json.dumps({'genres': ['Fantasy']})})
+    events = response.get_data(as_text=True)
+    assert events.count('event: recommendation') > 1
+    assert 'event: done' in events
+    assert len(calls) == 1
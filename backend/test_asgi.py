@@ -0,0 +1,64 @@
+import base64
+import io
+import json
+import uuid
+
+import pytest
+from PIL import Image
+from starlette.testclient import TestClient
+
+import asgi
+from app import app as flask_app
+
+PREFERENCES = json.dumps({'authors': ['Author 1'], 'genres': ['Fantasy'], 'avoid': ''})
+
+
+@pytest.fixture(scope='module')
+def asgi_client():
+    with TestClient(asgi.app) as client:
+        yield client
+
+
+def _photo() -> bytes:
+    buffer = io.BytesIO()
+    Image.effect_noise((320, 240), 40).convert('RGB').save(buffer, 'JPEG')
+    return buffer.getvalue()
+
+
+def _analyze(post, device_id, **kwargs):
+    return post('/analyze', headers={'X-Device-ID': device_id}, **kwargs)
+
+
+def test_analyze_answers_like_the_flask_route(stub, asgi_client):
+    device_id, photo = f"asgi-test-{uuid.uuid4().hex[:8]}", _photo()
+    flask = _analyze(flask_app.test_client().post, device_id, content_type='multipart/form-data',
+                     data={'image': (io.BytesIO(photo), 'shelf.jpg'), 'preferences': PREFERENCES})
+    served = _analyze(asgi_client.post, device_id, files={'image': ('shelf.jpg', photo, 'image/jpeg')},
+                      data={'preferences': PREFERENCES})
+
+    assert served.status_code == flask.status_code == 200
+    flask_body, asgi_body = flask.get_json(), served.json()
+    assert set(asgi_body) == set(flask_body)
+    assert asgi_body['user_id'] == flask_body['user_id']
+    assert asgi_body['detected_books'] == flask_body['detected_books']
+    assert [rec['title'] for rec in asgi_body['recommendations']] == [rec['title'] for rec in flask_body['recommendations']]
+    assert served.cookies.get('deviceId') == device_id
+    assert 'deviceid=' in flask.headers['Set-Cookie'].lower()
+
+
+def test_json_mode_and_upload_errors_match(stub, asgi_client):
+    device_id = f"asgi-test-{uuid.uuid4().hex[:8]}"
+    body = {'image': base64.b64encode(_photo()).decode(), 'preferences': json.loads(PREFERENCES)}
+    assert _analyze(asgi_client.post, device_id, json=body).status_code == 200
+
+    for bad in ({'preferences': {}}, {'image': '%%% not base64 %%%'}):
+        flask = _analyze(flask_app.test_client().post, device_id, json=bad)
+        served = _analyze(asgi_client.post, device_id, json=bad)
+        assert (served.status_code, served.content) == (flask.status_code, flask.get_data())
+        assert served.status_code == 400
+
+
+def test_other_routes_fall_through_to_flask(asgi_client):
+    response = asgi_client.get('/health')
+    assert response.json() == {'status': 'Server is running!'}
+    assert response.headers['X-Request-ID']
@@ -0,0 +1,43 @@
+import uuid
+
+import pytest
+
+from book_cache import enrich_with_metadata, remember_detected_books
+from database import BookCache, engine, purge_expired_book_cache, upsert_book_cache
+
+
+@pytest.fixture(scope='module', autouse=True)
+def book_cache_table():
+    BookCache.__table__.create(bind=engine, checkfirst=True)
+
+
+def _title():
+    return f"Test Book {uuid.uuid4().hex[:8]}"
+
+
+def test_cached_genre_fills_in_what_the_model_left_out():
+    title = _title()
+    remember_detected_books([{'title': title, 'author': 'Ursula K. Le Guin', 'genre': 'Fantasy'}])
+
+    enriched = enrich_with_metadata([{'title': title.upper(), 'author': 'ursula k le guin', 'genre': ''}])
+    # Matched on the normalized key; the spelling just detected wins, the genre comes from the cache
+    assert enriched == [{'title': title.upper(), 'author': 'ursula k le guin', 'genre': 'Fantasy'}]
+
+
+def test_later_duplicates_in_one_batch_win():
+    title = _title()
+    assert remember_detected_books([{'title': title, 'author': 'A', 'genre': 'Horror'},
+                                    {'title': title, 'author': 'A', 'genre': 'Mystery'}]) == 1
+    assert enrich_with_metadata([{'title': title, 'author': 'A'}])[0]['genre'] == 'Mystery'
+
+
+def test_unknown_books_pass_through_unchanged():
+    book = {'title': _title(), 'author': 'Nobody'}
+    assert enrich_with_metadata([book]) == [book]
+
+
+def test_expired_rows_are_ignored_and_purged():
+    title = _title()
+    upsert_book_cache([{'title': title, 'author': 'A', 'genre': 'Horror'}], ttl_seconds=-1)
+    assert 'genre' not in enrich_with_metadata([{'title': title, 'author': 'A'}])[0]
+    assert purge_expired_book_cache(batch_size=1) >= 1
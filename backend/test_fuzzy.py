@@ -0,0 +1,60 @@
+from fuzzy import TitleIndex, dedupe_books, reconcile
+from normalize import book_key
+
+
+def _titles(books):
+    return [book['title'] for book in books]
+
+
+def test_ocr_variants_collapse_onto_the_first_spelling():
+    books = [{'title': 'Harry Potter and the Goblet of Fire', 'author': 'J.K. Rowling'},
+             {'title': 'Dune', 'author': 'Frank Herbert'},
+             {'title': 'Harry Poter and the Goblet of Fire', 'author': 'J. K. Rowling', 'genre': 'Fantasy'},
+             {'title': 'HARRY POTTER AND THE GOBLET OF FIRE', 'author': ''}]
+    deduped = dedupe_books(books)
+    assert _titles(deduped) == ['Harry Potter and the Goblet of Fire', 'Dune']
+    assert deduped[0]['genre'] == 'Fantasy'  # filled in from a variant
+    assert 'genre' not in books[0]
+
+
+def test_different_volumes_and_authors_are_kept_apart():
+    books = [{'title': 'The Wheel of Time Book 8', 'author': 'Robert Jordan'},
+             {'title': 'The Wheel of Time Book 9', 'author': 'Robert Jordan'},
+             {'title': 'Emma', 'author': 'Jane Austen'},
+             {'title': 'Emma', 'author': 'Someone Else Entirely'}]
+    assert dedupe_books(books) == books
+
+
+def test_empty_and_single_shelves():
+    assert dedupe_books([]) == []
+    assert dedupe_books([{'title': 'Dune', 'author': 'Frank Herbert'}]) == [{'title': 'Dune', 'author': 'Frank Herbert'}]
+    assert reconcile([{'title': 'Dune', 'author': 'Frank Herbert'}], []) == ([], {'exact': 0, 'snapped': 0, 'dropped': 1})
+
+
+def test_recommendations_snap_onto_the_shelf_spelling():
+    shelf = [{'title': 'The Fellowship of the Ring', 'author': 'J.R.R. Tolkien'},
+             {'title': 'Dune', 'author': 'Frank Herbert'}]
+    recommendations = [{'title': 'Fellowship of the Ring', 'author': 'Tolkien', 'matchScore': 90},
+                       {'title': 'Dune', 'author': 'Frank Herbert', 'matchScore': 80}]
+    snapped, stats = reconcile(recommendations, shelf)
+    assert snapped == [{'title': 'The Fellowship of the Ring', 'author': 'J.R.R. Tolkien', 'matchScore': 90},
+                       {'title': 'Dune', 'author': 'Frank Herbert', 'matchScore': 80}]
+    assert stats == {'exact': 1, 'snapped': 1, 'dropped': 0}
+
+
+def test_hallucinated_wrong_volume_and_repeated_recommendations_are_dropped():
+    shelf = [{'title': 'Dune', 'author': 'Frank Herbert'}, {'title': 'Discworld 3', 'author': 'Terry Pratchett'}]
+    recommendations = [{'title': 'A Book Nobody Detected', 'author': 'Invented'},
+                       {'title': 'Discworld 4', 'author': 'Terry Pratchett'},
+                       {'title': 'Dune', 'author': 'Frank Herbert'},
+                       {'title': 'DUNE', 'author': 'Frank Herbert'}]
+    snapped, stats = reconcile(recommendations, shelf)
+    assert _titles(snapped) == ['Dune']
+    assert stats['dropped'] == 3
+
+
+def test_title_index_matches_misspellings_of_the_same_author_only():
+    index = TitleIndex([book_key('The Left Hand of Darkness', 'Ursula K. Le Guin')])
+    match = index.match('The Left Hand of Darknes', 'Le Guin')
+    assert match and match[0] == book_key('The Left Hand of Darkness', 'Ursula K. Le Guin')
+    assert index.match('The Left Hand of Darknes', 'Another Writer') is None
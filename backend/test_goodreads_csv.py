@@ -0,0 +1,35 @@
+import csv
+import io
+
+from ai_services import GOODREADS_COLUMNS, extract_goodreads_preferences, iter_goodreads_chunks
+
+HEADER = ['Book Id', 'Title', 'Author', 'My Rating', 'Exclusive Shelf', 'Date Read', 'My Review', 'Private Notes']
+
+
+def _export(rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(HEADER)
+    for i in range(rows):
+        rating = i % 6  # 0 = unrated
+        writer.writerow([i, f"Book {i}", f"Author {i % 7}", rating, 'read' if rating else 'to-read', '',
+                         'A long review, with commas\nand a line break', ''])
+    return io.BytesIO(buffer.getvalue().encode('utf-8'))
+
+
+def test_chunks_only_hold_the_columns_we_use():
+    chunks = list(iter_goodreads_chunks(_export(10), chunk_rows=4))
+    assert [len(chunk) for chunk in chunks] == [4, 4, 2]
+    assert all(sorted(chunk.columns) == sorted(GOODREADS_COLUMNS) for chunk in chunks)
+    assert chunks[0]['Title'].tolist() == ['Book 0', 'Book 1', 'Book 2', 'Book 3']
+    assert chunks[0]['My Rating'].tolist() == [0, 1, 2, 3]
+
+
+def test_large_export_is_summarized_chunk_by_chunk(stub):
+    chunk_sizes = []
+    preferences = extract_goodreads_preferences(_export(12000), on_chunk=lambda chunk: chunk_sizes.append(len(chunk)))
+
+    assert sum(chunk_sizes) == 12000 and len(chunk_sizes) > 1
+    assert preferences['library_stats'] == {'books': 12000, 'ratings': {str(rating): 2000 for rating in range(6)}}
+    assert len(preferences['authors']) == 7
+    assert preferences['genres'] and preferences['avoid']
@@ -0,0 +1,34 @@
+import time
+import uuid
+
+from ai_services import infer_goodreads_preferences
+
+
+def _titles(count):
+    run = uuid.uuid4().hex[:8]
+    return [f"Inference Test {run} {i}" for i in range(count)]
+
+
+def test_genre_and_avoid_inferences_run_in_parallel(stub):
+    stub.latency = 0.4
+    started = time.perf_counter()
+    genres, avoid = infer_goodreads_preferences(_titles(3), _titles(2))
+    elapsed = time.perf_counter() - started
+
+    assert genres and avoid
+    assert stub.requests == 2
+    assert elapsed < 2 * 0.4
+
+
+def test_the_same_book_set_is_inferred_once(stub):
+    liked, disliked = _titles(3), _titles(2)
+    first = infer_goodreads_preferences(liked, disliked)
+    # Order and case don't change the set of books
+    again = infer_goodreads_preferences([title.upper() for title in reversed(liked)], disliked)
+    assert again == first
+    assert stub.requests == 2
+
+
+def test_empty_title_lists_need_no_model_call(stub):
+    assert infer_goodreads_preferences([], []) == ([], "")
+    assert stub.requests == 0
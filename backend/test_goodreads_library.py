@@ -0,0 +1,36 @@
+import io
+
+import app as app_module
+from benchmarks.fixtures import goodreads_csv
+from database import get_goodreads_library_hashes
+
+
+def _upload(device_id, csv_bytes):
+    return app_module.app.test_client().post('/process-goodreads', content_type='multipart/form-data',
+                                             headers={'X-Device-ID': device_id},
+                                             data={'goodreads_csv': (io.BytesIO(csv_bytes), 'goodreads_library_export.csv')})
+
+
+def test_import_that_fails_part_way_leaves_the_library_as_it_was(stub, monkeypatch):
+    response = _upload('goodreads-test-atomic', goodreads_csv(30, seed=1))
+    assert response.status_code == 200
+    user_id = response.get_json()['user_id']
+    library = get_goodreads_library_hashes(user_id)
+    assert len(library) == 30
+
+    summarize = app_module.summarize_goodreads_export
+
+    def fails_after_first_chunk(csv_file, on_chunk=None):
+        def sync_then_fail(chunk):
+            on_chunk(chunk)
+            raise RuntimeError('connection lost')
+        return summarize(csv_file, on_chunk=sync_then_fail)
+    monkeypatch.setattr(app_module, 'summarize_goodreads_export', fails_after_first_chunk)
+
+    assert _upload('goodreads-test-atomic', goodreads_csv(30, seed=2)).status_code == 500
+    assert get_goodreads_library_hashes(user_id) == library
+
+    monkeypatch.undo()
+    response = _upload('goodreads-test-atomic', goodreads_csv(30, seed=2))
+    assert response.status_code == 200
+    assert response.get_json()['library_import'] == {'inserted': 30, 'updated': 0, 'unchanged': 0, 'deleted': 30}
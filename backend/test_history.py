@@ -0,0 +1,55 @@
+import uuid
+
+from app import app
+from database import get_or_create_user, save_analysis_session
+
+
+def _user_with_sessions(count):
+    device_id = f"history-test-{uuid.uuid4().hex[:8]}"
+    user = get_or_create_user(device_id)
+    for i in range(count):
+        save_analysis_session(user['id'], [{'title': f"Detected {i}", 'author': 'A'}] * (i + 1),
+                              [{'title': f"Recommended {i}", 'author': 'A'}])
+    return device_id
+
+
+def _get(path, device_id, **headers):
+    return app.test_client().get(path, headers={'X-Device-ID': device_id, **headers})
+
+
+def test_cursor_pages_cover_every_session_once_newest_first():
+    device_id = _user_with_sessions(5)
+    seen, cursor = [], None
+    while True:
+        page = _get(f"/history?limit=2{'&cursor=' + cursor if cursor else ''}", device_id).get_json()
+        assert len(page['history']) <= 2
+        seen.extend(page['history'])
+        cursor = page['next_cursor']
+        if not cursor:
+            break
+
+    assert [session['detected_books_count'] for session in seen] == [5, 4, 3, 2, 1]
+    assert len({session['session_id'] for session in seen}) == 5
+
+
+def test_summary_view_leaves_out_the_books():
+    device_id = _user_with_sessions(1)
+    session = _get('/history?view=summary', device_id).get_json()['history'][0]
+    assert set(session) == {'session_id', 'created_at', 'detected_books_count', 'recommendations_count'}
+
+    detail = _get(f"/history/{session['session_id']}", device_id).get_json()
+    assert detail['detected_books'] == [{'title': 'Detected 0', 'author': 'A'}]
+
+
+def test_unchanged_page_answers_not_modified():
+    device_id = _user_with_sessions(1)
+    etag = _get('/history', device_id).headers['ETag']
+    assert _get('/history', device_id, **{'If-None-Match': etag}).status_code == 304
+
+
+def test_bad_cursor_and_other_users_sessions_are_rejected():
+    owner, stranger = _user_with_sessions(1), _user_with_sessions(0)
+    session_id = _get('/history', owner).get_json()['history'][0]['session_id']
+    assert _get('/history?cursor=not-a-cursor', owner).status_code == 400
+    assert _get(f"/history/{session_id}", stranger).status_code == 404
+    assert _get('/history/not-a-uuid', owner).status_code == 404
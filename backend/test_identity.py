@@ -0,0 +1,52 @@
+import uuid
+
+import pytest
+
+import identity
+from cache import TTLCache
+
+
+@pytest.fixture
+def users(monkeypatch):
+    """get_or_create_user / touch_users against an in-memory table, counting database round-trips"""
+    table, calls = {}, {'lookups': 0, 'touches': []}
+
+    def get_or_create_user(device_id):
+        calls['lookups'] += 1
+        return table.setdefault(device_id, {'id': str(uuid.uuid4()), 'device_id': device_id})
+
+    monkeypatch.setattr(identity, 'get_or_create_user', get_or_create_user)
+    monkeypatch.setattr(identity, 'touch_users', lambda batch: calls['touches'].append(dict(batch)))
+    monkeypatch.setattr(identity, '_store', TTLCache(max_size=100, ttl_seconds=60))
+    monkeypatch.setattr(identity, '_pending_last_active', {})
+    return calls
+
+
+def test_repeat_lookups_are_served_from_the_cache(users):
+    first = identity.get_user('device-a')
+    assert identity.get_user('device-a') == first
+    assert identity.get_user('device-a') == first
+    assert users['lookups'] == 1
+
+
+def test_last_active_updates_are_coalesced_into_one_write(users):
+    a, b = identity.get_user('device-a'), identity.get_user('device-b')
+    for _ in range(5):
+        identity.get_user('device-a')
+        identity.get_user('device-b')
+    assert users['touches'] == []
+
+    assert identity.flush_last_active() == 2
+    assert len(users['touches']) == 1 and set(users['touches'][0]) == {a['id'], b['id']}
+    assert identity.flush_last_active() == 0
+
+
+def test_failed_flush_keeps_the_updates_for_next_time(users, monkeypatch):
+    user = identity.get_user('device-a')
+    identity.get_user('device-a')
+
+    def unavailable(batch):
+        raise RuntimeError('database unavailable')
+    monkeypatch.setattr(identity, 'touch_users', unavailable)
+    assert identity.flush_last_active() == 0
+    assert list(identity._pending_last_active) == [user['id']]
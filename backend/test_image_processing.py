@@ -0,0 +1,56 @@
+import base64
+import io
+
+from PIL import Image
+
+import image_processing
+from image_processing import preprocess_image
+from uploads import ShelfImage
+
+
+def _upload(width, height, format='JPEG', orientation=None, quality=75):
+    buffer = io.BytesIO()
+    image = Image.effect_noise((width, height), 40).convert('RGB')
+    exif = image.getexif()
+    if orientation:
+        exif[0x0112] = orientation
+    image.save(buffer, format=format, exif=exif, **({'quality': quality} if format == 'JPEG' else {}))
+    return ShelfImage.from_stream(io.BytesIO(buffer.getvalue()))
+
+
+def _sizes(prepared):
+    return [Image.open(io.BytesIO(base64.b64decode(tile))).size for tile in prepared.tiles]
+
+
+def test_large_photo_is_downscaled_to_what_the_model_sees():
+    prepared = preprocess_image(_upload(2400, 1800))
+    assert _sizes(prepared) == [(1024, 768)]
+    assert prepared.stats['original_size'] == [2400, 1800]
+    assert prepared.stats['bytes_saved'] > 0
+
+
+def test_rotated_photo_is_turned_upright_first():
+    prepared = preprocess_image(_upload(1500, 500, orientation=6))
+    assert prepared.stats['original_size'] == [500, 1500]
+    assert all(height > width for width, height in _sizes(prepared))
+
+
+def test_wide_shelf_is_split_into_overlapping_tiles():
+    prepared = preprocess_image(_upload(3000, 500, format='PNG'))
+    sizes = _sizes(prepared)
+    assert 2 <= len(sizes) <= image_processing.MAX_TILES
+    assert sum(width for width, _ in sizes) > 3000  # tiles overlap
+    assert all(height == 500 for _, height in sizes)
+
+
+def test_small_jpeg_is_sent_unchanged():
+    upload = _upload(320, 240, quality=20)  # re-encoding at our quality would only grow it
+    prepared = preprocess_image(upload)
+    assert prepared.tiles == [upload.to_base64()]
+
+
+def test_undecodable_upload_falls_back_to_the_original():
+    upload = ShelfImage.from_stream(io.BytesIO(b'not an image'))
+    prepared = preprocess_image(upload)
+    assert prepared.tiles == [upload.to_base64()]
+    assert prepared.stats['skipped'] is True
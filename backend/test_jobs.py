@@ -0,0 +1,77 @@
+import base64
+import time
+from datetime import datetime, timedelta, timezone
+
+import app as app_module
+import jobs
+import resilience
+from benchmarks.fixtures import shelf_photo
+from logging_setup import get_request_id, set_request_id
+from uploads import ShelfImage
+from database import AnalysisJob, create_analysis_job, get_or_create_user, get_session, update_analysis_job
+
+
+def _job_in(status: str, idle_seconds: float):
+    user = get_or_create_user(f"jobs-test-{status}-{idle_seconds}")
+    job = create_analysis_job(user['id'])
+    update_analysis_job(job['job_id'], status=status)
+    db = get_session()
+    try:
+        db.query(AnalysisJob).filter(AnalysisJob.id == job['job_id'])\
+          .update({'updated_at': datetime.now(timezone.utc) - timedelta(seconds=idle_seconds)}, synchronize_session=False)
+        db.commit()
+    finally:
+        db.close()
+    return job['job_id'], user['id']
+
+
+def test_job_abandoned_by_a_dead_worker_is_failed():
+    job_id, user_id = _job_in('detecting', jobs.JOB_STALE_SECONDS + 60)
+    job = jobs.get_job(job_id, user_id)
+    assert job['status'] == 'failed'
+    assert job['error']
+
+
+def test_job_still_within_its_time_is_left_alone():
+    job_id, user_id = _job_in('recommending', 5)
+    assert jobs.get_job(job_id, user_id)['status'] == 'recommending'
+
+
+def test_event_stream_for_a_stale_job_ends():
+    job_id, user_id = _job_in('detecting', jobs.JOB_STALE_SECONDS + 60)
+    events = list(jobs.job_events(job_id, user_id))
+    assert events[-1].startswith('event: done')
+
+
+def test_event_stream_error_before_streaming_is_json(monkeypatch):
+    def unavailable(device_id):
+        raise RuntimeError('database unavailable')
+    monkeypatch.setattr(app_module, 'get_user', unavailable)
+    response = app_module.app.test_client().get(f"/analyze/jobs/{'0' * 8}-0000-0000-0000-{'0' * 12}/events",
+                                                headers={'X-Device-ID': 'jobs-test'})
+    assert response.status_code == 500
+    assert response.get_json() == {'error': 'database unavailable'}
+
+
+def test_job_runs_in_the_queueing_request_context_with_its_own_budget(stub, monkeypatch):
+    seen = {}
+    detect_books = jobs.detect_books
+
+    def recording(image, user_id=None):
+        seen.update(request_id=get_request_id(), remaining=resilience.remaining())
+        return detect_books(image, user_id)
+    monkeypatch.setattr(jobs, 'detect_books', recording)
+
+    set_request_id('queued-by-this-request')
+    resilience.start_budget(0.01)  # the queueing request's budget must not carry over
+    user = get_or_create_user('jobs-test-context')
+    image = ShelfImage.from_base64(base64.b64encode(shelf_photo(7)).decode('ascii'))
+    job = jobs.submit_analysis_job(user['id'], image, {'genres': ['Fantasy']})
+    set_request_id(None)
+    for _ in range(100):
+        if jobs.get_job(job['job_id'], user['id'])['status'] in ('completed', 'failed'):
+            break
+        time.sleep(0.1)
+    assert jobs.get_job(job['job_id'], user['id'])['status'] == 'completed'
+    assert seen['request_id'] == 'queued-by-this-request'
+    assert seen['remaining'] > resilience.REQUEST_BUDGET_SECONDS - 30
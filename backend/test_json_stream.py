@@ -0,0 +1,49 @@
+import json
+
+import pytest
+
+from json_stream import JSONArrayStream
+
+RECOMMENDATIONS = [
+    {'title': 'Brackets ]} inside', 'author': 'A', 'matchReason': 'Closes ]] and }} early'},
+    {'title': 'Say "hello"', 'author': 'B \\ C', 'matchReason': 'Escaped \\" quote then ]}'},
+    {'title': 'Nested', 'author': 'D', 'tags': [{'k': [1, 2]}, {}]},
+]
+DOCUMENT = json.dumps({'note': 'a "recommendations": [ decoy in a string?', 'recommendations': RECOMMENDATIONS,
+                       'after': [{'ignored': True}]})
+
+
+def _feed(parser, pieces):
+    items = []
+    for piece in pieces:
+        items.extend(parser.feed(piece))
+    return items
+
+
+@pytest.mark.parametrize('size', [1, 2, 7, len(DOCUMENT)])
+def test_items_survive_any_split(size):
+    parser = JSONArrayStream('recommendations')
+    pieces = [DOCUMENT[i:i + size] for i in range(0, len(DOCUMENT), size)]
+    assert _feed(parser, pieces) == RECOMMENDATIONS
+    assert parser.done
+
+
+def test_each_item_is_returned_as_soon_as_it_closes():
+    parser = JSONArrayStream('recommendations')
+    first = json.dumps(RECOMMENDATIONS[0])
+    assert parser.feed('{"recommendations": [' + first[:-1]) == []
+    assert parser.feed(first[-1] + ', {"title"') == [RECOMMENDATIONS[0]]
+    assert parser.feed(': "Next"}') == [{'title': 'Next'}]
+
+
+def test_only_the_unfinished_tail_is_kept():
+    parser = JSONArrayStream('recommendations')
+    parser.feed('{"recommendations": [' + ', '.join(json.dumps(item) for item in RECOMMENDATIONS) + ', {"title": "Half')
+    assert parser.buffer == '{"title": "Half'
+
+
+def test_nothing_after_the_array_closes():
+    parser = JSONArrayStream('recommendations')
+    assert _feed(parser, ['{"recommendations": []', ', "more": [{"a": 1}]}']) == []
+    assert parser.done
+    assert parser.feed('[{"a": 1}]') == []
@@ -0,0 +1,58 @@
+import asyncio
+import json
+import threading
+import time
+
+import pytest
+
+import llm_client
+import resilience
+
+
+def _request(schema_name):
+    return {
+        'model': 'gpt-4o-mini',
+        'messages': [{'role': 'user', 'content': 'hi'}],
+        'response_format': {'type': 'json_schema', 'json_schema': {'name': schema_name, 'schema': {}}},
+    }
+
+
+def test_one_client_is_shared_across_threads(stub):
+    clients = []
+    threads = [threading.Thread(target=lambda: clients.append(llm_client.get_client())) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(clients) == 8 and all(client is clients[0] for client in clients)
+
+
+def test_sync_calls_reuse_the_shared_client(stub):
+    for _ in range(3):
+        response = llm_client.chat_completion(**_request('GenreList'))
+        assert 'Fantasy' in json.loads(response.choices[0].message.content)['genres']
+    assert llm_client.get_client() is llm_client.get_client()
+    assert stub.requests == 3
+
+
+def test_async_batch_runs_concurrently_and_keeps_input_order(stub):
+    stub.latency = 0.3
+    started = time.perf_counter()
+    responses = asyncio.run(llm_client.achat_completion_batch([_request('AvoidElements'), _request('GenreList')] * 2))
+    elapsed = time.perf_counter() - started
+
+    answers = [json.loads(response.choices[0].message.content) for response in responses]
+    assert [list(answer) for answer in answers] == [['elements'], ['genres']] * 2
+    assert elapsed < 4 * 0.3
+
+
+def test_a_trickling_stream_is_cut_off_at_the_attempt_deadline(stub):
+    stub.per_token_latency = 0.05  # a delta every 0.2s: each read is quick, the whole stream is not
+    resilience.start_budget(0.5)
+    started = time.perf_counter()
+    deltas = []
+    with pytest.raises(resilience.DeadlineExceeded):
+        for delta in llm_client.chat_completion_stream(**_request('GenreList')):
+            deltas.append(delta)
+    assert deltas  # it was streaming, not failing to open
+    assert time.perf_counter() - started < 1.5
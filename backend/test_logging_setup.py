@@ -0,0 +1,23 @@
+import logging
+
+from logging_setup import UNSAMPLED, SamplingFilter
+
+
+def _record(msg, level=logging.INFO, **extra):
+    record = logging.LogRecord('app', level, __file__, 1, msg, ('POST', '/analyze', 200, 12.5), None)
+    record.__dict__.update(extra)
+    return record
+
+
+def test_rate_limit_drops_a_chatty_template():
+    sampling = SamplingFilter(sample_rate=1.0, per_second=20)
+    kept = sum(sampling.filter(_record("%s %s %s in %s ms")) for _ in range(100))
+    assert kept < 100
+    assert sampling.dropped == 100 - kept
+
+
+def test_access_lines_and_warnings_are_never_dropped():
+    sampling = SamplingFilter(sample_rate=0.01, per_second=20)
+    assert all(sampling.filter(_record("%s %s %s in %s ms", **UNSAMPLED)) for _ in range(500))
+    assert all(sampling.filter(_record("%s %s %s failed in %s ms", logging.WARNING)) for _ in range(500))
+    assert sampling.dropped == 0
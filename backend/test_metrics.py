@@ -0,0 +1,64 @@
+import math
+
+import pytest
+
+import metrics
+from metrics import Counter, Histogram, call_errors, call_seconds, instrument
+
+
+def test_histogram_buckets_and_quantiles():
+    latency = Histogram('test_seconds', 'Test latency', ('stage',), buckets=(0.1, 1, 10))
+    for value in (0.05, 0.5, 0.5, 5):
+        latency.observe(value, 'detect')
+    cumulative, total, count = latency.snapshot()[('detect',)]
+    assert cumulative == [1, 3, 4, 4]
+    assert (total, count) == (6.05, 4)
+    assert latency.quantile(0.5, cumulative, count) == pytest.approx(0.55)
+    assert math.isnan(latency.quantile(0.5, [0, 0, 0, 0], 0))
+
+    text = '\n'.join(latency.expose())
+    assert 'test_seconds_bucket{stage="detect",le="+Inf"} 4' in text
+    assert 'test_seconds_quantile{stage="detect",quantile="0.99"}' in text
+
+
+def test_counter_label_values_are_escaped():
+    errors = Counter('test_total', 'Test errors', ('function',))
+    errors.inc(2, 'say "hi"\n')
+    assert 'test_total{function="say \\"hi\\"\\n"} 2' in errors.expose()
+
+
+def test_instrumented_generators_are_timed_over_their_whole_iteration():
+    def numbers():
+        yield 1
+        raise ValueError('boom')
+
+    wrapped = instrument(numbers, 'test_metrics.numbers')
+    with pytest.raises(ValueError):
+        list(wrapped())
+    _, _, count = call_seconds.snapshot()[('test_metrics.numbers',)]
+    assert count == 1
+    assert "test_metrics.numbers\"} 1" in '\n'.join(call_errors.expose())
+
+
+def test_failing_collector_does_not_break_the_scrape(monkeypatch):
+    def broken():
+        raise RuntimeError('pool gone')
+    monkeypatch.setattr(metrics, '_collectors', [broken, lambda: [('test_gauge', 'A gauge', 'gauge', [({'pool': 'db'}, 3)])]])
+    text = metrics.expose()
+    assert '# collector broken failed: pool gone' in text
+    assert f'{metrics.METRICS_PREFIX}_test_gauge{{pool="db"}} 3' in text
+
+
+def test_process_metrics_without_resource(monkeypatch):
+    monkeypatch.setattr(metrics, 'resource', None)
+    names = [family[0] for family in metrics._process_metrics()]
+    assert 'process_peak_rss_bytes' not in names
+
+
+def test_metrics_endpoint_reports_request_latency():
+    from app import app
+    client = app.test_client()
+    client.get('/health')
+    response = client.get('/metrics')
+    assert response.mimetype == 'text/plain'
+    assert f'{metrics.METRICS_PREFIX}_http_request_seconds_count{{method="GET",endpoint="health_check",status="200"}}' in response.get_data(as_text=True)
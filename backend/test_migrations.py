@@ -0,0 +1,140 @@
+import os
+import tempfile
+import uuid
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from sqlalchemy import (JSON, Boolean, Column, DateTime, Integer, MetaData, String, Table, Text, Uuid, create_engine,
+                        inspect, select, text)
+
+from database import Base
+from migrations import MIGRATIONS, run_migrations, schema_migrations, validate_query_plans
+
+
+def _baseline_tables(metadata):
+    """The schema as first deployed, before any migration"""
+    Table('users', metadata,
+          Column('id', Uuid, primary_key=True), Column('device_id', String, unique=True, nullable=False),
+          Column('created_at', DateTime), Column('last_active', DateTime))
+    Table('user_preferences', metadata,
+          Column('id', Integer, primary_key=True, autoincrement=True), Column('user_id', Uuid, nullable=False),
+          Column('favorite_authors', JSON), Column('preferred_genres', JSON), Column('avoid_elements', Text),
+          Column('goodreads_data', JSON), Column('updated_at', DateTime))
+    Table('analysis_sessions', metadata,
+          Column('id', Uuid, primary_key=True), Column('user_id', Uuid, nullable=False),
+          Column('image_filename', String), Column('detected_books', JSON), Column('recommendations', JSON),
+          Column('created_at', DateTime))
+    Table('book_cache', metadata,
+          Column('id', Integer, primary_key=True, autoincrement=True), Column('title', String, nullable=False),
+          Column('author', String, nullable=False), Column('book_metadata', JSON), Column('created_at', DateTime),
+          Column('expires_at', DateTime))
+    return Table('saved_books', metadata,
+                 Column('id', Integer, primary_key=True, autoincrement=True), Column('user_id', Uuid, nullable=False),
+                 Column('title', String, nullable=False), Column('author', String, nullable=False),
+                 Column('match_score', Integer), Column('match_reason', Text), Column('source_session_id', Uuid),
+                 Column('additional_notes', Text), Column('saved_at', DateTime), Column('is_read', Boolean))
+
+
+@pytest.fixture
+def engine():
+    workdir = tempfile.mkdtemp(prefix='migrations-test-')
+    engine = create_engine(f"sqlite:///{os.path.join(workdir, 'schema.db')}")
+    yield engine
+    engine.dispose()
+
+
+def _migrate(engine):
+    """What create_tables() does at startup"""
+    Base.metadata.create_all(bind=engine)
+    return run_migrations(engine)
+
+
+def _check_schema(engine):
+    latest = max(migration.version for migration in MIGRATIONS)
+    with engine.connect() as conn:
+        versions = set(conn.execute(select(schema_migrations.c.version)).scalars())
+    assert versions == {migration.version for migration in MIGRATIONS}
+    assert max(versions) == latest
+
+    inspector = inspect(engine)
+    for table in Base.metadata.sorted_tables:
+        present = {index['name'] for index in inspector.get_indexes(table.name)}
+        assert {index.name for index in table.indexes} <= present, table.name
+    assert 'ix_analysis_sessions_user_created' not in {index['name'] for index in inspector.get_indexes('analysis_sessions')}
+
+    failures = [result for result in validate_query_plans(engine) if not result['ok']]
+    assert not failures, failures
+    assert run_migrations(engine) == []  # nothing left to apply
+
+
+def test_migrations_on_an_empty_database(engine):
+    assert _migrate(engine) == sorted(migration.version for migration in MIGRATIONS)
+    _check_schema(engine)
+
+
+def test_migrations_on_the_baseline_schema_with_duplicate_saves(engine):
+    metadata = MetaData()
+    saved_books = _baseline_tables(metadata)
+    metadata.create_all(bind=engine)
+    reader, other_reader = uuid.uuid4(), uuid.uuid4()
+    saved_at = datetime.now(timezone.utc) - timedelta(days=3)
+    with engine.begin() as conn:
+        conn.execute(saved_books.insert(), [
+            {'id': 1, 'user_id': reader, 'title': 'Dune', 'author': 'Frank Herbert', 'saved_at': saved_at},
+            {'id': 2, 'user_id': reader, 'title': 'dune ', 'author': 'Frank  HERBERT', 'saved_at': saved_at},
+            {'id': 3, 'user_id': reader, 'title': 'Emma', 'author': 'Jane Austen', 'saved_at': saved_at},
+            {'id': 4, 'user_id': reader, 'title': 'Dune', 'author': 'Frank Herbert', 'saved_at': saved_at},
+            {'id': 5, 'user_id': other_reader, 'title': 'Dune', 'author': 'Frank Herbert', 'saved_at': saved_at},
+        ])
+        conn.execute(metadata.tables['analysis_sessions'].insert(), [
+            {'id': uuid.uuid4(), 'user_id': reader, 'created_at': saved_at,
+             'detected_books': [{'title': 'Dune'}, {'title': 'Emma'}], 'recommendations': [{'title': 'Dune'}]},
+        ])
+
+    _migrate(engine)
+
+    with engine.connect() as conn:
+        rows = conn.execute(text("SELECT id, normalized_title, normalized_author FROM saved_books ORDER BY id")).all()
+        counts = conn.execute(text("SELECT detected_books_count, recommendations_count FROM analysis_sessions")).all()
+    assert [row.id for row in rows] == [1, 3, 5]  # the earliest save of each book per user survives
+    assert all(row.normalized_title and row.normalized_author for row in rows)
+    assert counts == [(2, 1)]
+    _check_schema(engine)
+
+
+def test_duplicate_saves_are_merged_into_the_earliest(engine):
+    metadata = MetaData()
+    saved_books = _baseline_tables(metadata)
+    metadata.create_all(bind=engine)
+    reader = uuid.uuid4()
+    first_saved = datetime(2024, 1, 5, 12, 0)
+    with engine.begin() as conn:
+        conn.execute(saved_books.insert(), [
+            {'id': 1, 'user_id': reader, 'title': 'Dune', 'author': 'Frank Herbert', 'saved_at': first_saved + timedelta(days=2),
+             'additional_notes': 'From the shelf at work', 'is_read': False},
+            {'id': 2, 'user_id': reader, 'title': 'DUNE', 'author': 'frank herbert', 'saved_at': first_saved,
+             'additional_notes': 'Borrow from Sam', 'is_read': True},
+        ])
+
+    _migrate(engine)
+
+    with engine.connect() as conn:
+        rows = conn.execute(text("SELECT id, is_read, additional_notes, saved_at FROM saved_books")).all()
+    assert len(rows) == 1
+    kept = rows[0]
+    assert kept.id == 1
+    assert kept.is_read
+    assert 'From the shelf at work' in kept.additional_notes and 'Borrow from Sam' in kept.additional_notes
+    assert str(kept.saved_at).startswith(str(first_saved))
+
+
+def test_migration_2_creates_the_indexes_it_shipped_with(engine, monkeypatch):
+    import migrations
+    metadata = MetaData()
+    _baseline_tables(metadata)
+    metadata.create_all(bind=engine)
+    monkeypatch.setattr(migrations, 'MIGRATIONS', [m for m in MIGRATIONS if m.version <= 2])
+    assert run_migrations(engine) == [1, 2]
+    inspector = inspect(engine)
+    assert {index['name'] for index in inspector.get_indexes('analysis_sessions')} == {'ix_analysis_sessions_user_created'}
+    assert {index['name'] for index in inspector.get_indexes('user_preferences')} == {'ix_user_preferences_user_id'}
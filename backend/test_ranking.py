@@ -0,0 +1,66 @@
+import pytest
+
+import ranking
+from normalize import book_key
+from ranking import rank_books
+
+
+def _book(title, author='Someone', genre='Fantasy'):
+    return {'title': title, 'author': author, 'genre': genre}
+
+
+@pytest.fixture
+def signals(monkeypatch):
+    """Goodreads signals for user 'reader'; tests fill in the shelves"""
+    found = {'read': set(), 'to_read': set(), 'author_ratings': {}}
+    monkeypatch.setattr(ranking, 'get_goodreads_ranking_signals', lambda user_id: found)
+    return found
+
+
+def _titles(books):
+    return [book['title'] for book in books]
+
+
+def test_ties_keep_shelf_order():
+    shelf = [_book(f"Book {i}") for i in range(5)]
+    candidates, stats = rank_books({}, shelf)
+    assert _titles(candidates) == _titles(shelf)
+    assert stats['candidates'] == 5
+
+
+def test_preferences_move_books_up_and_top_k_cuts_the_rest():
+    shelf = [_book('Plain'), _book('Genre match', genre='Mystery'), _book('Favorite', author='Ursula K. Le Guin')]
+    preferences = {'authors': ['Ursula K Le Guin'], 'genres': ['mystery']}
+    candidates, _ = rank_books(preferences, shelf, top_k=2)
+    assert _titles(candidates) == ['Favorite', 'Genre match']
+
+
+def test_read_books_are_dropped_even_when_misspelled(signals):
+    signals['read'] = {book_key('The Left Hand of Darkness', 'Ursula K. Le Guin')}
+    shelf = [_book('The Left Hand of Darknes', 'Ursula K. Le Guin'), _book('The Dispossessed', 'Ursula K. Le Guin')]
+    candidates, stats = rank_books({}, shelf, user_id='reader')
+    assert _titles(candidates) == ['The Dispossessed']
+    assert stats['dropped_read'] == 1
+
+
+def test_avoided_genres_and_duplicates_are_dropped():
+    shelf = [_book('Scary', genre='Horror'), _book('Nice'), _book('NICE'), _book('Sad', genre='Tragedy')]
+    candidates, stats = rank_books({'avoid': 'horror, tragedy'}, shelf)
+    assert _titles(candidates) == ['Nice']
+    assert (stats['dropped_avoid'], stats['duplicates']) == (2, 1)
+
+
+def test_goodreads_shelves_and_ratings_reorder(signals):
+    signals['to_read'] = {book_key('Wanted', 'Someone')}
+    signals['author_ratings'] = {book_key('', 'Loved Author')[1]: 5, book_key('', 'Disliked Author')[1]: 1}
+    shelf = [_book('Disliked', 'Disliked Author'), _book('Plain'), _book('Loved', 'Loved Author'), _book('Wanted')]
+    candidates, _ = rank_books({}, shelf, user_id='reader')
+    assert _titles(candidates) == ['Wanted', 'Loved', 'Plain', 'Disliked']
+
+
+def test_failed_signals_lookup_still_ranks(monkeypatch):
+    def unavailable(user_id):
+        raise RuntimeError('database unavailable')
+    monkeypatch.setattr(ranking, 'get_goodreads_ranking_signals', unavailable)
+    candidates, _ = rank_books({}, [_book('Dune')], user_id='reader')
+    assert _titles(candidates) == ['Dune']
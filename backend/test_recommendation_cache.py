@@ -0,0 +1,47 @@
+import uuid
+
+from analysis import recommend_books, stream_recommend_books
+from database import get_or_create_user, save_user_preferences
+from recommendation_cache import recommendation_key
+
+PREFERENCES = {'authors': ['Ursula K. Le Guin', 'Frank Herbert'], 'genres': ['Fantasy', 'Sci-Fi'], 'avoid': 'Horror'}
+
+
+def _shelf():
+    run = uuid.uuid4().hex[:8]
+    return [{'title': f"Cache Test {run} {i}", 'author': f"Author {i}", 'genre': 'Fantasy'} for i in range(4)]
+
+
+def test_key_ignores_order_case_and_spacing():
+    shelf = _shelf()
+    same = {'authors': ['frank herbert', 'Ursula K Le Guin'], 'genres': ['sci-fi', ' fantasy'], 'avoid': 'horror '}
+    assert recommendation_key(same, list(reversed(shelf))) == recommendation_key(PREFERENCES, shelf)
+    assert recommendation_key({**PREFERENCES, 'avoid': 'Romance'}, shelf) != recommendation_key(PREFERENCES, shelf)
+    assert recommendation_key(PREFERENCES, shelf[:3]) != recommendation_key(PREFERENCES, shelf)
+
+
+def test_same_shelf_and_tastes_skip_the_model(stub):
+    shelf = _shelf()
+    first = recommend_books(PREFERENCES, shelf, user_id=str(uuid.uuid4()))
+    assert first and stub.requests == 1
+    # Another user with the same preferences, and the streamed endpoint, share the entry
+    assert recommend_books(PREFERENCES, shelf, user_id=str(uuid.uuid4())) == first
+    assert list(stream_recommend_books(PREFERENCES, shelf)) == first
+    assert stub.requests == 1
+
+
+def test_changed_preferences_miss(stub):
+    shelf = _shelf()
+    recommend_books(PREFERENCES, shelf)
+    recommend_books({**PREFERENCES, 'genres': ['Mystery']}, shelf)
+    assert stub.requests == 2
+
+
+def test_one_users_new_preferences_keep_anothers_cached_results(stub):
+    shelf = _shelf()
+    changing, other = (get_or_create_user(f"cache-test-{uuid.uuid4().hex[:8]}")['id'] for _ in range(2))
+    save_user_preferences(changing, PREFERENCES)
+    first = recommend_books(PREFERENCES, shelf, changing)
+    save_user_preferences(changing, {**PREFERENCES, 'genres': ['Mystery']})
+    assert recommend_books(PREFERENCES, shelf, other) == first
+    assert stub.requests == 1
@@ -0,0 +1,74 @@
+import base64
+import threading
+import time
+
+import pytest
+
+import llm_client
+import resilience
+from ai_services import analyze_bookshelf_tiles
+from benchmarks.fixtures import shelf_photo
+
+
+def _tile(seed=1):
+    return base64.b64encode(shelf_photo(seed)).decode('ascii')
+
+
+def test_default_budget_covers_a_slow_analysis():
+    # /analyze legitimately spends 20-60 s on the model; the default budget must not cut that off
+    assert resilience.REQUEST_BUDGET_SECONDS >= 60
+
+
+def test_slow_detection_finishes_under_the_default_budget(stub):
+    stub.latency = 1.5
+    resilience.start_budget()
+    books = analyze_bookshelf_tiles([_tile(), _tile(2)])
+    assert books
+    assert stub.requests == 2  # one answered attempt per tile, nothing retried or timed out
+
+
+def test_slow_detection_finishes_when_the_budget_covers_it(stub):
+    stub.latency = 1.0
+    resilience.start_budget(3)
+    assert analyze_bookshelf_tiles([_tile()])
+    assert stub.requests == 1
+
+
+def test_detection_slower_than_the_budget_is_a_deadline(stub):
+    stub.latency = 2.0
+    resilience.start_budget(0.5)
+    with pytest.raises(resilience.DeadlineExceeded):
+        analyze_bookshelf_tiles([_tile()])
+
+
+def _request():
+    return dict(model='gpt-4.1', messages=[{'role': 'user', 'content': 'Top genres?'}],
+                response_format={'type': 'json_schema', 'json_schema': {'name': 'GenreList', 'schema': {}}})
+
+
+def test_waiting_for_a_slot_is_bounded_by_the_budget(stub, monkeypatch):
+    busy = threading.BoundedSemaphore(1)
+    busy.acquire()
+    monkeypatch.setattr(llm_client, '_semaphore', busy)
+    resilience.start_budget(0.3)
+    started = time.monotonic()
+    with pytest.raises(resilience.DeadlineExceeded):
+        llm_client.chat_completion(**_request())
+    assert time.monotonic() - started < 1
+    assert stub.requests == 0
+
+
+def test_stream_gives_its_slot_back_while_backing_off(stub, monkeypatch):
+    monkeypatch.setattr(llm_client, '_semaphore', threading.BoundedSemaphore(1))
+    stub.script, stub.error_status, stub.retry_after = ['error'], 503, 0.6
+    content = []
+    streaming = threading.Thread(target=lambda: content.extend(llm_client.chat_completion_stream(**_request())))
+    streaming.start()
+    time.sleep(0.3)  # the first attempt has failed; the stream is waiting out Retry-After
+    free = llm_client._semaphore.acquire(blocking=False)
+    if free:
+        llm_client._semaphore.release()
+    streaming.join()
+    assert free
+    assert content and stub.requests == 2
+    assert llm_client._semaphore.acquire(blocking=False)  # released when the stream ended
@@ -0,0 +1,76 @@
+import uuid
+
+import pytest
+
+import app as app_module
+from app import app
+
+BOOKS = [{'title': 'Dune', 'author': 'Frank Herbert'},
+         {'title': 'Emma', 'author': 'Jane Austen'},
+         {'title': 'Beloved', 'author': 'Toni Morrison'}]
+
+
+@pytest.fixture
+def client():
+    client = app.test_client()
+    client.environ_base['HTTP_X_DEVICE_ID'] = f"batch-test-{uuid.uuid4().hex[:8]}"
+    return client
+
+
+def _saved(client):
+    return {book['title']: book for book in client.get('/saved-books').get_json()['books']}
+
+
+def test_batch_save_reports_each_book_in_order(client):
+    first = client.post('/saved-books/batch', json={'books': BOOKS[:2]}).get_json()
+    assert first['saved'] == 2
+    # A re-spelled duplicate inside the batch and a book saved earlier both count as already saved
+    again = client.post('/saved-books/batch', json={'books': [BOOKS[2], {'title': 'DUNE', 'author': 'frank herbert'}, BOOKS[2]]}).get_json()
+    assert [(r['title'], r['already_saved']) for r in again['results']] == [('Beloved', False), ('DUNE', True), ('Beloved', True)]
+    assert again['saved'] == 1
+    assert again['results'][1]['book_id'] == first['results'][0]['book_id']
+    assert set(_saved(client)) == {'Dune', 'Emma', 'Beloved'}
+
+
+def test_batch_check_and_unsave(client):
+    client.post('/saved-books/batch', json={'books': BOOKS[:2]})
+    check = client.post('/saved-books/check-batch', json={'books': BOOKS}).get_json()['results']
+    assert [r['is_saved'] for r in check] == [True, True, False]
+
+    removed = client.delete('/saved-books/batch', json={'books': BOOKS}).get_json()
+    assert removed['removed'] == 2 and [r['success'] for r in removed['results']] == [True, True, False]
+    assert _saved(client) == {}
+
+
+def test_batch_read_and_notes_only_touch_the_users_own_books(client):
+    ids = [r['book_id'] for r in client.post('/saved-books/batch', json={'books': BOOKS[:2]}).get_json()['results']]
+    stranger = app.test_client()
+    stranger.environ_base['HTTP_X_DEVICE_ID'] = f"batch-test-{uuid.uuid4().hex[:8]}"
+    assert [r['success'] for r in stranger.put('/saved-books/batch/read', json={'book_ids': ids}).get_json()['results']] == [False, False]
+
+    read = client.put('/saved-books/batch/read', json={'book_ids': ids + [0], 'is_read': True}).get_json()['results']
+    assert [r['success'] for r in read] == [True, True, False]
+    notes = client.put('/saved-books/batch/notes', json={'notes': [{'book_id': ids[0], 'notes': 'Reread'}]}).get_json()
+    assert notes['results'] == [{'book_id': ids[0], 'success': True}]
+
+    saved = _saved(client)
+    assert saved['Dune']['is_read'] and saved['Emma']['is_read']
+    assert saved['Dune']['additional_notes'] == 'Reread'
+
+
+@pytest.mark.parametrize('body', [{}, {'books': []}, {'books': [{'title': 'No author'}]}, {'books': 'Dune'}])
+def test_malformed_batches_are_rejected(client, body):
+    assert client.post('/saved-books/batch', json=body).status_code == 400
+
+
+def test_oversized_batches_are_rejected(client, monkeypatch):
+    monkeypatch.setattr(app_module, 'SAVED_BOOKS_BATCH_LIMIT', 2)
+    assert client.post('/saved-books/check-batch', json={'books': BOOKS}).status_code == 400
+
+
+def test_single_and_batch_routes_set_the_same_device_cookie(client):
+    single = client.get('/saved-books')
+    batch = client.post('/saved-books/check-batch', json={'books': BOOKS[:1]})
+    assert single.status_code == batch.status_code == 200
+    assert single.headers['Set-Cookie'] == batch.headers['Set-Cookie']
+    assert 'Max-Age=31536000' in single.headers['Set-Cookie']
@@ -0,0 +1,71 @@
+import uuid
+
+import pytest
+
+import shelf_cache
+from shelf_cache import ShelfFingerprint, get_cached_books, store_books
+
+# Two different shelves whose dHashes differ by one bit: close enough to count as the same photo
+SHELF_PHASH, LOOKALIKE_PHASH = '0f0f0f0f0f0f0f0f', '0f0f0f0f0f0f0f0e'
+
+
+@pytest.fixture(autouse=True)
+def empty_memory_tier():
+    shelf_cache._memory_tier.clear()
+    yield
+    shelf_cache._memory_tier.clear()
+
+
+def _fingerprint(phash):
+    return ShelfFingerprint(uuid.uuid4().hex * 2, phash)
+
+
+def _users():
+    return str(uuid.uuid4()), str(uuid.uuid4())
+
+
+def test_lookalike_photo_from_the_same_user_hits():
+    owner, _ = _users()
+    books = [{'title': 'Dune', 'author': 'Frank Herbert'}]
+    store_books(_fingerprint(SHELF_PHASH), books, owner)
+    assert get_cached_books(_fingerprint(LOOKALIKE_PHASH), owner) == books
+
+
+def test_lookalike_photo_from_another_user_misses():
+    owner, stranger = _users()
+    store_books(_fingerprint(SHELF_PHASH), [{'title': 'Private Diary', 'author': 'Owner'}], owner)
+    assert get_cached_books(_fingerprint(LOOKALIKE_PHASH), stranger) is None
+
+
+def test_same_perceptual_hash_from_another_user_misses_in_the_database():
+    owner, stranger = _users()
+    store_books(_fingerprint(SHELF_PHASH), [{'title': 'Private Diary', 'author': 'Owner'}], owner)
+    shelf_cache._memory_tier.clear()  # only the database tier left
+    assert get_cached_books(_fingerprint(SHELF_PHASH), stranger) is None
+    assert get_cached_books(_fingerprint(SHELF_PHASH), owner) is not None
+
+
+def test_lookalike_photo_from_the_same_user_hits_in_the_database():
+    owner, stranger = _users()
+    books = [{'title': 'Dune', 'author': 'Frank Herbert'}]
+    store_books(_fingerprint(SHELF_PHASH), books, owner)
+    shelf_cache._memory_tier.clear()  # only the database tier left
+    assert get_cached_books(_fingerprint(LOOKALIKE_PHASH), stranger) is None
+    assert get_cached_books(_fingerprint(LOOKALIKE_PHASH), owner) == books
+
+
+def test_distant_photo_misses_in_the_database():
+    owner, _ = _users()
+    store_books(_fingerprint(SHELF_PHASH), [{'title': 'Dune', 'author': 'Frank Herbert'}], owner)
+    shelf_cache._memory_tier.clear()
+    assert get_cached_books(_fingerprint('f0f0f0f0f0f0f0f0'), owner) is None
+
+
+def test_identical_bytes_hit_for_anyone():
+    owner, stranger = _users()
+    fingerprint = _fingerprint(SHELF_PHASH)
+    books = [{'title': 'Dune', 'author': 'Frank Herbert'}]
+    store_books(fingerprint, books, owner)
+    assert get_cached_books(fingerprint, stranger) == books
+    shelf_cache._memory_tier.clear()
+    assert get_cached_books(fingerprint, stranger) == books
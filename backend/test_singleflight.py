@@ -0,0 +1,175 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+import resilience
+from singleflight import SharedCallFailed, SingleFlight
+
+
+def _run_concurrently(target, count):
+    results = [None] * count
+    errors = [None] * count
+
+    def run(i):
+        try:
+            results[i] = target()
+        except Exception as e:
+            errors[i] = e
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=10)
+    return results, errors
+
+
+def test_concurrent_duplicates_share_one_computation():
+    flights, runs = SingleFlight('test'), []
+
+    def analyze():
+        with flights.lead('shelf') as flight:
+            if not flight.leader:
+                return flight.value
+            runs.append(1)
+            time.sleep(0.2)
+            flight.publish(['Dune'])
+            return flight.value
+
+    results, errors = _run_concurrently(analyze, 5)
+    assert errors == [None] * 5
+    assert results == [['Dune']] * 5
+    assert len(runs) == 1
+
+
+def test_followers_get_the_leaders_exception():
+    flights = SingleFlight('test')
+
+    def analyze():
+        with flights.lead('shelf') as flight:
+            if flight.leader:
+                time.sleep(0.2)
+                raise ValueError('model unavailable')
+            return flight.value
+
+    _, errors = _run_concurrently(analyze, 3)
+    assert all(isinstance(error, ValueError) for error in errors)
+    assert len({id(error) for error in errors}) == 3  # followers raise copies, caused by the leader's
+    leaders = [error for error in errors if error.__cause__ is None]
+    assert len(leaders) == 1
+    assert all(error.__cause__ is leaders[0] for error in errors if error is not leaders[0])
+
+
+def test_followers_wrap_an_exception_that_cannot_be_copied():
+    class ModelError(Exception):
+        def __init__(self, model, message):
+            super().__init__(f"{model}: {message}")
+
+    flights = SingleFlight('test')
+
+    def analyze():
+        with flights.lead('shelf') as flight:
+            if flight.leader:
+                time.sleep(0.2)
+                raise ModelError('vision', 'unavailable')
+            return flight.value
+
+    _, errors = _run_concurrently(analyze, 2)
+    assert sorted(type(error).__name__ for error in errors) == ['ModelError', 'SharedCallFailed']
+    follower = next(error for error in errors if isinstance(error, SharedCallFailed))
+    assert isinstance(follower.__cause__, ModelError)
+
+
+def test_a_follower_out_of_budget_runs_it_itself():
+    flights = SingleFlight('test')
+    entered = threading.Event()
+    roles = []
+
+    def follower():
+        resilience.start_budget(0.1)
+        entered.wait()
+        started = time.monotonic()
+        with flights.lead('shelf') as flight:
+            roles.append((flight.leader, time.monotonic() - started))
+            if flight.leader:
+                flight.publish('computed by the follower')
+
+    thread = threading.Thread(target=follower)
+    thread.start()
+    with flights.lead('shelf') as flight:
+        entered.set()
+        thread.join(timeout=10)
+        flight.publish('computed by the leader')
+    [(leader, waited)] = roles
+    assert leader and waited < 1
+
+
+def test_an_abandoned_flight_is_led_again():
+    flights = SingleFlight('test')
+    entered = threading.Event()
+    results = []
+
+    def follower():
+        entered.wait()
+        with flights.lead('shelf') as flight:
+            if flight.leader:
+                flight.publish('computed by the follower')
+            results.append(flight.value)
+
+    thread = threading.Thread(target=follower)
+    thread.start()
+    with flights.lead('shelf') as flight:
+        assert flight.leader
+        entered.set()
+        time.sleep(0.1)  # leaves without publishing, like a disconnected client
+    thread.join(timeout=10)
+    assert results == ['computed by the follower']
+
+
+def test_coroutines_coalesce_too():
+    flights, runs = SingleFlight('test'), []
+
+    async def analyze():
+        async with flights.alead('shelf') as flight:
+            if flight.leader:
+                runs.append(1)
+                await asyncio.sleep(0.1)
+                flight.publish(['Dune'])
+            return flight.value
+
+    async def main():
+        return await asyncio.gather(*(analyze() for _ in range(4)))
+
+    assert asyncio.run(main()) == [['Dune']] * 4
+    assert len(runs) == 1
+
+
+def test_coroutine_followers_get_a_copy_of_the_leaders_exception():
+    flights = SingleFlight('test')
+
+    async def analyze():
+        async with flights.alead('shelf') as flight:
+            if flight.leader:
+                await asyncio.sleep(0.1)
+                raise resilience.UpstreamUnavailable('model unavailable', retry_after=3)
+            return flight.value
+
+    async def main():
+        return await asyncio.gather(*(analyze() for _ in range(3)), return_exceptions=True)
+
+    errors = asyncio.run(main())
+    assert all(isinstance(error, resilience.UpstreamUnavailable) and error.retry_after == 3 for error in errors)
+    assert len({id(error) for error in errors}) == 3
+
+
+def test_workers_share_results_through_the_lock_directory(tmp_path):
+    pytest.importorskip('fcntl')
+    worker_a, worker_b = SingleFlight('test', str(tmp_path)), SingleFlight('test', str(tmp_path))
+    with worker_a.lead('shelf') as flight:
+        assert flight.leader
+        flight.publish(['Dune'])
+    with worker_b.lead('shelf') as flight:
+        assert not flight.leader and flight.value == ['Dune']
+    with worker_b.lead('another shelf') as flight:
+        assert flight.leader
@@ -0,0 +1,62 @@
+import uuid
+
+import pytest
+
+import database
+from database import UnitOfWorkRolledBack, create_tables, get_or_create_user, get_saved_books, get_session, save_book, unit_of_work
+
+
+@pytest.fixture(scope='module', autouse=True)
+def tables():
+    create_tables()
+
+
+@pytest.fixture
+def user():
+    return get_or_create_user(f"unit-of-work-test-{uuid.uuid4().hex[:8]}")
+
+
+def _titles(user):
+    return sorted(book['title'] for book in get_saved_books(user['id']))
+
+
+def test_helpers_commit_together_on_exit(user):
+    with unit_of_work() as db:
+        save_book(user['id'], 'Dune', 'Frank Herbert')
+        with unit_of_work() as nested:  # joins the outer unit
+            assert nested is db and get_session() is db
+            save_book(user['id'], 'Emma', 'Jane Austen')
+        # The helpers' own commits only flushed: the unit sees its rows, nobody else does yet
+        assert len(get_saved_books(user['id'])) == 2
+        outside = database.SessionLocal()
+        try:
+            assert outside.query(database.SavedBooks).filter_by(user_id=user['id']).count() == 0
+        finally:
+            outside.close()
+    assert _titles(user) == ['Dune', 'Emma']
+
+
+def test_an_exception_discards_the_whole_unit(user):
+    with pytest.raises(RuntimeError):
+        with unit_of_work():
+            save_book(user['id'], 'Dune', 'Frank Herbert')
+            raise RuntimeError('model call failed')
+    assert _titles(user) == []
+
+
+def test_a_helper_rollback_dooms_the_unit(user):
+    with pytest.raises(UnitOfWorkRolledBack):
+        with unit_of_work():
+            save_book(user['id'], 'Dune', 'Frank Herbert')
+            get_session().rollback()  # what a helper does when one of its statements fails
+            save_book(user['id'], 'Emma', 'Jane Austen')
+    assert _titles(user) == []
+
+
+def test_outside_a_unit_every_helper_uses_its_own_session():
+    first, second = get_session(), get_session()
+    try:
+        assert first is not second
+    finally:
+        first.close()
+        second.close()
@@ -0,0 +1,90 @@
+import base64
+import io
+import json
+
+import pytest
+
+from app import app
+from benchmarks.fixtures import shelf_photo
+from uploads import ShelfImage, UploadError, _parse_preferences, read_analyze_upload
+
+
+def test_line_wrapped_base64_is_accepted():
+    photo = shelf_photo(3)
+    image = ShelfImage.from_base64(base64.encodebytes(photo).decode('ascii'))
+    assert image.read_bytes() == photo
+    assert image.to_base64() == base64.b64encode(photo).decode('ascii')
+
+
+def test_data_url_with_whitespace_is_accepted():
+    photo = shelf_photo(3)
+    image = ShelfImage.from_base64('data:image/jpeg;base64,\n ' + base64.b64encode(photo).decode('ascii') + '\r\n')
+    assert image.read_bytes() == photo
+
+
+@pytest.mark.parametrize('image_base64', ['not base64!', 123])
+def test_invalid_base64_is_a_400(image_base64):
+    with pytest.raises(UploadError) as error:
+        ShelfImage.from_base64(image_base64)
+    assert error.value.status_code == 400
+
+
+@pytest.mark.parametrize('raw', [[], ['Fantasy'], 'x', '"x"', '[1, 2]', 3, True])
+def test_preferences_that_are_not_an_object_are_a_400(raw):
+    with pytest.raises(UploadError) as error:
+        _parse_preferences(raw)
+    assert error.value.status_code == 400
+
+
+def test_json_mode_with_list_preferences_is_a_400():
+    response = app.test_client().post('/analyze', headers={'X-Device-ID': 'uploads-test'},
+                                      json={'image': base64.b64encode(shelf_photo(3)).decode('ascii'), 'preferences': []})
+    assert response.status_code == 400
+    assert 'error' in response.get_json()
+
+
+def test_multipart_upload_is_not_copied():
+    photo = shelf_photo(4)
+    with app.test_request_context('/analyze', method='POST', content_type='multipart/form-data',
+                                  data={'image': (io.BytesIO(photo), 'shelf.jpg'),
+                                        'preferences': json.dumps({'genres': ['Fantasy']})}) as context:
+        from flask import request
+        spooled = request.files['image'].stream
+        image, preferences = read_analyze_upload(request)
+        context.request.close()  # teardown closes the request's files; the image must survive it
+    assert image.open() is spooled
+    assert image.read_bytes() == photo
+    assert image.size == len(photo)
+    assert preferences == {'genres': ['Fantasy']}
+    image.close()
+
+
+def _chunked_multipart(photo):
+    boundary = 'shelfboundary'
+    body = (f'--{boundary}\r\nContent-Disposition: form-data; name="preferences"\r\n\r\n{{}}\r\n'
+            f'--{boundary}\r\nContent-Disposition: form-data; name="image"; filename="shelf.jpg"\r\n'
+            f'Content-Type: image/jpeg\r\n\r\n').encode() + photo + f'\r\n--{boundary}--\r\n'.encode()
+    # No Content-Length: the server marks the input terminated (as for chunked bodies) and it is only
+    # bounded while being read
+    return dict(input_stream=io.BytesIO(body), content_type=f'multipart/form-data; boundary={boundary}',
+                headers={'Transfer-Encoding': 'chunked', 'X-Device-ID': 'uploads-test'},
+                environ_overrides={'wsgi.input_terminated': True})
+
+
+def test_chunked_multipart_upload_is_read():
+    photo = shelf_photo(5)
+    with app.test_request_context('/analyze', method='POST', **_chunked_multipart(photo)):
+        from flask import request
+        assert request.content_length is None
+        image, preferences = read_analyze_upload(request)
+    assert image.read_bytes() == photo
+    assert preferences == {}
+    image.close()
+
+
+def test_chunked_upload_over_the_limit_is_a_413(monkeypatch):
+    photo = shelf_photo(6)
+    monkeypatch.setitem(app.config, 'MAX_CONTENT_LENGTH', len(photo) // 2)
+    response = app.test_client().post('/analyze', **_chunked_multipart(photo))
+    assert response.status_code == 413
+    assert 'error' in response.get_json()
@@ -0,0 +1,240 @@
+import asyncio
+import base64
+import binascii
+import hashlib
+import io
+import json
+import os
+import tempfile
+
+from werkzeug.exceptions import RequestEntityTooLarge
+
+# Shelf photos are streamed to a spooled buffer: small ones stay in memory, large ones go to disk
+MAX_UPLOAD_BYTES = int(os.getenv('MAX_UPLOAD_BYTES', 15 * 1024 * 1024))
+UPLOAD_SPOOL_MEMORY_BYTES = int(os.getenv('UPLOAD_SPOOL_MEMORY_BYTES', 1024 * 1024))
+_CHUNK_SIZE = 64 * 1024
+_BASE64_CHUNK_SIZE = 3 * _CHUNK_SIZE  # multiple of 3 so chunks encode without padding
+# Whole request body: a max-size image base64-encoded in JSON, plus room for the other fields
+MAX_REQUEST_BYTES = MAX_UPLOAD_BYTES * 4 // 3 + _CHUNK_SIZE
+
+
+class UploadError(ValueError):
+    def __init__(self, message, status_code=400):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class ShelfImage:
+    """An uploaded shelf photo, read from its buffer on demand and base64-encoded at most once"""
+
+    def __init__(self, stream, size: int, sha256: str, image_base64: str = None):
+        self._stream = stream
+        self.size = size
+        self.sha256 = sha256
+        self._base64 = image_base64
+
+    @classmethod
+    def from_base64(cls, image_base64: str):
+        """Legacy JSON mode - keep the client's base64 so it never needs re-encoding"""
+        if not isinstance(image_base64, str):
+            raise UploadError("Image is not valid base64")
+        if image_base64.startswith('data:'):
+            image_base64 = image_base64.split(',', 1)[1]
+        # Line-wrapped base64 (MIME, base64.encodebytes) is valid input; the data URL sent on needs it unwrapped
+        image_base64 = ''.join(image_base64.split())
+        try:
+            data = base64.b64decode(image_base64, validate=True)
+        except binascii.Error:
+            raise UploadError("Image is not valid base64")
+        if len(data) > MAX_UPLOAD_BYTES:
+            raise UploadError(f"Image exceeds {MAX_UPLOAD_BYTES} bytes", status_code=413)
+        return cls(io.BytesIO(data), len(data), hashlib.sha256(data).hexdigest(), image_base64)
+
+    @classmethod
+    def from_stream(cls, stream, max_bytes: int = None):
+        """Copy a request/file stream into a spooled buffer, hashing as it goes and enforcing max_bytes"""
+        spool = _Spool(max_bytes)
+        try:
+            while True:
+                chunk = stream.read(_CHUNK_SIZE)
+                if not chunk:
+                    break
+                spool.write(chunk)
+        except Exception:
+            spool.discard()
+            raise
+        return spool.image()
+
+    @classmethod
+    def from_file(cls, file, max_bytes: int = None):
+        """Take over a file the web framework has already spooled (multipart uploads): one pass to hash
+        and size it, no second copy"""
+        max_bytes = MAX_UPLOAD_BYTES if max_bytes is None else max_bytes
+        digest = hashlib.sha256()
+        size = 0
+        try:
+            file.seek(0)
+            while True:
+                chunk = file.read(_CHUNK_SIZE)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > max_bytes:
+                    raise UploadError(f"Image exceeds {max_bytes} bytes", status_code=413)
+                digest.update(chunk)
+            if size == 0:
+                raise UploadError("Image upload is empty")
+        except Exception:
+            file.close()
+            raise
+        file.seek(0)
+        return cls(file, size, digest.hexdigest())
+
+    def open(self):
+        """The underlying buffer, rewound to the start"""
+        self._stream.seek(0)
+        return self._stream
+
+    def read_bytes(self) -> bytes:
+        return self.open().read()
+
+    def to_base64(self) -> str:
+        if self._base64 is None:
+            stream = self.open()
+            parts = []
+            while True:
+                chunk = stream.read(_BASE64_CHUNK_SIZE)
+                if not chunk:
+                    break
+                parts.append(base64.b64encode(chunk).decode('ascii'))
+            self._base64 = ''.join(parts)
+        return self._base64
+
+    def close(self):
+        self._stream.close()
+
+
+class _Spool:
+    """Spooled buffer + running sha256 + size limit, fed chunk by chunk (sync or async readers)"""
+
+    def __init__(self, max_bytes: int = None):
+        self.max_bytes = MAX_UPLOAD_BYTES if max_bytes is None else max_bytes
+        self.buffer = tempfile.SpooledTemporaryFile(max_size=UPLOAD_SPOOL_MEMORY_BYTES)
+        self.digest = hashlib.sha256()
+        self.size = 0
+
+    def write(self, chunk: bytes):
+        self.size += len(chunk)
+        if self.size > self.max_bytes:
+            raise UploadError(f"Image exceeds {self.max_bytes} bytes", status_code=413)
+        self.digest.update(chunk)
+        self.buffer.write(chunk)
+
+    def discard(self):
+        self.buffer.close()
+
+    def image(self) -> ShelfImage:
+        if self.size == 0:
+            self.discard()
+            raise UploadError("Image upload is empty")
+        self.buffer.seek(0)
+        return ShelfImage(self.buffer, self.size, self.digest.hexdigest())
+
+
+def _parse_preferences(raw):
+    if raw is None or raw == '':
+        return {}
+    if isinstance(raw, dict):
+        return raw
+    if not isinstance(raw, (str, bytes)):
+        raise UploadError("Preferences must be a JSON object")
+    try:
+        preferences = json.loads(raw)
+    except ValueError:
+        raise UploadError("Preferences must be a JSON object")
+    if not isinstance(preferences, dict):
+        raise UploadError("Preferences must be a JSON object")
+    return preferences
+
+
+def _check_content_length(content_length):
+    if content_length is not None and content_length > MAX_REQUEST_BYTES:
+        raise UploadError(f"Upload exceeds {MAX_UPLOAD_BYTES} bytes", status_code=413)
+
+
+def read_analyze_upload(request):
+    """Extract (ShelfImage, preferences) from an /analyze request in any supported mode:
+
+    - multipart/form-data with an `image` file and a `preferences` JSON field
+    - a raw image body (image/* or application/octet-stream), preferences in the
+      X-Preferences header or `preferences` query parameter
+    - legacy JSON: {"image": "<base64>", "preferences": {...}}
+    """
+    _check_content_length(request.content_length)
+    try:
+        return _read_upload(request)
+    except RequestEntityTooLarge:
+        # A body without Content-Length (chunked) that ran past MAX_CONTENT_LENGTH while being read
+        raise UploadError(f"Upload exceeds {MAX_UPLOAD_BYTES} bytes", status_code=413)
+
+
+def _read_upload(request):
+    mimetype = request.mimetype or ''
+    if mimetype == 'multipart/form-data':
+        upload = request.files.get('image')
+        if upload is None or upload.filename == '':
+            raise UploadError("No image uploaded")
+        preferences = _parse_preferences(request.form.get('preferences'))
+        # Detached from the request, which closes its files at teardown while a background job may still need it
+        stream, upload.stream = upload.stream, io.BytesIO()
+        return ShelfImage.from_file(stream), preferences
+
+    if mimetype.startswith('image/') or mimetype == 'application/octet-stream':
+        raw_preferences = request.headers.get('X-Preferences', request.args.get('preferences'))
+        return ShelfImage.from_stream(request.stream), _parse_preferences(raw_preferences)
+
+    data = request.get_json(silent=True)
+    if not data or not data.get('image'):
+        raise UploadError("Request must include an image")
+    return ShelfImage.from_base64(data['image']), _parse_preferences(data.get('preferences'))
+
+
+async def aread_analyze_upload(request):
+    """read_analyze_upload for a Starlette request (asgi.py): same modes, limits and errors"""
+    content_length = request.headers.get('content-length')
+    _check_content_length(int(content_length) if content_length and content_length.isdigit() else None)
+
+    mimetype = request.headers.get('content-type', '').split(';', 1)[0].strip().lower()
+    if mimetype == 'multipart/form-data':
+        form = await request.form()
+        try:
+            upload = form.get('image')
+            if upload is None or isinstance(upload, str) or not upload.filename:
+                raise UploadError("No image uploaded")
+            preferences = _parse_preferences(form.get('preferences'))
+            # Detached from the form, whose close() below would close it
+            file, upload.file = upload.file, io.BytesIO()
+            return await asyncio.to_thread(ShelfImage.from_file, file), preferences
+        finally:
+            await form.close()
+
+    if mimetype.startswith('image/') or mimetype == 'application/octet-stream':
+        raw_preferences = request.headers.get('X-Preferences', request.query_params.get('preferences'))
+        preferences = _parse_preferences(raw_preferences)
+        spool = _Spool()
+        try:
+            async for chunk in request.stream():
+                if chunk:
+                    spool.write(chunk)
+        except Exception:
+            spool.discard()
+            raise
+        return spool.image(), preferences
+
+    try:
+        data = json.loads(await request.body())
+    except ValueError:
+        data = None
+    if not isinstance(data, dict) or not data.get('image'):
+        raise UploadError("Request must include an image")
+    return ShelfImage.from_base64(data['image']), _parse_preferences(data.get('preferences'))
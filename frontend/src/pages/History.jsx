@@ -1,13 +1,16 @@
 import { useState, useEffect } from 'react'
 import { Link } from 'wouter'
 import { useDevice } from '../contexts/DeviceContext'
-import { getUserHistory } from '../utils/api'
+import { getUserHistory, getHistorySession } from '../utils/api'
 
 function History() {
     const [history, setHistory] = useState([])
     const [loading, setLoading] = useState(true)
     const [error, setError] = useState(null)
     const [expandedSession, setExpandedSession] = useState(null)
+    const [sessionDetails, setSessionDetails] = useState({})
+    const [nextCursor, setNextCursor] = useState(null)
+    const [loadingMore, setLoadingMore] = useState(false)
     const { deviceId, isReady } = useDevice()
 
     useEffect(() => {
@@ -24,6 +27,7 @@ function History() {
             
             const data = await getUserHistory()
             setHistory(data.history || [])
+            setNextCursor(data.next_cursor)
             console.log(`✅ Loaded ${data.total_sessions} analysis sessions`)
             
         } catch (err) {
@@ -34,6 +38,20 @@ function History() {
         }
     }
 
+    const loadMore = async () => {
+        try {
+            setLoadingMore(true)
+            const data = await getUserHistory({ cursor: nextCursor })
+            setHistory(prev => [...prev, ...(data.history || [])])
+            setNextCursor(data.next_cursor)
+        } catch (err) {
+            console.error('❌ Error loading more history:', err)
+            setError(`Failed to load history: ${err.message}`)
+        } finally {
+            setLoadingMore(false)
+        }
+    }
+
     const formatDate = (isoString) => {
         const date = new Date(isoString)
         return date.toLocaleDateString('en-US', {
@@ -45,8 +63,22 @@ function History() {
         })
     }
 
-    const toggleSession = (sessionId) => {
-        setExpandedSession(expandedSession === sessionId ? null : sessionId)
+    const toggleSession = async (sessionId) => {
+        if (expandedSession === sessionId) {
+            setExpandedSession(null)
+            return
+        }
+        setExpandedSession(sessionId)
+        // The list only has counts; fetch the books the first time a session is opened
+        if (!sessionDetails[sessionId]) {
+            try {
+                const details = await getHistorySession(sessionId)
+                setSessionDetails(prev => ({ ...prev, [sessionId]: details }))
+            } catch (err) {
+                console.error('❌ Error loading session:', err)
+                setError(`Failed to load session: ${err.message}`)
+            }
+        }
     }
 
     const getBookMatchColor = (matchScore) => {
@@ -176,13 +208,19 @@ function History() {
                                 </div>
 
                                 {/* Expanded Session Details */}
-                                {expandedSession === session.session_id && (
+                                {expandedSession === session.session_id && !sessionDetails[session.session_id] && (
+                                    <div className="px-6 py-6 border-t border-gray-100 flex items-center text-gray-600 text-sm">
+                                        <div className="animate-spin rounded-full h-5 w-5 border-b-2 border-violet-600 mr-3"></div>
+                                        Loading session...
+                                    </div>
+                                )}
+                                {expandedSession === session.session_id && sessionDetails[session.session_id] && (
                                     <div className="px-6 pb-6 border-t border-gray-100">
                                         {/* Detected Books */}
                                         <div className="mb-6 mt-6">
                                             <h4 className="text-md font-semibold text-gray-900 mb-3">Detected Books</h4>
                                             <div className="grid grid-cols-1 sm:grid-cols-2 lg:grid-cols-3 gap-3">
-                                                {session.detected_books.map((book, index) => (
+                                                {sessionDetails[session.session_id].detected_books.map((book, index) => (
                                                     <div key={index} className="p-3 bg-gray-50 rounded-lg">
                                                         <p className="font-medium text-sm text-gray-900">{book.title}</p>
                                                         <p className="text-xs text-gray-600 mt-1">{book.author}</p>
@@ -195,7 +233,7 @@ function History() {
                                         <div>
                                             <h4 className="text-md font-semibold text-gray-900 mb-3">Recommendations</h4>
                                             <div className="space-y-3">
-                                                {session.recommendations.map((rec, index) => (
+                                                {sessionDetails[session.session_id].recommendations.map((rec, index) => (
                                                     <div key={index} className="p-4 bg-gray-50 rounded-lg">
                                                         <div className="flex justify-between items-start mb-2">
                                                             <div className="flex-1">
@@ -218,6 +256,19 @@ function History() {
                     </div>
                 )}
 
+                {/* Load More Button */}
+                {nextCursor && (
+                    <div className="mt-6 text-center">
+                        <button
+                            onClick={loadMore}
+                            disabled={loadingMore}
+                            className="px-4 py-2 text-violet-600 hover:text-violet-700 font-medium disabled:opacity-50"
+                        >
+                            {loadingMore ? 'Loading...' : 'Load more'}
+                        </button>
+                    </div>
+                )}
+
                 {/* Refresh Button */}
                 {history.length > 0 && (
                     <div className="mt-8 text-center">
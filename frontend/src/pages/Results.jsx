@@ -19,21 +19,38 @@ function Results() {
     
     const savedSet = new Set()
     
-    for (const rec of analysisResults.recommendations) {
-      try {
-        const response = await fetch(`/saved-books/check?title=${encodeURIComponent(rec.title)}&author=${encodeURIComponent(rec.author)}`, {
-          credentials: 'include'
+    // /analyze already flags each recommendation; only older results need a lookup
+    if (analysisResults.recommendations.every(rec => 'is_saved' in rec)) {
+      for (const rec of analysisResults.recommendations) {
+        if (rec.is_saved) {
+          savedSet.add(`${rec.title}-${rec.author}`)
+        }
+      }
+      setSavedBooks(savedSet)
+      return
+    }
+    
+    // One request for every recommendation instead of one per book
+    try {
+      const response = await fetch('/saved-books/check-batch', {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        credentials: 'include',
+        body: JSON.stringify({
+          books: analysisResults.recommendations.map(rec => ({ title: rec.title, author: rec.author }))
         })
-        
-        if (response.ok) {
-          const data = await response.json()
-          if (data.is_saved) {
-            savedSet.add(`${rec.title}-${rec.author}`)
+      })
+      
+      if (response.ok) {
+        const data = await response.json()
+        for (const result of data.results) {
+          if (result.is_saved) {
+            savedSet.add(`${result.title}-${result.author}`)
           }
         }
-      } catch (error) {
-        console.error('Error checking saved status:', error)
       }
+    } catch (error) {
+      console.error('Error checking saved status:', error)
     }
     
     setSavedBooks(savedSet)
@@ -2,7 +2,7 @@ import { Link, useLocation } from 'wouter'
 import { useState } from 'react'
 import { useApp } from '../contexts/AppContext'
 import { useDevice } from '../contexts/DeviceContext'
-import { analyzeBookshelf, fileToBase64, validateImageFile } from '../utils/api'
+import { analyzeBookshelfStream, validateImageFile } from '../utils/api'
 
 function Upload() {
   const [selectedFile, setSelectedFile] = useState(null)
@@ -84,17 +84,29 @@ function Upload() {
     try {
       console.log('🔄 Starting image analysis with device ID:', deviceId?.substring(0, 8) + '...')
       
-      // Convert file to base64 using utility function
-      const base64Image = await fileToBase64(selectedFile)
-
       const preferences = userPreferences
       console.log('📊 Using preferences:', preferences)
       
-      // Use new API utility with device ID integration
-      const result = await analyzeBookshelf(base64Image, preferences)
+      // Upload the raw file (multipart) and show recommendations as they stream in
+      let showingResults = false
+      const result = await analyzeBookshelfStream(selectedFile, preferences, {
+        onDetectedBooks: ({ detected_books, image_stats }) => {
+          updateAnalysisResults({ detected_books, image_stats, recommendations: [] })
+        },
+        onRecommendation: (recommendation) => {
+          updateAnalysisResults(prev => ({
+            ...prev,
+            recommendations: [...(prev?.recommendations || []), recommendation]
+          }))
+          if (!showingResults) {
+            showingResults = true
+            navigate('/results')
+          }
+        }
+      })
       
       console.log('✅ Analysis result:', result)
-      updateAnalysisResults(result)
+      updateAnalysisResults(prev => ({ ...prev, user_id: result.user_id, session_id: result.session_id }))
       navigate('/results')
 
     } catch (error) {
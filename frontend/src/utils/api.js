@@ -77,6 +77,85 @@ export async function analyzeBookshelf(imageBase64, preferences) {
     });
 }
 
+/**
+ * Analyze bookshelf image, uploading the raw file as multipart form data
+ * (avoids the ~33% base64 overhead of analyzeBookshelf)
+ * @param {File} file - Image file
+ * @param {Object} preferences - User preferences
+ * @returns {Promise<Object>} Analysis results
+ */
+export async function analyzeBookshelfFile(file, preferences) {
+    const formData = new FormData();
+    formData.append('image', file);
+    formData.append('preferences', JSON.stringify(preferences));
+
+    return apiRequest('/analyze', {
+        method: 'POST',
+        // Don't set Content-Type for FormData - let browser set it
+        body: formData
+    });
+}
+
+/**
+ * Analyze bookshelf image with streamed results (server-sent events read over fetch,
+ * since EventSource can't POST a file). Recommendations arrive one at a time.
+ * @param {File} file - Image file
+ * @param {Object} preferences - User preferences
+ * @param {Object} handlers - { onDetectedBooks({ detected_books, image_stats }), onRecommendation(recommendation) }
+ * @returns {Promise<Object>} Final event: session_id, recommendations_count, timings
+ */
+export async function analyzeBookshelfStream(file, preferences, handlers = {}) {
+    const formData = new FormData();
+    formData.append('image', file);
+    formData.append('preferences', JSON.stringify(preferences));
+
+    console.log('🌐 API Request: POST /analyze/stream');
+    const response = await fetch(`${API_BASE_URL}/analyze/stream`, {
+        method: 'POST',
+        credentials: 'include',
+        headers: { 'X-Device-ID': getOrCreateDeviceId() },
+        body: formData
+    });
+    if (!response.ok) {
+        throw new Error(`HTTP ${response.status}: ${response.statusText}`);
+    }
+
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    while (true) {
+        const { value, done } = await reader.read();
+        if (done) {
+            break;
+        }
+        buffer += decoder.decode(value, { stream: true });
+
+        let boundary;
+        while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+            const message = buffer.slice(0, boundary);
+            buffer = buffer.slice(boundary + 2);
+            const event = message.match(/^event: (.*)$/m)?.[1];
+            const data = message.match(/^data: (.*)$/m)?.[1];
+            if (!event || !data) {
+                continue;  // keep-alive comment
+            }
+
+            const payload = JSON.parse(data);
+            if (event === 'detected_books') {
+                handlers.onDetectedBooks?.(payload);
+            } else if (event === 'recommendation') {
+                handlers.onRecommendation?.(payload.recommendation);
+            } else if (event === 'error') {
+                throw new Error(payload.error);
+            } else if (event === 'done') {
+                console.log('✅ API Response: /analyze/stream', payload);
+                return payload;
+            }
+        }
+    }
+    throw new Error('Analysis stream ended unexpectedly');
+}
+
 /**
  * Process Goodreads CSV file
  * @param {File} file - Goodreads CSV file
@@ -99,11 +178,26 @@ export async function processGoodreadsCSV(file) {
 }
 
 /**
- * Get user's analysis history
- * @returns {Promise<Object>} Analysis history
+ * Get one page of the user's analysis history
+ * The browser revalidates pages with If-None-Match, so unchanged pages come back as 304s
+ * @param {Object} options - { cursor: next_cursor of the previous page, view: 'summary' | 'full' }
+ * @returns {Promise<Object>} Analysis history page with next_cursor
+ */
+export async function getUserHistory({ cursor, view = 'summary' } = {}) {
+    const params = new URLSearchParams({ view });
+    if (cursor) {
+        params.set('cursor', cursor);
+    }
+    return apiRequest(`/history?${params}`);
+}
+
+/**
+ * Get the detected books and recommendations of one analysis session
+ * @param {string} sessionId - Session ID from the history list
+ * @returns {Promise<Object>} Full analysis session
  */
-export async function getUserHistory() {
-    return apiRequest('/history');
+export async function getHistorySession(sessionId) {
+    return apiRequest(`/history/${sessionId}`);
 }
 
 /**